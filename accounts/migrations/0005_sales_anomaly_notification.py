@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_alter_wallet_balance_wallettopup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='notification',
+            name='notification_type',
+            field=models.CharField(choices=[('order_placed', 'New Order Placed'), ('order_preparing', 'Order Being Prepared'), ('order_ready', 'Order Ready for Pickup'), ('order_completed', 'Order Completed'), ('order_cancelled', 'Order Cancelled'), ('feedback_received', 'Feedback Received'), ('time_extended', 'Pickup Time Extended'), ('sales_anomaly', 'Unusual Sales Activity')], max_length=30),
+        ),
+    ]
@@ -110,6 +110,7 @@ class Notification(models.Model):
     NOTIFICATION_ORDER_CANCELLED = "order_cancelled"
     NOTIFICATION_FEEDBACK_RECEIVED = "feedback_received"
     NOTIFICATION_TIME_EXTENDED = "time_extended"
+    NOTIFICATION_SALES_ANOMALY = "sales_anomaly"
 
     NOTIFICATION_TYPES = [
         (NOTIFICATION_ORDER_PLACED, "New Order Placed"),
@@ -119,6 +120,7 @@ class Notification(models.Model):
         (NOTIFICATION_ORDER_CANCELLED, "Order Cancelled"),
         (NOTIFICATION_FEEDBACK_RECEIVED, "Feedback Received"),
         (NOTIFICATION_TIME_EXTENDED, "Pickup Time Extended"),
+        (NOTIFICATION_SALES_ANOMALY, "Unusual Sales Activity"),
     ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='notifications')
@@ -0,0 +1,32 @@
+"""
+Version stamps kept in the cache.
+
+A stamp namespaces cached entries derived from some data (e.g. a shop's
+menu): bumping it makes every entry keyed by the old stamp unreachable, and
+those entries simply expire. A bump only reaches the processes sharing the
+cache backend, so stamps are given a timeout: with a per-process cache, a
+change made in another process is picked up once the local stamp expires
+and is seeded afresh.
+"""
+
+import time
+
+from django.core.cache import cache
+
+
+def get_version(key, timeout):
+    """Current stamp stored under key, initialised lazily and kept for timeout seconds"""
+    version = cache.get(key)
+    if version is None:
+        # Seed with a timestamp so an expired stamp never reuses an old version
+        cache.add(key, time.time_ns(), timeout)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(key, timeout):
+    """Move the stamp stored under key on to a new version"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), timeout)
@@ -68,6 +68,7 @@ TEMPLATES = [
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "accounts.context_processors.notification_count",
+                "orders.context_processors.cart_summary",
             ],
         },
     }
@@ -90,6 +91,56 @@ DATABASES = {
     }
 }
 
+# Cache Configuration (per-process memory by default; a file-based cache is
+# shared by every worker, e.g. set DJANGO_CACHE_DIR or rely on /tmp on Vercel)
+cache_dir = os.getenv("DJANGO_CACHE_DIR") or ("/tmp/foodr-cache" if IS_VERCEL else "")
+
+if cache_dir:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": cache_dir,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "foodr-default",
+        }
+    }
+
+# Seconds a computed analytics panel is reused across requests (0 disables)
+ANALYTICS_CACHE_TIMEOUT = int(os.getenv("ANALYTICS_CACHE_TIMEOUT", "300"))
+
+# Analytics engine: "rollups" (pre-aggregated tables) or "numpy" (vectorized over raw orders)
+ANALYTICS_BACKEND = os.getenv("ANALYTICS_BACKEND", "rollups")
+
+# Compute dashboard panels concurrently on a bounded thread pool; a panel still
+# running the timeout (seconds) after it started is shown as unavailable instead
+# of failing the page
+ANALYTICS_PARALLEL_PANELS = os.getenv("ANALYTICS_PARALLEL_PANELS", "0") == "1"
+ANALYTICS_PANEL_WORKERS = int(os.getenv("ANALYTICS_PANEL_WORKERS", "4"))
+ANALYTICS_PANEL_TIMEOUT = float(os.getenv("ANALYTICS_PANEL_TIMEOUT", "10"))
+
+# Ranges the rollups estimate at more orders than this are answered from a sample
+# of about ANALYTICS_SAMPLE_ROWS orders, with confidence intervals
+ANALYTICS_APPROXIMATE_ROWS = int(os.getenv("ANALYTICS_APPROXIMATE_ROWS", "200000"))
+ANALYTICS_SAMPLE_ROWS = int(os.getenv("ANALYTICS_SAMPLE_ROWS", "20000"))
+
+# The unfiltered dashboard is served from the precompute_analytics snapshot while
+# it is younger than this many seconds (a nightly run plus slack) and no order
+# has changed since; worker processes default to the CPU count
+ANALYTICS_SNAPSHOT_MAX_AGE = int(os.getenv("ANALYTICS_SNAPSHOT_MAX_AGE", str(26 * 60 * 60)))
+ANALYTICS_PRECOMPUTE_WORKERS = int(os.getenv("ANALYTICS_PRECOMPUTE_WORKERS", "0")) or None
+
+# Seconds a process trusts its menu version stamp; with a per-process cache, a
+# menu edit made in another process reaches memoized cart summaries this late
+MENU_VERSION_TIMEOUT = int(os.getenv("MENU_VERSION_TIMEOUT", "60"))
+
+# Seconds the pickup-slot picker reuses a day's reservation counts
+PICKUP_SLOTS_CACHE_TIMEOUT = int(os.getenv("PICKUP_SLOTS_CACHE_TIMEOUT", "30"))
+
 LANGUAGE_CODE = "en-us"
 TIME_ZONE = "Asia/Kolkata"
 USE_I18N = True
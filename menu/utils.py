@@ -0,0 +1,21 @@
+from django.conf import settings
+
+from foodR.cache_versions import bump_version, get_version
+
+
+def _menu_version_key(shop_id):
+    return f"menu:version:{shop_id}"
+
+
+def get_menu_version_timeout():
+    return getattr(settings, "MENU_VERSION_TIMEOUT", 60)
+
+
+def get_menu_version(shop_id):
+    """Current menu version stamp of a shop"""
+    return get_version(_menu_version_key(shop_id), get_menu_version_timeout())
+
+
+def bump_menu_version(shop_id):
+    """Mark every memoized cart summary of the shop's menu as stale"""
+    bump_version(_menu_version_key(shop_id), get_menu_version_timeout())
@@ -1,7 +1,9 @@
 from django.shortcuts import get_object_or_404, redirect
 from accounts.decorators import shop_owner_required
+from shops.analytics_cache import bump_data_version_on_commit
 
 from .models import MenuItem
+from .utils import bump_menu_version
 
 
 @shop_owner_required
@@ -9,4 +11,6 @@ def toggle_availability(request, item_id):
     item = get_object_or_404(MenuItem, id=item_id, shop__owner=request.user)
     item.is_available = not item.is_available
     item.save(update_fields=["is_available"])
+    bump_menu_version(item.shop_id)
+    bump_data_version_on_commit(item.shop_id)
     return redirect("shops:owner_dashboard")
@@ -1,24 +1,110 @@
 from django.contrib import admin
+from django.db import transaction
+
+from payments.models import Payment
+from shops.analytics_cache import bump_data_version_on_commit
+from shops.recommendations import forget_order_items, record_order_items
+from shops.rollups import (
+    record_feedback,
+    record_feedback_removed,
+    record_order_placed,
+    record_order_removed,
+    record_status_change,
+)
 
 from .models import Order, OrderItem, Feedback
+from .services import release_slot, reserve_slot
 
 
 class OrderItemInline(admin.TabularInline):
+    """
+    Items are entered with a new order and read-only afterwards, as the rollups
+    count them; they have no admin of their own so they are only deleted with
+    their order.
+    """
     model = OrderItem
     extra = 0
 
+    def has_change_permission(self, request, obj=None):
+        return obj is None and super().has_change_permission(request, obj)
+
+    def has_delete_permission(self, request, obj=None):
+        return obj is None and super().has_delete_permission(request, obj)
+
+    def has_add_permission(self, request, obj=None):
+        return obj is None and super().has_add_permission(request, obj)
+
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
-    list_display = ("id", "shop", "user", "pickup_time", "status", "total_price", "token_number")
+    list_display = ("id", "shop", "user", "pickup_time", "status", "total_price", "token_date", "token_number")
     list_filter = ("status", "shop")
     search_fields = ("user__username", "shop__name")
     inlines = [OrderItemInline]
+    # Tokens come from TokenCounter; the rest is counted in the rollups when the order is placed
+    readonly_fields = ("token_date", "token_number")
+
+    def get_readonly_fields(self, request, obj=None):
+        if obj is None:
+            return self.readonly_fields
+        return self.readonly_fields + ("shop", "user", "total_price")
+
+    def save_model(self, request, obj, form, change):
+        """
+        Keep the slot counters, rollups and analytics version in step with the
+        edit, as update_status does; the stored row is locked so a concurrent
+        status change is not counted twice.
+        """
+        with transaction.atomic():
+            if not change:
+                super().save_model(request, obj, form, change)
+                if obj.status != Order.STATUS_CANCELLED:
+                    reserve_slot(obj.shop, obj.pickup_time, enforce_capacity=False)
+                return
+            old = Order.objects.select_for_update().get(pk=obj.pk)
+            super().save_model(request, obj, form, change)
+            held_place = old.status != Order.STATUS_CANCELLED
+            holds_place = obj.status != Order.STATUS_CANCELLED
+            if (held_place, old.pickup_time) != (holds_place, obj.pickup_time):
+                if held_place:
+                    release_slot(obj.shop_id, old.pickup_time)
+                if holds_place:
+                    reserve_slot(obj.shop, obj.pickup_time, enforce_capacity=False)
+            record_status_change(obj, old.status)
+            if obj.pickup_time != old.pickup_time:
+                bump_data_version_on_commit(obj.shop_id)
 
+    def delete_model(self, request, obj):
+        """
+        Give back the order's pickup-slot place unless it was cancelled already,
+        and take it, its payment and its feedback out of the rollups.
+        """
+        with transaction.atomic():
+            self._forget_orders(Order.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
 
-@admin.register(OrderItem)
-class OrderItemAdmin(admin.ModelAdmin):
-    list_display = ("order", "menu_item", "quantity", "price")
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            self._forget_orders(queryset)
+            super().delete_queryset(request, queryset)
+
+    def _forget_orders(self, orders):
+        # Locked so a concurrent status change cannot be counted after it is read
+        for order in orders.select_for_update().prefetch_related("items"):
+            if order.status != Order.STATUS_CANCELLED:
+                release_slot(order.shop_id, order.pickup_time)
+            record_order_removed(order, Payment.objects.filter(order=order).first())
+            forget_order_items(order, [item.menu_item_id for item in order.items.all()])
+            feedback = Feedback.objects.filter(order=order).first()
+            if feedback is not None:
+                record_feedback_removed(feedback)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if not change:
+            # Counted once its items are saved, like an order placed at checkout
+            record_order_placed(form.instance)
+            record_order_items(form.instance, form.instance.items.values_list("menu_item_id", flat=True))
 
 
 @admin.register(Feedback)
@@ -27,3 +113,25 @@ class FeedbackAdmin(admin.ModelAdmin):
     list_filter = ("rating", "shop", "created_at")
     search_fields = ("user__username", "shop__name", "comment")
     readonly_fields = ("created_at",)
+
+    def save_model(self, request, obj, form, change):
+        """Recount the rating in the rollups, as the feedback form does"""
+        with transaction.atomic():
+            if change:
+                record_feedback_removed(Feedback.objects.select_for_update().get(pk=obj.pk))
+            super().save_model(request, obj, form, change)
+            record_feedback(obj)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            self._forget_feedback(Feedback.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            self._forget_feedback(queryset)
+            super().delete_queryset(request, queryset)
+
+    def _forget_feedback(self, feedbacks):
+        for feedback in feedbacks.select_for_update():
+            record_feedback_removed(feedback)
@@ -0,0 +1,87 @@
+"""
+Session cart and its memoized summary.
+
+The cart lives in the session as {menu item id: quantity}. Its lines are
+loaded with one query, and the item count and total are kept in the session
+next to the shop's menu version stamp, so the navbar badge is served from the
+session on every page and only recomputed after the cart or the menu changes.
+"""
+
+from decimal import Decimal
+
+from menu.models import MenuItem
+from menu.utils import get_menu_version
+
+
+CART_SESSION_KEY = "cart_items"
+CART_SHOP_KEY = "cart_shop_id"
+CART_SUMMARY_KEY = "cart_summary"
+
+
+def get_cart(session):
+    return session.get(CART_SESSION_KEY, {})
+
+
+def save_cart(session, cart, shop_id):
+    session[CART_SESSION_KEY] = cart
+    session[CART_SHOP_KEY] = shop_id
+    session.pop(CART_SUMMARY_KEY, None)
+    session.modified = True
+
+
+def clear_cart(session):
+    session.pop(CART_SESSION_KEY, None)
+    session.pop(CART_SHOP_KEY, None)
+    session.pop(CART_SUMMARY_KEY, None)
+
+
+def _quantities(cart):
+    quantities = {}
+    for item_id, quantity in cart.items():
+        try:
+            quantities[int(item_id)] = int(quantity)
+        except (TypeError, ValueError):
+            continue
+    return quantities
+
+
+def load_cart(session):
+    """The cart's lines with their totals and the cart total, from one query"""
+    quantities = _quantities(get_cart(session))
+    menu_items = MenuItem.objects.in_bulk(quantities)
+    lines = []
+    total = Decimal("0.00")
+    for item_id, quantity in quantities.items():
+        menu_item = menu_items.get(item_id)
+        if menu_item is None:
+            continue
+        line_total = menu_item.price * quantity
+        total += line_total
+        lines.append({"item": menu_item, "quantity": quantity, "line_total": line_total})
+    return lines, total
+
+
+def remember_summary(session, lines, total):
+    """Store the summary of freshly loaded lines, stamped with the shop's menu version"""
+    shop_id = session.get(CART_SHOP_KEY)
+    summary = {
+        "count": sum(line["quantity"] for line in lines),
+        "total": str(total),
+        "menu_version": get_menu_version(shop_id),
+    }
+    session[CART_SUMMARY_KEY] = summary
+    return summary
+
+
+def get_cart_summary(session):
+    """
+    {"count", "total"} of the cart, or None when it is empty. Served from the
+    session while the shop's menu version is unchanged; otherwise the cart is
+    reloaded with one query.
+    """
+    if not get_cart(session):
+        return None
+    summary = session.get(CART_SUMMARY_KEY)
+    if summary is None or summary["menu_version"] != get_menu_version(session.get(CART_SHOP_KEY)):
+        summary = remember_summary(session, *load_cart(session))
+    return summary
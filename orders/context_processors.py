@@ -0,0 +1,9 @@
+from .cart import get_cart_summary
+
+
+def cart_summary(request):
+    """
+    Context processor to make the cart's item count and total available in all
+    templates, read from the session's memoized summary.
+    """
+    return {"cart_summary": get_cart_summary(request.session)}
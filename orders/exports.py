@@ -0,0 +1,123 @@
+"""
+Order history export (CSV and JSON Lines).
+
+Orders are read with a chunked iterator() and their items prefetched one chunk
+at a time, and every row is serialized as soon as it is read, so an export of
+any size runs in constant memory. Used by the owner download view and the
+export_orders management command.
+"""
+
+import csv
+import json
+
+from django.core.exceptions import ObjectDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+from django.utils import timezone
+
+from .models import Order, OrderItem
+
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_CHUNK_SIZE = 500
+
+CSV_COLUMNS = [
+    "order_id",
+    "token_number",
+    "shop",
+    "customer",
+    "created_at",
+    "pickup_time",
+    "status",
+    "total_price",
+    "payment_method",
+    "payment_status",
+    "items",
+    "feedback_rating",
+    "feedback_comment",
+]
+
+# Spreadsheets evaluate a cell starting with one of these as a formula
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+def export_queryset(shop=None, start_date=None, end_date=None):
+    """Orders to export, oldest first; dates are inclusive local dates"""
+    orders = Order.objects.select_related("shop", "user", "payment", "feedback").prefetch_related(
+        Prefetch("items", queryset=OrderItem.objects.select_related("menu_item").order_by("id"))
+    )
+    if shop is not None:
+        orders = orders.filter(shop=shop)
+    if start_date is not None:
+        orders = orders.filter(created_at__date__gte=start_date)
+    if end_date is not None:
+        orders = orders.filter(created_at__date__lte=end_date)
+    return orders.order_by("id")
+
+
+def _related_or_none(order, name):
+    try:
+        return getattr(order, name)
+    except ObjectDoesNotExist:
+        return None
+
+
+def iter_order_records(orders, chunk_size=EXPORT_CHUNK_SIZE):
+    """One plain dict per order, including its items, payment and feedback"""
+    for order in orders.iterator(chunk_size=chunk_size):
+        payment = _related_or_none(order, "payment")
+        feedback = _related_or_none(order, "feedback")
+        yield {
+            "order_id": order.id,
+            "token_number": order.token_number,
+            "shop": order.shop.name,
+            "customer": order.user.get_username(),
+            "created_at": timezone.localtime(order.created_at).isoformat(),
+            "pickup_time": timezone.localtime(order.pickup_time).isoformat(),
+            "status": order.status,
+            "total_price": order.total_price,
+            "payment_method": payment.payment_method if payment else None,
+            "payment_status": payment.payment_status if payment else None,
+            "items": [
+                {"name": item.menu_item.name, "quantity": item.quantity, "price": item.price}
+                for item in order.items.all()
+            ],
+            "feedback_rating": feedback.rating if feedback else None,
+            "feedback_comment": feedback.comment if feedback else None,
+        }
+
+
+class _Echo:
+    """File-like object whose write() hands the row back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def csv_safe(value):
+    """Cell value with user text that a spreadsheet would run as a formula quoted by a leading '"""
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def iter_csv(records):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(CSV_COLUMNS)
+    for record in records:
+        record = dict(
+            record,
+            items="; ".join(f"{item['name']} x{item['quantity']} @ {item['price']}" for item in record["items"]),
+        )
+        yield writer.writerow(["" if record[column] is None else csv_safe(record[column]) for column in CSV_COLUMNS])
+
+
+def iter_jsonl(records):
+    for record in records:
+        yield json.dumps(record, cls=DjangoJSONEncoder) + "\n"
+
+
+def iter_export(fmt, orders, chunk_size=EXPORT_CHUNK_SIZE):
+    """Serialized export lines for the given format"""
+    records = iter_order_records(orders, chunk_size=chunk_size)
+    return iter_csv(records) if fmt == "csv" else iter_jsonl(records)
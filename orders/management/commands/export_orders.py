@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.exports import EXPORT_FORMATS, export_queryset, iter_export
+from shops.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Export orders with their items, payment and feedback as CSV or JSON Lines, in constant memory."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shop", type=int, dest="shop_id", help="Only export the given shop id. Defaults to every shop.")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Output format (default csv).")
+        parser.add_argument("--start", type=date.fromisoformat, help="First local order date to include (YYYY-MM-DD).")
+        parser.add_argument("--end", type=date.fromisoformat, help="Last local order date to include (YYYY-MM-DD).")
+        parser.add_argument("--output", help="File to write to. Defaults to stdout.")
+        parser.add_argument("--chunk-size", type=int, default=500, help="Orders fetched per query (default 500).")
+
+    def handle(self, *args, **options):
+        shop = None
+        if options["shop_id"]:
+            shop = Shop.objects.filter(id=options["shop_id"]).first()
+            if shop is None:
+                raise CommandError(f"Shop {options['shop_id']} does not exist.")
+
+        orders = export_queryset(shop=shop, start_date=options["start"], end_date=options["end"])
+        lines = iter_export(options["format"], orders, chunk_size=options["chunk_size"])
+
+        if options["output"]:
+            with open(options["output"], "w", newline="", encoding="utf-8") as handle:
+                handle.writelines(lines)
+            self.stderr.write(self.style.SUCCESS(f"Orders exported to {options['output']}."))
+        else:
+            for line in lines:
+                self.stdout.write(line, ending="")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from orders.services import rebuild_slot_reservations
+
+
+class Command(BaseCommand):
+    help = "Recount the pickup-slot reservation counters from the non-cancelled orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            type=int,
+            action="append",
+            dest="shop_ids",
+            help="Only rebuild the given shop id (can be repeated). Defaults to every shop.",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_slot_reservations(shop_ids=options["shop_ids"])
+        self.stdout.write(f"SlotReservation: {written} rows")
+        self.stdout.write(self.style.SUCCESS("Slot reservations rebuilt."))
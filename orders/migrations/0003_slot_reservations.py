@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_existing_reservations(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    SlotReservation = apps.get_model("orders", "SlotReservation")
+    slots = (
+        Order.objects.exclude(status="cancelled")
+        .values("shop_id", "pickup_time")
+        .annotate(orders=Count("id"))
+        .order_by()
+    )
+    SlotReservation.objects.bulk_create(
+        [
+            SlotReservation(shop_id=slot["shop_id"], slot_start=slot["pickup_time"], reserved=slot["orders"])
+            for slot in slots.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0002_feedback'),
+        ('shops', '0009_analytics_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SlotReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_start', models.DateTimeField()),
+                ('reserved', models.PositiveIntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_reservations', to='shops.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'slot_start'), name='unique_slot_reservation')],
+            },
+        ),
+        migrations.RunPython(count_existing_reservations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+
+def backfill_token_days(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    TokenCounter = apps.get_model("orders", "TokenCounter")
+    Order.objects.update(token_date=TruncDate("created_at", tzinfo=timezone.get_current_timezone()))
+    # Continue each day's numbering after the tokens already handed out
+    days = (
+        Order.objects.exclude(token_number=None)
+        .values("shop_id", "token_date")
+        .annotate(last_token=Max("token_number"))
+        .order_by()
+    )
+    TokenCounter.objects.bulk_create(
+        [
+            TokenCounter(shop_id=day["shop_id"], date=day["token_date"], last_token=day["last_token"])
+            for day in days.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_slot_reservations'),
+        ('shops', '0009_analytics_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('last_token', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RemoveConstraint(
+            model_name='order',
+            name='unique_token_per_shop',
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='token_date',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('shop', 'token_date', 'token_number'), name='unique_token_per_shop_day'),
+        ),
+        migrations.AddField(
+            model_name='tokencounter',
+            name='shop',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_counters', to='shops.shop'),
+        ),
+        migrations.AddConstraint(
+            model_name='tokencounter',
+            constraint=models.UniqueConstraint(fields=('shop', 'date'), name='unique_token_counter_per_day'),
+        ),
+        migrations.RunPython(backfill_token_days, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:08
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Mod
+
+
+def fill_customer_buckets(apps, schema_editor):
+    Order = apps.get_model("orders", "Order")
+    Order.objects.update(customer_bucket=Mod("user_id", 1024))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_daily_tokens'),
+        ('shops', '0009_analytics_snapshots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='customer_bucket',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(fill_customer_buckets, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['shop', 'customer_bucket', 'created_at'], name='order_customer_sample_idx'),
+        ),
+    ]
@@ -1,13 +1,48 @@
-import random
-
 from django.conf import settings
 from django.db import IntegrityError, models, transaction
-from django.db.models import Max, Q
+from django.db.models import F, Q
+from django.utils import timezone
 
 from shops.models import Shop
 from menu.models import MenuItem
 
 
+CUSTOMER_BUCKETS = 1024
+
+
+class TokenCounter(models.Model):
+    """Last pickup token handed out by a shop on one day; tokens restart from 1 every day."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="token_counters")
+    date = models.DateField()
+    last_token = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "date"], name="unique_token_counter_per_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.date} - #{self.last_token}"
+
+    @classmethod
+    def next_token(cls, shop_id, date):
+        """
+        Claim the shop's next token for the day. The increment is a single
+        UPDATE, which holds the counter's row lock until the surrounding
+        transaction ends, so concurrent orders never get the same token.
+        """
+        counters = cls.objects.filter(shop_id=shop_id, date=date)
+        if not counters.update(last_token=F("last_token") + 1):
+            try:
+                with transaction.atomic():
+                    cls.objects.create(shop_id=shop_id, date=date, last_token=1)
+                return 1
+            except IntegrityError:
+                # Another order opened the day's counter first
+                counters.update(last_token=F("last_token") + 1)
+        return counters.values_list("last_token", flat=True).get()
+
+
 class Order(models.Model):
     STATUS_PENDING = "pending"
     STATUS_PREPARING = "preparing"
@@ -29,13 +64,16 @@ class Order(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     token_number = models.PositiveIntegerField(blank=True, null=True)
+    token_date = models.DateField(blank=True, null=True)
+    # Stable per-customer sampling bucket; see shops.approximate
+    customer_bucket = models.PositiveSmallIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(
-                fields=["shop", "token_number"],
-                name="unique_token_per_shop",
+                fields=["shop", "token_date", "token_number"],
+                name="unique_token_per_shop_day",
             ),
             models.UniqueConstraint(
                 fields=["user", "shop"],
@@ -43,25 +81,43 @@ class Order(models.Model):
                 name="unique_pending_order_per_shop",
             ),
         ]
+        indexes = [
+            models.Index(fields=["shop", "customer_bucket", "created_at"], name="order_customer_sample_idx"),
+        ]
 
     def save(self, *args, **kwargs):
+        self.customer_bucket = self.user_id % CUSTOMER_BUCKETS
         if self.token_number is None:
-            for _ in range(10):
-                try:
-                    with transaction.atomic():
-                        # Generate random 4-digit number (1000-9999)
-                        self.token_number = random.randint(1000, 9999)
-                        super().save(*args, **kwargs)
-                    return
-                except IntegrityError:
-                    self.token_number = None
-            raise IntegrityError("Unable to allocate token number for this shop.")
+            try:
+                with transaction.atomic():
+                    self.token_date = timezone.localdate()
+                    self.token_number = TokenCounter.next_token(self.shop_id, self.token_date)
+                    super().save(*args, **kwargs)
+            except IntegrityError:
+                self.token_number = self.token_date = None
+                raise
+            return
         super().save(*args, **kwargs)
 
     def __str__(self):
         return f"Order {self.id} - {self.shop.name}"
 
 
+class SlotReservation(models.Model):
+    """Places taken in one pickup slot of a shop by its non-cancelled orders."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="slot_reservations")
+    slot_start = models.DateTimeField()
+    reserved = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "slot_start"], name="unique_slot_reservation"),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.slot_start} - {self.reserved} reserved"
+
+
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
     menu_item = models.ForeignKey(MenuItem, on_delete=models.PROTECT)
@@ -1,7 +1,31 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
 from django.utils import timezone
 
-from .models import Order
+from accounts.models import Notification
+from accounts.utils import create_notification
+from menu.models import MenuItem
+from payments.models import Payment
+from shops.recommendations import record_order_items
+from shops.rollups import record_order_placed
+
+from .models import Order, OrderItem, SlotReservation
+
+
+SLOT_MINUTES = 15
+MIN_LEAD_MINUTES = 15
+
+
+class SlotFullError(Exception):
+    """The pickup slot has no places left"""
+
+
+class UnavailableItemsError(Exception):
+    """Some cart items are no longer sold by the shop"""
 
 
 def round_to_quarter_hour(dt):
@@ -17,11 +41,88 @@ def is_within_shop_hours(shop, pickup_dt):
 
 
 def is_slot_available(shop, pickup_dt):
-    slot_count = Order.objects.filter(
-        shop=shop,
-        pickup_time=pickup_dt,
-    ).exclude(status=Order.STATUS_CANCELLED).count()
-    return slot_count < shop.max_orders_per_slot
+    reserved = (
+        SlotReservation.objects.filter(shop=shop, slot_start=pickup_dt)
+        .values_list("reserved", flat=True)
+        .first()
+    )
+    return (reserved or 0) < shop.max_orders_per_slot
+
+
+def _slots_cache_key(shop_id, day):
+    return f"orders:slots:{shop_id}:{day:%Y%m%d}"
+
+
+def _forget_slots_on_commit(shop_id, pickup_dt):
+    """Drop the cached counters of the slot's day once the change is committed"""
+    key = _slots_cache_key(shop_id, timezone.localdate(pickup_dt))
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def reserve_slot(shop, pickup_dt, enforce_capacity=True):
+    """
+    Claim one place in the shop's pickup slot. The capacity check and the claim
+    are a single conditional UPDATE, so concurrent checkouts cannot overbook a
+    slot; raises SlotFullError when no place is left.
+    """
+    slots = SlotReservation.objects.filter(shop=shop, slot_start=pickup_dt)
+    if enforce_capacity:
+        slots = slots.filter(reserved__lt=shop.max_orders_per_slot)
+    if not slots.update(reserved=F("reserved") + 1):
+        if enforce_capacity and shop.max_orders_per_slot < 1:
+            raise SlotFullError
+        try:
+            with transaction.atomic():
+                SlotReservation.objects.create(shop=shop, slot_start=pickup_dt, reserved=1)
+        except IntegrityError:
+            # The slot row exists already: it is full, or another checkout created it first
+            if not slots.update(reserved=F("reserved") + 1):
+                raise SlotFullError
+    _forget_slots_on_commit(shop.id, pickup_dt)
+
+
+def release_slot(shop_id, pickup_dt):
+    """Give back one place in the shop's pickup slot"""
+    SlotReservation.objects.filter(shop_id=shop_id, slot_start=pickup_dt, reserved__gt=0).update(
+        reserved=F("reserved") - 1
+    )
+    _forget_slots_on_commit(shop_id, pickup_dt)
+
+
+@transaction.atomic
+def rebuild_slot_reservations(shop_ids=None, batch_size=1000):
+    """
+    Recount every pickup-slot counter from the non-cancelled orders with one
+    grouped query. Returns the number of counters written.
+    """
+    orders = Order.objects.exclude(status=Order.STATUS_CANCELLED)
+    counters = SlotReservation.objects.all()
+    if shop_ids is not None:
+        orders = orders.filter(shop_id__in=shop_ids)
+        counters = counters.filter(shop_id__in=shop_ids)
+    for shop_id, slot_start in counters.values_list("shop_id", "slot_start").iterator():
+        _forget_slots_on_commit(shop_id, slot_start)
+    counters.delete()
+
+    slots = orders.values("shop_id", "pickup_time").annotate(orders=Count("id")).order_by()
+    written = SlotReservation.objects.bulk_create(
+        (
+            SlotReservation(shop_id=slot["shop_id"], slot_start=slot["pickup_time"], reserved=slot["orders"])
+            for slot in slots.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    for reservation in written:
+        _forget_slots_on_commit(reservation.shop_id, reservation.slot_start)
+    return len(written)
+
+
+def update_slot_for_status(order, old_status):
+    """Release the order's place when it is cancelled, and take it back if it is reopened"""
+    if order.status == Order.STATUS_CANCELLED and old_status != Order.STATUS_CANCELLED:
+        release_slot(order.shop_id, order.pickup_time)
+    elif old_status == Order.STATUS_CANCELLED and order.status != Order.STATUS_CANCELLED:
+        reserve_slot(order.shop, order.pickup_time, enforce_capacity=False)
 
 
 def validate_pickup_time(shop, pickup_dt):
@@ -33,3 +134,109 @@ def validate_pickup_time(shop, pickup_dt):
     if not is_slot_available(shop, pickup_dt):
         return False, "Selected time slot is full. Please choose another time."
     return True, ""
+
+
+def get_slots_cache_timeout():
+    return getattr(settings, "PICKUP_SLOTS_CACHE_TIMEOUT", 30)
+
+
+def _reserved_on(shop, day):
+    """{slot start: places taken} for one day of the shop, from one query on the counters"""
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    return dict(
+        SlotReservation.objects.filter(
+            shop=shop, slot_start__gte=start, slot_start__lt=start + timedelta(days=1), reserved__gt=0
+        ).values_list("slot_start", "reserved")
+    )
+
+
+def available_slots(shop, day, now=None):
+    """
+    Every 15-minute pickup slot of the day within the shop's hours with the
+    places left. The counters are cached for PICKUP_SLOTS_CACHE_TIMEOUT seconds
+    and dropped whenever a place of the day is claimed or released; checkout
+    still claims the place atomically, so a stale count read while a change is
+    being committed can only make a slot look free a little longer.
+    """
+    now = timezone.localtime(now or timezone.now())
+    timeout = get_slots_cache_timeout()
+    key = _slots_cache_key(shop.id, day)
+    reserved = cache.get(key) if timeout else None
+    if reserved is None:
+        reserved = _reserved_on(shop, day)
+        if timeout:
+            cache.set(key, reserved, timeout)
+
+    earliest = now + timedelta(minutes=MIN_LEAD_MINUTES)
+    slot = timezone.make_aware(datetime.combine(day, shop.opening_time.replace(second=0, microsecond=0)))
+    if slot.minute % SLOT_MINUTES:
+        slot += timedelta(minutes=SLOT_MINUTES - slot.minute % SLOT_MINUTES)
+    slots = []
+    while slot.date() == day and is_within_shop_hours(shop, slot):
+        remaining = max(shop.max_orders_per_slot - reserved.get(slot, 0), 0)
+        slots.append({
+            "start": slot,
+            "remaining": remaining,
+            "available": slot >= earliest and remaining > 0,
+        })
+        slot += timedelta(minutes=SLOT_MINUTES)
+    return slots
+
+
+def validate_cart(shop, cart):
+    """
+    The cart's (menu item, quantity) lines and the order total, looking every
+    item up in one query; raises UnavailableItemsError if any item is gone.
+    """
+    quantities = {}
+    for item_id, quantity in cart.items():
+        try:
+            quantity = int(quantity)
+        except (TypeError, ValueError):
+            quantity = 1
+        if quantity < 1:
+            continue
+        try:
+            quantities[int(item_id)] = quantity
+        except (TypeError, ValueError):
+            raise UnavailableItemsError
+
+    menu_items = MenuItem.objects.filter(shop=shop, is_available=True).in_bulk(quantities)
+    if len(menu_items) != len(quantities):
+        raise UnavailableItemsError
+    lines = [(menu_items[item_id], quantity) for item_id, quantity in quantities.items()]
+    total = sum((menu_item.price * quantity for menu_item, quantity in lines), Decimal("0.00"))
+    return lines, total
+
+
+@transaction.atomic
+def place_order(user, shop, pickup_time, lines, total, wallet):
+    """
+    Claim the pickup slot, create the order with its total, items and wallet
+    payment, debit the wallet and notify the owner. The number of queries does
+    not depend on the number of cart lines.
+    """
+    reserve_slot(shop, pickup_time)
+    order = Order.objects.create(user=user, shop=shop, pickup_time=pickup_time, total_price=total)
+    OrderItem.objects.bulk_create([
+        OrderItem(order=order, menu_item=menu_item, quantity=quantity, price=menu_item.price)
+        for menu_item, quantity in lines
+    ])
+    wallet.debit_amount(total)
+    payment = Payment.objects.create(
+        order=order,
+        payment_method=Payment.METHOD_WALLET,
+        payment_status=Payment.STATUS_PAID,
+    )
+    record_order_placed(order, payment)
+    record_order_items(order, [menu_item.id for menu_item, _ in lines])
+
+    # Notify shop owner of new order
+    create_notification(
+        user=shop.owner,
+        notification_type=Notification.NOTIFICATION_ORDER_PLACED,
+        title=f"New Order #{order.id}",
+        message=f"{user.username} placed an order for ₹{order.total_price}. Pickup at {pickup_time.strftime('%I:%M %p')}.",
+        link=f"/shops/owner/dashboard/"
+    )
+    return order
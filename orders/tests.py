@@ -1,8 +1,19 @@
+import json
+import os
+import tempfile
+import time as time_module
 from datetime import datetime, time, timedelta
 from decimal import Decimal
+from io import StringIO
+from unittest import mock, skipUnless
 
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.contrib.sessions.backends.signed_cookies import SessionStore
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
@@ -10,9 +21,20 @@ from accounts.models import Profile
 from accounts.utils import get_or_create_wallet
 from menu.models import Category, MenuItem
 from payments.models import Payment
-from shops.models import Shop
+from shops.models import (
+    ItemCooccurrence,
+    Shop,
+    ShopDayItemRollup,
+    ShopDayPaymentRollup,
+    ShopDayRatingRollup,
+    ShopDayRollup,
+)
+from shops.rollups import record_feedback, record_status_change
 
-from .models import Order
+from .cart import get_cart_summary, save_cart
+from .models import Feedback, Order, OrderItem, SlotReservation, TokenCounter
+from .services import SlotFullError, available_slots, place_order, release_slot, reserve_slot, validate_cart
+from .warehouse import dump_warehouse, iter_table_batches, parquet_available, read_watermarks
 
 
 User = get_user_model()
@@ -151,6 +173,411 @@ class OrderFlowTests(TestCase):
         self.assertContains(response, "Insufficient wallet balance.")
         self.assertFalse(Order.objects.filter(user=self.college_user, shop=self.shop).exists())
 
+    def test_checkout_rejects_full_slot_and_cancel_releases_it(self):
+        wallet = get_or_create_wallet(self.college_user.profile)
+        wallet.balance = Decimal("200.00")
+        wallet.save(update_fields=["balance"])
+        pickup_time = timezone.make_aware(
+            datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0))
+        )
+        SlotReservation.objects.create(shop=self.shop, slot_start=pickup_time, reserved=4)
+
+        self.client.force_login(self.college_user)
+        session = self.client.session
+        session["cart_items"] = {str(self.menu_item.id): 1}
+        session["cart_shop_id"] = self.shop.id
+        session.save()
+        self.client.post(reverse("orders:checkout"), {"pickup_time": pickup_time.strftime("%Y-%m-%dT%H:%M")})
+
+        reservation = SlotReservation.objects.get(shop=self.shop, slot_start=pickup_time)
+        self.assertEqual(reservation.reserved, 5)
+        order = Order.objects.get(user=self.college_user, shop=self.shop)
+
+        session = self.client.session
+        session["cart_items"] = {str(self.menu_item.id): 1}
+        session["cart_shop_id"] = self.shop.id
+        session.save()
+        order.status = Order.STATUS_COLLECTED
+        order.save(update_fields=["status"])
+        response = self.client.post(reverse("orders:checkout"), {"pickup_time": pickup_time.strftime("%Y-%m-%dT%H:%M")})
+        self.assertContains(response, "Selected time slot is full.")
+        self.assertEqual(Order.objects.filter(user=self.college_user).count(), 1)
+
+        order.status = Order.STATUS_PENDING
+        order.save(update_fields=["status"])
+        self.client.post(reverse("orders:cancel", args=[order.id]))
+        reservation.refresh_from_db()
+        self.assertEqual(reservation.reserved, 4)
+
+    def test_extend_pickup_time_moves_reservation(self):
+        old_slot = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+        new_slot = old_slot + timedelta(hours=1)
+        order = Order.objects.create(user=self.college_user, shop=self.shop, pickup_time=old_slot)
+        reserve_slot(self.shop, old_slot)
+        self.client.force_login(self.college_user)
+
+        self.client.post(
+            reverse("orders:extend_pickup_time", args=[order.id]),
+            {"new_pickup_time": new_slot.strftime("%Y-%m-%dT%H:%M")},
+        )
+
+        order.refresh_from_db()
+        self.assertEqual(order.pickup_time, new_slot)
+        reserved = dict(SlotReservation.objects.values_list("slot_start", "reserved"))
+        self.assertEqual(reserved, {old_slot: 0, new_slot: 1})
+
+    def test_reserve_slot_claims_at_most_capacity(self):
+        slot = timezone.now().replace(second=0, microsecond=0)
+        for _ in range(self.shop.max_orders_per_slot):
+            reserve_slot(self.shop, slot)
+        with self.assertRaises(SlotFullError):
+            reserve_slot(self.shop, slot)
+        reserve_slot(self.shop, slot, enforce_capacity=False)
+        self.assertEqual(SlotReservation.objects.get(shop=self.shop, slot_start=slot).reserved, 6)
+
+    def test_available_slots_reads_counters_once_and_caches(self):
+        cache.clear()
+        day = timezone.localdate() + timedelta(days=1)
+        noon = timezone.make_aware(datetime.combine(day, time(12, 0)))
+        reserve_slot(self.shop, noon)
+        reserve_slot(self.shop, noon)
+
+        with self.assertNumQueries(1):
+            slots = available_slots(self.shop, day)
+        with self.assertNumQueries(0):
+            available_slots(self.shop, day)
+
+        self.assertEqual(len(slots), 96)
+        by_start = {slot["start"]: slot for slot in slots}
+        self.assertEqual(by_start[noon]["remaining"], 3)
+        self.assertEqual(by_start[noon + timedelta(minutes=15)]["remaining"], 5)
+
+    def test_claiming_or_releasing_a_place_drops_the_cached_slots(self):
+        cache.clear()
+        day = timezone.localdate() + timedelta(days=1)
+        noon = timezone.make_aware(datetime.combine(day, time(12, 0)))
+        available_slots(self.shop, day)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_slot(self.shop, noon)
+        with self.assertNumQueries(1):
+            by_start = {slot["start"]: slot for slot in available_slots(self.shop, day)}
+        self.assertEqual(by_start[noon]["remaining"], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            release_slot(self.shop.id, noon)
+        by_start = {slot["start"]: slot for slot in available_slots(self.shop, day)}
+        self.assertEqual(by_start[noon]["remaining"], 5)
+
+    def test_pickup_slots_endpoint_hides_past_slots(self):
+        cache.clear()
+        self.client.force_login(self.college_user)
+        today = timezone.localdate()
+
+        response = self.client.get(reverse("orders:pickup_slots", args=[self.shop.id]), {"date": today.isoformat()})
+
+        data = response.json()
+        self.assertEqual(data["capacity"], 5)
+        earliest = (timezone.localtime() + timedelta(minutes=15)).strftime("%Y-%m-%dT%H:%M")
+        for slot in data["slots"]:
+            if slot["start"] != earliest:
+                self.assertEqual(slot["available"], slot["start"] > earliest)
+        self.assertEqual(
+            self.client.get(reverse("orders:pickup_slots", args=[self.shop.id]), {"date": "tomorrow"}).status_code,
+            400,
+        )
+
+    def test_tokens_count_up_per_shop_and_restart_daily(self):
+        other_shop = Shop.objects.create(name="Juice Bar", owner=self.owner, opening_time=time(8, 0), closing_time=time(20, 0))
+        first = self.create_paid_order()
+        second = self.create_paid_order()
+        elsewhere = Order.objects.create(user=self.college_user, shop=other_shop, pickup_time=timezone.now())
+
+        self.assertEqual((first.token_number, second.token_number, elsewhere.token_number), (1, 2, 1))
+        self.assertEqual(first.token_date, timezone.localdate())
+
+        yesterday = timezone.localdate() - timedelta(days=1)
+        Order.objects.filter(shop=self.shop).update(token_date=yesterday)
+        TokenCounter.objects.filter(shop=self.shop).update(date=yesterday)
+        self.assertEqual(self.create_paid_order().token_number, 1)
+
+    def test_checkout_query_count_does_not_grow_with_cart_size(self):
+        menu_items = [self.menu_item] + [
+            MenuItem.objects.create(shop=self.shop, category=self.category, name=f"Item {number}", price=Decimal("20.00"))
+            for number in range(4)
+        ]
+        pickup_time = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+
+        def check_out(number, cart_size):
+            student = User.objects.create_user(username=f"student{number}@example.com", password="password123")
+            Profile.objects.create(user=student, role=Profile.ROLE_COLLEGE_USER, phone_number="7777777777")
+            wallet = get_or_create_wallet(student.profile)
+            wallet.balance = Decimal("500.00")
+            wallet.save(update_fields=["balance"])
+            cart = {str(menu_item.id): 2 for menu_item in menu_items[:cart_size]}
+            with CaptureQueriesContext(connection) as queries:
+                lines, total = validate_cart(self.shop, cart)
+                order = place_order(student, self.shop, pickup_time, lines, total, wallet)
+            return order, len(queries)
+
+        # The first order of the day creates the counter and rollup rows
+        check_out(1, 5)
+        small_order, small_queries = check_out(2, 2)
+        large_order, large_queries = check_out(3, 5)
+
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large_queries, 19)
+        self.assertEqual(large_order.items.count(), 5)
+        large_order.refresh_from_db()
+        self.assertEqual(large_order.total_price, Decimal("260.00"))
+        self.assertEqual(small_order.total_price, Decimal("140.00"))
+
+    def test_view_cart_loads_menu_items_in_one_query(self):
+        extra_items = [
+            MenuItem.objects.create(shop=self.shop, category=self.category, name=f"Item {number}", price=Decimal("20.00"))
+            for number in range(3)
+        ]
+        self.client.force_login(self.college_user)
+        session = self.client.session
+        session["cart_items"] = {str(item.id): 2 for item in [self.menu_item, *extra_items]}
+        session["cart_shop_id"] = self.shop.id
+        session.save()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("orders:cart"))
+
+        self.assertEqual(response.context["total"], Decimal("220.00"))
+        menu_queries = [query for query in queries if 'WHERE "menu_menuitem"."id" IN' in query["sql"]]
+        self.assertEqual(len(menu_queries), 1)
+        self.assertEqual(self.client.session["cart_summary"]["count"], 8)
+
+    def test_cart_summary_is_memoized_until_the_menu_changes(self):
+        cache.clear()
+        session = SessionStore()
+        save_cart(session, {str(self.menu_item.id): 3}, self.shop.id)
+        self.assertEqual(get_cart_summary(session)["total"], "150.00")
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cart_summary(session)["count"], 3)
+
+        self.client.force_login(self.owner)
+        self.client.post(
+            reverse("shops:edit_menu_item", args=[self.menu_item.id]),
+            {"name": self.menu_item.name, "price": "40.00", "category": self.category.id, "preparation_time_minutes": 10, "is_available": "on"},
+        )
+        with self.assertNumQueries(1):
+            self.assertEqual(get_cart_summary(session)["total"], "120.00")
+
+    @override_settings(MENU_VERSION_TIMEOUT=1)
+    def test_menu_edits_in_another_process_reach_the_summary_once_the_stamp_expires(self):
+        cache.clear()
+        session = SessionStore()
+        save_cart(session, {str(self.menu_item.id): 3}, self.shop.id)
+        self.assertEqual(get_cart_summary(session)["total"], "150.00")
+
+        # Edited by a process with its own cache, so the local stamp is not bumped
+        MenuItem.objects.filter(pk=self.menu_item.pk).update(price=Decimal("40.00"))
+        self.assertEqual(get_cart_summary(session)["total"], "150.00")
+        with mock.patch("django.core.cache.backends.locmem.time.time", return_value=time_module.time() + 2):
+            self.assertEqual(get_cart_summary(session)["total"], "120.00")
+
+    def test_concurrent_cancel_and_status_change_count_the_order_once(self):
+        wallet = get_or_create_wallet(self.college_user.profile)
+        wallet.balance = Decimal("100.00")
+        wallet.save(update_fields=["balance"])
+        pickup_time = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+        lines, total = validate_cart(self.shop, {str(self.menu_item.id): 1})
+        order = place_order(self.college_user, self.shop, pickup_time, lines, total, wallet)
+        stale_order = Order.objects.get(pk=order.pk)
+
+        self.client.force_login(self.college_user)
+        self.client.post(reverse("orders:cancel", args=[order.id]))
+        # The owner's request read the order before the customer cancelled it
+        self.client.force_login(self.owner)
+        with mock.patch("orders.views.get_object_or_404", return_value=stale_order):
+            self.client.post(reverse("orders:update_status", args=[order.id]), {"status": Order.STATUS_PREPARING})
+
+        order.refresh_from_db()
+        self.assertEqual(order.status, Order.STATUS_CANCELLED)
+        rollup = ShopDayRollup.objects.get(shop=self.shop)
+        self.assertEqual((rollup.pending_orders, rollup.preparing_orders, rollup.cancelled_orders), (0, 0, 1))
+        self.assertEqual(SlotReservation.objects.get(shop=self.shop).reserved, 0)
+        wallet.refresh_from_db()
+        self.assertEqual(wallet.balance, Decimal("100.00"))
+
+    def test_admin_edit_moves_the_slot_and_rollup_counters(self):
+        wallet = get_or_create_wallet(self.college_user.profile)
+        wallet.balance = Decimal("100.00")
+        wallet.save(update_fields=["balance"])
+        pickup_time = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+        lines, total = validate_cart(self.shop, {str(self.menu_item.id): 1})
+        order = place_order(self.college_user, self.shop, pickup_time, lines, total, wallet)
+        admin_user = User.objects.create_superuser(username="admin@example.com", password="password123")
+        self.client.force_login(admin_user)
+        new_pickup = pickup_time + timedelta(minutes=30)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            response = self.client.post(
+                reverse("admin:orders_order_change", args=[order.id]),
+                {
+                    "pickup_time_0": new_pickup.strftime("%Y-%m-%d"),
+                    "pickup_time_1": new_pickup.strftime("%H:%M:%S"),
+                    "status": Order.STATUS_CANCELLED,
+                    "items-TOTAL_FORMS": "0",
+                    "items-INITIAL_FORMS": "0",
+                },
+            )
+
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(callbacks)
+        order.refresh_from_db()
+        self.assertEqual((order.status, order.pickup_time), (Order.STATUS_CANCELLED, new_pickup))
+        rollup = ShopDayRollup.objects.get(shop=self.shop)
+        self.assertEqual((rollup.pending_orders, rollup.cancelled_orders), (0, 1))
+        reserved = dict(SlotReservation.objects.filter(shop=self.shop).values_list("slot_start", "reserved"))
+        self.assertEqual(reserved, {pickup_time: 0})
+
+        self.client.post(
+            reverse("admin:orders_order_change", args=[order.id]),
+            {
+                "pickup_time_0": new_pickup.strftime("%Y-%m-%d"),
+                "pickup_time_1": new_pickup.strftime("%H:%M:%S"),
+                "status": Order.STATUS_PENDING,
+                "items-TOTAL_FORMS": "0",
+                "items-INITIAL_FORMS": "0",
+            },
+        )
+        reserved = dict(SlotReservation.objects.filter(shop=self.shop).values_list("slot_start", "reserved"))
+        self.assertEqual(reserved, {pickup_time: 0, new_pickup: 1})
+        rollup.refresh_from_db()
+        self.assertEqual((rollup.pending_orders, rollup.cancelled_orders), (1, 0))
+
+    def test_admin_deletes_release_the_slot_places(self):
+        pickup_time = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+        orders = []
+        for status in (Order.STATUS_PENDING, Order.STATUS_PREPARING, Order.STATUS_READY, Order.STATUS_CANCELLED):
+            orders.append(Order.objects.create(user=self.college_user, shop=self.shop, pickup_time=pickup_time, status=status))
+            if status != Order.STATUS_CANCELLED:
+                reserve_slot(self.shop, pickup_time)
+        admin_user = User.objects.create_superuser(username="admin@example.com", password="password123")
+        self.client.force_login(admin_user)
+
+        self.client.post(reverse("admin:orders_order_delete", args=[orders[0].id]), {"post": "yes"})
+        self.assertEqual(SlotReservation.objects.get(shop=self.shop).reserved, 2)
+        self.client.post(
+            reverse("admin:orders_order_changelist"),
+            {"action": "delete_selected", "_selected_action": [orders[1].id, orders[3].id], "post": "yes"},
+        )
+        self.assertEqual(list(Order.objects.values_list("id", flat=True)), [orders[2].id])
+        self.assertEqual(SlotReservation.objects.get(shop=self.shop).reserved, 1)
+
+    def test_admin_feedback_edits_and_order_deletes_adjust_the_rollups(self):
+        wallet = get_or_create_wallet(self.college_user.profile)
+        wallet.balance = Decimal("200.00")
+        wallet.save(update_fields=["balance"])
+        other_item = MenuItem.objects.create(shop=self.shop, category=self.category, name="Tea", price=Decimal("10.00"))
+        pickup_time = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+        lines, total = validate_cart(self.shop, {str(self.menu_item.id): 1, str(other_item.id): 2})
+        order = place_order(self.college_user, self.shop, pickup_time, lines, total, wallet)
+        Order.objects.filter(pk=order.pk).update(status=Order.STATUS_COLLECTED)
+        order.status = Order.STATUS_COLLECTED
+        record_status_change(order, Order.STATUS_PENDING)
+        feedback = Feedback.objects.create(user=self.college_user, shop=self.shop, order=order, rating=5)
+        record_feedback(feedback)
+        admin_user = User.objects.create_superuser(username="admin@example.com", password="password123")
+        self.client.force_login(admin_user)
+
+        self.client.post(
+            reverse("admin:orders_feedback_change", args=[feedback.id]),
+            {"shop": self.shop.id, "user": self.college_user.id, "order": order.id, "rating": 2, "comment": ""},
+        )
+        ratings = dict(ShopDayRatingRollup.objects.filter(shop=self.shop).values_list("rating", "feedback_count"))
+        self.assertEqual(ratings, {5: 0, 2: 1})
+
+        self.client.post(reverse("admin:orders_order_delete", args=[order.id]), {"post": "yes"})
+        self.assertFalse(Order.objects.exists())
+        rollup = ShopDayRollup.objects.get(shop=self.shop)
+        self.assertEqual((rollup.total_orders, rollup.collected_orders, rollup.revenue), (0, 0, Decimal("0.00")))
+        self.assertEqual(set(ShopDayItemRollup.objects.values_list("quantity", "order_count")), {(0, 0)})
+        payments = ShopDayPaymentRollup.objects.get(shop=self.shop)
+        self.assertEqual((payments.payment_count, payments.total_amount), (0, Decimal("0.00")))
+        self.assertEqual(set(ShopDayRatingRollup.objects.values_list("feedback_count", flat=True)), {0})
+        self.assertEqual(set(ItemCooccurrence.objects.values_list("order_count", flat=True)), {0})
+
+    def test_admin_payment_edits_and_deletes_move_the_payment_rollups(self):
+        wallet = get_or_create_wallet(self.college_user.profile)
+        wallet.balance = Decimal("100.00")
+        wallet.save(update_fields=["balance"])
+        pickup_time = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+        lines, total = validate_cart(self.shop, {str(self.menu_item.id): 1})
+        order = place_order(self.college_user, self.shop, pickup_time, lines, total, wallet)
+        payment = Payment.objects.get(order=order)
+        admin_user = User.objects.create_superuser(username="admin@example.com", password="password123")
+        self.client.force_login(admin_user)
+
+        def paid_by_method():
+            return {
+                row.payment_method: (row.payment_count, row.total_amount)
+                for row in ShopDayPaymentRollup.objects.filter(shop=self.shop)
+            }
+
+        def edit(method, status):
+            self.client.post(
+                reverse("admin:payments_payment_change", args=[payment.id]),
+                {"order": order.id, "payment_method": method, "payment_status": status, "transaction_id": ""},
+            )
+
+        self.assertEqual(paid_by_method(), {Payment.METHOD_WALLET: (1, Decimal("50.00"))})
+        edit(Payment.METHOD_CASH, Payment.STATUS_PENDING)
+        self.assertEqual(paid_by_method(), {Payment.METHOD_WALLET: (0, Decimal("0.00"))})
+        edit(Payment.METHOD_CASH, Payment.STATUS_PAID)
+        self.assertEqual(paid_by_method()[Payment.METHOD_CASH], (1, Decimal("50.00")))
+
+        self.client.post(reverse("admin:payments_payment_delete", args=[payment.id]), {"post": "yes"})
+        self.assertFalse(Payment.objects.exists())
+        self.assertEqual(paid_by_method()[Payment.METHOD_CASH], (0, Decimal("0.00")))
+
+    def test_order_items_are_read_only_in_the_admin(self):
+        order = Order.objects.create(user=self.college_user, shop=self.shop, pickup_time=timezone.now())
+        item = OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=1, price=Decimal("50.00"))
+        admin_user = User.objects.create_superuser(username="admin@example.com", password="password123")
+        self.client.force_login(admin_user)
+
+        response = self.client.post(
+            reverse("admin:orders_order_change", args=[order.id]),
+            {
+                "pickup_time_0": order.pickup_time.strftime("%Y-%m-%d"),
+                "pickup_time_1": order.pickup_time.strftime("%H:%M:%S"),
+                "status": Order.STATUS_PENDING,
+                "items-TOTAL_FORMS": "1",
+                "items-INITIAL_FORMS": "1",
+                "items-0-id": item.id,
+                "items-0-order": order.id,
+                "items-0-menu_item": self.menu_item.id,
+                "items-0-quantity": "9",
+                "items-0-price": "50.00",
+                "items-0-DELETE": "on",
+            },
+        )
+
+        self.assertEqual(response.status_code, 302)
+        item.refresh_from_db()
+        self.assertEqual(item.quantity, 1)
+
+    def test_rebuild_slot_reservations_recounts_from_the_orders(self):
+        pickup_time = timezone.make_aware(datetime.combine(timezone.localdate() + timedelta(days=1), time(12, 0)))
+        for status in (Order.STATUS_PENDING, Order.STATUS_READY, Order.STATUS_CANCELLED):
+            Order.objects.create(user=self.college_user, shop=self.shop, pickup_time=pickup_time, status=status)
+        stale = pickup_time + timedelta(minutes=15)
+        SlotReservation.objects.create(shop=self.shop, slot_start=stale, reserved=4)
+
+        output = StringIO()
+        call_command("rebuild_slot_reservations", stdout=output)
+
+        self.assertIn("SlotReservation: 1 rows", output.getvalue())
+        reserved = dict(SlotReservation.objects.filter(shop=self.shop).values_list("slot_start", "reserved"))
+        self.assertEqual(reserved, {pickup_time: 2})
+
     def test_profile_top_up_adds_money_to_wallet(self):
         wallet = get_or_create_wallet(self.college_user.profile)
         self.client.force_login(self.college_user)
@@ -167,4 +594,135 @@ class OrderFlowTests(TestCase):
 
         self.assertEqual(response.status_code, 302)
         wallet.refresh_from_db()
-        self.assertEqual(wallet.balance, Decimal("150.00"))
\ No newline at end of file
+        self.assertEqual(wallet.balance, Decimal("150.00"))
+
+    def create_paid_order(self, quantity=2):
+        order = Order.objects.create(
+            user=self.college_user,
+            shop=self.shop,
+            pickup_time=timezone.now() + timedelta(hours=1),
+            status=Order.STATUS_COLLECTED,
+            total_price=self.menu_item.price * quantity,
+        )
+        OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=quantity, price=self.menu_item.price)
+        Payment.objects.create(order=order, payment_method=Payment.METHOD_CASH, payment_status=Payment.STATUS_PAID)
+        return order
+
+    def test_owner_export_streams_orders_with_items_payment_and_feedback(self):
+        order = self.create_paid_order()
+        Feedback.objects.create(user=self.college_user, shop=self.shop, order=order, rating=4, comment="Tasty")
+        self.create_paid_order(quantity=1)
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse("orders:export"), {"format": "csv"})
+
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[0].startswith("order_id,token_number,shop"))
+        self.assertIn("Veg Sandwich x2 @ 50.00", lines[1])
+        self.assertIn("cash,paid", lines[1])
+        self.assertTrue(lines[1].endswith(",4,Tasty"))
+
+        response = self.client.get(reverse("orders:export"), {"format": "jsonl"})
+        records = [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record["order_id"] for record in records], [order.id, order.id + 1])
+        self.assertEqual(records[0]["items"], [{"name": "Veg Sandwich", "quantity": 2, "price": "50.00"}])
+        self.assertIsNone(records[1]["feedback_rating"])
+
+    def test_csv_export_quotes_cells_a_spreadsheet_would_run_as_formulas(self):
+        order = self.create_paid_order()
+        Feedback.objects.create(
+            user=self.college_user, shop=self.shop, order=order, rating=1,
+            comment='=HYPERLINK("http://example.com/","Refund")',
+        )
+        self.client.force_login(self.owner)
+
+        response = self.client.get(reverse("orders:export"), {"format": "csv"})
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[1].endswith(',1,"\'=HYPERLINK(""http://example.com/"",""Refund"")"'))
+        self.assertIn(f",{order.total_price},", lines[1])
+
+    def test_export_fetches_items_per_chunk(self):
+        for _ in range(5):
+            self.create_paid_order()
+        stdout = StringIO()
+
+        # One streamed order query plus one item prefetch per chunk of two orders
+        with self.assertNumQueries(4):
+            call_command("export_orders", "--format", "jsonl", "--chunk-size", "2", stdout=stdout)
+
+        self.assertEqual(len(stdout.getvalue().splitlines()), 5)
+
+    def test_export_blocks_college_user(self):
+        self.client.force_login(self.college_user)
+
+        response = self.client.get(reverse("orders:export"))
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_warehouse_batches_resume_after_watermark_and_skip_today(self):
+        yesterday = timezone.now() - timedelta(days=1)
+        orders = [self.create_paid_order() for _ in range(3)]
+        Order.objects.filter(id__in=[order.id for order in orders[:2]]).update(created_at=yesterday)
+        cutoff = timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+
+        frames = list(iter_table_batches("orders", after_id=0, cutoff=cutoff, batch_size=1))
+
+        self.assertEqual([frame["id"].tolist() for frame in frames], [[orders[0].id], [orders[1].id]])
+        self.assertEqual(frames[0]["date"].iloc[0], str(timezone.localdate(yesterday)))
+        self.assertEqual(list(iter_table_batches("orders", after_id=orders[1].id, cutoff=cutoff)), [])
+
+        items = next(iter_table_batches("order_items", cutoff=cutoff))
+        self.assertEqual(items.columns.tolist()[:3], ["id", "order_id", "shop_id"])
+
+    def test_warehouse_dump_writes_date_partitions_and_watermarks(self):
+        import pandas as pd
+
+        written_frames = {}
+
+        def fake_to_parquet(frame, path, index=True):
+            # Stand-in for the optional Parquet engine: remember what would be written
+            written_frames[path] = frame.copy()
+            open(path, "wb").close()
+
+        first = self.create_paid_order()
+        second = self.create_paid_order()
+        Order.objects.filter(pk=first.pk).update(created_at=timezone.now() - timedelta(days=1))
+        with tempfile.TemporaryDirectory() as root, \
+                mock.patch("orders.warehouse.parquet_available", return_value=True), \
+                mock.patch.object(pd.DataFrame, "to_parquet", fake_to_parquet):
+            written = dump_warehouse(root, tables=["orders"], cutoff=timezone.now() + timedelta(minutes=1))
+
+            days = [timezone.localdate() - timedelta(days=1), timezone.localdate()]
+            expected_paths = [
+                f"{root}/orders/date={day}/part-{order.id}-{order.id}.parquet"
+                for day, order in zip(days, [first, second])
+            ]
+            self.assertEqual(written, {"orders": 2})
+            self.assertEqual(sorted(written_frames), expected_paths)
+            self.assertTrue(all(os.path.exists(path) for path in expected_paths))
+            self.assertEqual(written_frames[expected_paths[1]]["id"].tolist(), [second.id])
+            self.assertNotIn("date", written_frames[expected_paths[1]].columns)
+            self.assertEqual(read_watermarks(root), {"orders": second.id})
+
+            # Nothing new: the watermark keeps the next run from rewriting partitions
+            self.assertEqual(dump_warehouse(root, tables=["orders"], cutoff=timezone.now() + timedelta(minutes=1)), {"orders": 0})
+            self.assertEqual(len(written_frames), 2)
+
+    @skipUnless(parquet_available(), "Parquet engine not installed")
+    def test_warehouse_dump_appends_only_new_rows(self):
+        import pandas as pd
+
+        self.create_paid_order()
+        cutoff = timezone.now() + timedelta(minutes=1)
+        with tempfile.TemporaryDirectory() as root:
+            self.assertEqual(dump_warehouse(root, cutoff=cutoff)["orders"], 1)
+            self.create_paid_order()
+            written = dump_warehouse(root, cutoff=timezone.now() + timedelta(minutes=1))
+
+            self.assertEqual(written["orders"], 1)
+            self.assertEqual(written["payments"], 1)
+            self.assertEqual(read_watermarks(root)["orders"], Order.objects.latest("id").id)
+            self.assertEqual(len(pd.read_parquet(f"{root}/orders")), 2)
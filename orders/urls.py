@@ -4,9 +4,11 @@ from .views import (
     add_to_cart,
     cancel_order,
     checkout,
+    export_orders,
     extend_pickup_time,
     feedback_list,
     order_list,
+    pickup_slots,
     remove_from_cart,
     submit_feedback,
     update_cart_qty,
@@ -22,10 +24,12 @@ urlpatterns = [
     path("cart/update/<int:item_id>/", update_cart_qty, name="update_cart_qty"),
     path("cart/remove/<int:item_id>/", remove_from_cart, name="remove_from_cart"),
     path("checkout/", checkout, name="checkout"),
+    path("slots/<int:shop_id>/", pickup_slots, name="pickup_slots"),
     path("my/", order_list, name="list"),
     path("cancel/<int:order_id>/", cancel_order, name="cancel"),
     path("extend/<int:order_id>/", extend_pickup_time, name="extend_pickup_time"),
     path("feedback/<int:order_id>/", submit_feedback, name="submit_feedback"),
     path("feedbacks/", feedback_list, name="feedback_list"),
     path("status/<int:order_id>/", update_status, name="update_status"),
+    path("export/", export_orders, name="export"),
 ]
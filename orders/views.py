@@ -1,8 +1,8 @@
-from decimal import Decimal
+from datetime import datetime
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.db import IntegrityError, transaction
-from django.http import HttpResponseNotAllowed
+from django.http import HttpResponseBadRequest, HttpResponseNotAllowed, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.utils import timezone
 
@@ -17,33 +17,33 @@ from accounts.decorators import (
 from accounts.models import Notification
 from accounts.utils import create_notification, get_or_create_wallet
 from menu.models import MenuItem
-from payments.models import Payment
 from shops.models import Shop
+from shops.recommendations import recommended_items
+from shops.rollups import record_feedback, record_status_change
 
+from .cart import CART_SHOP_KEY, clear_cart, get_cart, load_cart, remember_summary, save_cart
+from .exports import EXPORT_FORMATS, export_queryset, iter_export
 from .forms import PickupTimeForm, ExtendPickupTimeForm, FeedbackForm
-from .models import Order, OrderItem, Feedback
-from .services import round_to_quarter_hour, validate_pickup_time
-
-
-CART_SESSION_KEY = "cart_items"
-CART_SHOP_KEY = "cart_shop_id"
-
-
-def _get_cart(session):
-    return session.get(CART_SESSION_KEY, {})
-
-
-def _save_cart(session, cart, shop_id):
-    session[CART_SESSION_KEY] = cart
-    session[CART_SHOP_KEY] = shop_id
-    session.modified = True
+from .models import Order, Feedback
+from .services import (
+    SlotFullError,
+    UnavailableItemsError,
+    available_slots,
+    place_order,
+    release_slot,
+    reserve_slot,
+    round_to_quarter_hour,
+    update_slot_for_status,
+    validate_cart,
+    validate_pickup_time,
+)
 
 
 @login_required
 @college_user_required
 def add_to_cart(request, item_id):
     item = get_object_or_404(MenuItem, id=item_id, is_available=True)
-    cart = _get_cart(request.session)
+    cart = get_cart(request.session)
     current_shop_id = request.session.get(CART_SHOP_KEY)
 
     if current_shop_id and str(current_shop_id) != str(item.shop_id):
@@ -56,7 +56,7 @@ def add_to_cart(request, item_id):
     quantity = max(1, min(quantity, 10))  # Ensure qty is between 1 and 10
     
     cart[str(item_id)] = cart.get(str(item_id), 0) + quantity
-    _save_cart(request.session, cart, item.shop_id)
+    save_cart(request.session, cart, item.shop_id)
     messages.success(request, f"{item.name} added to cart!")
     return redirect("shops:detail", shop_id=item.shop_id)
 
@@ -64,26 +64,18 @@ def add_to_cart(request, item_id):
 @login_required
 @college_user_required
 def view_cart(request):
-    cart = _get_cart(request.session)
-    items = []
-    total = Decimal("0.00")
-    for item_id, quantity in cart.items():
-        try:
-            quantity = int(quantity)
-        except (TypeError, ValueError):
-            continue
-        menu_item = get_object_or_404(MenuItem, id=item_id)
-        line_total = menu_item.price * quantity
-        total += line_total
-        items.append({"item": menu_item, "quantity": quantity, "line_total": line_total})
-
-    return render(request, "orders/cart.html", {"items": items, "total": total})
+    items, total = load_cart(request.session)
+    recommendations = []
+    if items:
+        remember_summary(request.session, items, total)
+        recommendations = recommended_items(items[0]["item"].shop_id, [entry["item"].id for entry in items])
+    return render(request, "orders/cart.html", {"items": items, "total": total, "recommendations": recommendations})
 
 
 @login_required
 @college_user_required
 def update_cart_qty(request, item_id):
-    cart = _get_cart(request.session)
+    cart = get_cart(request.session)
     action = request.GET.get("action", "increase")
     
     if str(item_id) in cart:
@@ -96,23 +88,22 @@ def update_cart_qty(request, item_id):
             del cart[str(item_id)]
     
     shop_id = request.session.get(CART_SHOP_KEY)
-    _save_cart(request.session, cart, shop_id)
+    save_cart(request.session, cart, shop_id)
     return redirect("orders:cart")
 
 
 @login_required
 @college_user_required
 def remove_from_cart(request, item_id):
-    cart = _get_cart(request.session)
+    cart = get_cart(request.session)
     if str(item_id) in cart:
         del cart[str(item_id)]
     
     shop_id = request.session.get(CART_SHOP_KEY)
     if cart:
-        _save_cart(request.session, cart, shop_id)
+        save_cart(request.session, cart, shop_id)
     else:
-        request.session.pop(CART_SESSION_KEY, None)
-        request.session.pop(CART_SHOP_KEY, None)
+        clear_cart(request.session)
     
     return redirect("orders:cart")
 
@@ -121,7 +112,7 @@ def remove_from_cart(request, item_id):
 @login_required
 @college_user_required
 def checkout(request):
-    cart = _get_cart(request.session)
+    cart = get_cart(request.session)
     if not cart:
         messages.error(request, "Your cart is empty.")
         return redirect("shops:list")
@@ -135,7 +126,6 @@ def checkout(request):
         pickup_time = round_to_quarter_hour(form.cleaned_data["pickup_time"])
         if timezone.is_naive(pickup_time):
             pickup_time = timezone.make_aware(pickup_time, timezone.get_current_timezone())
-        payment_method = Payment.METHOD_WALLET
 
         is_valid, error_message = validate_pickup_time(shop, pickup_time)
         if not is_valid:
@@ -153,24 +143,9 @@ def checkout(request):
             payment_config = getattr(shop, "payment_config", None)
             return render(request, "orders/checkout.html", {"form": form, "shop": shop, "payment_config": payment_config, "wallet": wallet})
 
-        validated_items = []
-        invalid_items = []
-        order_total = Decimal("0.00")
-        for item_id, quantity in cart.items():
-            try:
-                quantity = int(quantity)
-            except (TypeError, ValueError):
-                quantity = 1
-            if quantity < 1:
-                continue
-            menu_item = MenuItem.objects.filter(id=item_id, shop=shop, is_available=True).first()
-            if not menu_item:
-                invalid_items.append(item_id)
-                continue
-            validated_items.append((menu_item, quantity))
-            order_total += menu_item.price * quantity
-
-        if invalid_items:
+        try:
+            lines, order_total = validate_cart(shop, cart)
+        except UnavailableItemsError:
             messages.error(request, "Some items in your cart are no longer available. Please review your cart.")
             return redirect("orders:cart")
 
@@ -185,42 +160,17 @@ def checkout(request):
             return render(request, "orders/checkout.html", {"form": form, "shop": shop, "payment_config": payment_config, "wallet": wallet})
 
         try:
-            with transaction.atomic():
-                order = Order.objects.create(user=request.user, shop=shop, pickup_time=pickup_time)
-                for menu_item, quantity in validated_items:
-                    OrderItem.objects.create(
-                        order=order,
-                        menu_item=menu_item,
-                        quantity=quantity,
-                        price=menu_item.price,
-                    )
-                order.total_price = order_total
-                order.save(update_fields=["total_price"])
-
-                wallet.debit_amount(order_total)
-
-                Payment.objects.create(
-                    order=order,
-                    payment_method=payment_method,
-                    payment_status=Payment.STATUS_PAID,
-                )
-                
-                # Notify shop owner of new order
-                create_notification(
-                    user=shop.owner,
-                    notification_type=Notification.NOTIFICATION_ORDER_PLACED,
-                    title=f"New Order #{order.id}",
-                    message=f"{request.user.username} placed an order for ₹{order.total_price}. Pickup at {pickup_time.strftime('%I:%M %p')}.",
-                    link=f"/shops/owner/dashboard/"
-                )
-                
+            place_order(request.user, shop, pickup_time, lines, order_total, wallet)
+        except SlotFullError:
+            messages.error(request, "Selected time slot is full. Please choose another time.")
+            payment_config = getattr(shop, "payment_config", None)
+            return render(request, "orders/checkout.html", {"form": form, "shop": shop, "payment_config": payment_config, "wallet": wallet})
         except IntegrityError:
             messages.error(request, "You already have a pending order for this shop.")
             payment_config = getattr(shop, "payment_config", None)
             return render(request, "orders/checkout.html", {"form": form, "shop": shop, "payment_config": payment_config, "wallet": wallet})
 
-        request.session.pop(CART_SESSION_KEY, None)
-        request.session.pop(CART_SHOP_KEY, None)
+        clear_cart(request.session)
         messages.success(request, "Order placed successfully.")
         return redirect("orders:list")
 
@@ -228,6 +178,33 @@ def checkout(request):
     return render(request, "orders/checkout.html", {"form": form, "shop": shop, "payment_config": payment_config, "wallet": wallet})
 
 
+@login_required
+def pickup_slots(request, shop_id):
+    """API endpoint listing a day's pickup slots with the places left"""
+    shop = get_object_or_404(Shop, id=shop_id)
+    try:
+        day = request.GET.get("date")
+        day = datetime.strptime(day, "%Y-%m-%d").date() if day else timezone.localdate()
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be in YYYY-MM-DD format.")
+
+    slots = [
+        {
+            "start": timezone.localtime(slot["start"]).strftime("%Y-%m-%dT%H:%M"),
+            "label": timezone.localtime(slot["start"]).strftime("%I:%M %p"),
+            "remaining": slot["remaining"],
+            "available": slot["available"],
+        }
+        for slot in available_slots(shop, day)
+    ]
+    return JsonResponse({
+        "shop": shop.id,
+        "date": day.isoformat(),
+        "capacity": shop.max_orders_per_slot,
+        "slots": slots,
+    })
+
+
 @login_required
 @college_user_required
 def order_list(request):
@@ -247,26 +224,37 @@ def cancel_order(request, order_id):
         return HttpResponseNotAllowed(["POST"])
     order = get_object_or_404(Order, id=order_id, user=request.user)
     
-    # Smart cancellation logic
-    if order.status == Order.STATUS_PENDING:
-        order.status = Order.STATUS_CANCELLED
-        order.save(update_fields=["status"])
-
-        wallet = get_or_create_wallet(getattr(order.user, "profile", None))
-        if wallet:
-            wallet.credit_amount(order.total_price)
-        
-        # Notify shop owner of cancellation
-        create_notification(
-            user=order.shop.owner,
-            notification_type=Notification.NOTIFICATION_ORDER_CANCELLED,
-            title=f"Order #{order.id} Cancelled",
-            message=f"{request.user.username} cancelled their order for ₹{order.total_price}.",
-            link=f"/shops/owner/dashboard/"
+    # Smart cancellation logic: the conditional update only cancels a still
+    # pending order, so a concurrent status change by the owner is never undone
+    # and the order is counted and refunded once
+    with transaction.atomic():
+        cancelled = Order.objects.filter(pk=order.pk, status=Order.STATUS_PENDING).update(
+            status=Order.STATUS_CANCELLED
         )
-        
+        if cancelled:
+            order.status = Order.STATUS_CANCELLED
+            record_status_change(order, Order.STATUS_PENDING)
+            release_slot(order.shop_id, order.pickup_time)
+
+            wallet = get_or_create_wallet(getattr(order.user, "profile", None))
+            if wallet:
+                wallet.credit_amount(order.total_price)
+            
+            # Notify shop owner of cancellation
+            create_notification(
+                user=order.shop.owner,
+                notification_type=Notification.NOTIFICATION_ORDER_CANCELLED,
+                title=f"Order #{order.id} Cancelled",
+                message=f"{request.user.username} cancelled their order for ₹{order.total_price}.",
+                link=f"/shops/owner/dashboard/"
+            )
+    
+    if cancelled:
         messages.success(request, "Order cancelled successfully.")
-    elif order.status in [Order.STATUS_PREPARING, Order.STATUS_READY]:
+        return redirect("orders:list")
+
+    order.refresh_from_db(fields=["status"])
+    if order.status in [Order.STATUS_PREPARING, Order.STATUS_READY]:
         messages.error(request, "Cannot cancel order - your food is already being prepared or is ready for pickup.")
     elif order.status == Order.STATUS_COLLECTED:
         messages.error(request, "Cannot cancel - order has already been collected.")
@@ -298,12 +286,18 @@ def extend_pickup_time(request, order_id):
             
             # Validate new pickup time
             is_valid, error_message = validate_pickup_time(order.shop, new_pickup_time)
+            if is_valid and new_pickup_time != order.pickup_time:
+                try:
+                    with transaction.atomic():
+                        reserve_slot(order.shop, new_pickup_time)
+                        release_slot(order.shop_id, order.pickup_time)
+                        order.pickup_time = new_pickup_time
+                        order.save(update_fields=["pickup_time"])
+                except SlotFullError:
+                    is_valid, error_message = False, "Selected time slot is full. Please choose another time."
             if not is_valid:
                 messages.error(request, error_message)
             else:
-                order.pickup_time = new_pickup_time
-                order.save(update_fields=["pickup_time"])
-                
                 # Notify shop owner of time extension
                 create_notification(
                     user=order.shop.owner,
@@ -329,37 +323,41 @@ def update_status(request, order_id):
         new_status = request.POST.get("status")
         if new_status in dict(Order.STATUS_CHOICES):
             old_status = order.status
-            order.status = new_status
-            order.save(update_fields=["status"])
-
-            if new_status == Order.STATUS_COLLECTED:
-                wallet = get_or_create_wallet(getattr(order.user, "profile", None))
-                if wallet:
-                    wallet.release_amount(COD_WALLET_HOLD)
-            
-            # Notify user of status change
-            status_messages = {
-                Order.STATUS_PREPARING: "Your order is being prepared!",
-                Order.STATUS_READY: "Your order is ready for pickup!",
-                Order.STATUS_COLLECTED: "Thank you! Order marked as collected.",
-            }
-            
-            notification_types = {
-                Order.STATUS_PREPARING: Notification.NOTIFICATION_ORDER_PREPARING,
-                Order.STATUS_READY: Notification.NOTIFICATION_ORDER_READY,
-                Order.STATUS_COLLECTED: Notification.NOTIFICATION_ORDER_COMPLETED,
-            }
-            
-            if new_status in status_messages and old_status != new_status:
-                create_notification(
-                    user=order.user,
-                    notification_type=notification_types[new_status],
-                    title=f"Order #{order.id} Status Update",
-                    message=status_messages[new_status],
-                    link=f"/orders/"
-                )
+            with transaction.atomic():
+                # Only move the order from the status it was read with; a concurrent
+                # change (e.g. the customer cancelling) makes this update a no-op
+                changed = Order.objects.filter(pk=order.pk, status=old_status).update(status=new_status)
+                if changed:
+                    order.status = new_status
+                    record_status_change(order, old_status)
+                    update_slot_for_status(order, old_status)
+                    
+                    # Notify user of status change
+                    status_messages = {
+                        Order.STATUS_PREPARING: "Your order is being prepared!",
+                        Order.STATUS_READY: "Your order is ready for pickup!",
+                        Order.STATUS_COLLECTED: "Thank you! Order marked as collected.",
+                    }
+                    
+                    notification_types = {
+                        Order.STATUS_PREPARING: Notification.NOTIFICATION_ORDER_PREPARING,
+                        Order.STATUS_READY: Notification.NOTIFICATION_ORDER_READY,
+                        Order.STATUS_COLLECTED: Notification.NOTIFICATION_ORDER_COMPLETED,
+                    }
+                    
+                    if new_status in status_messages and old_status != new_status:
+                        create_notification(
+                            user=order.user,
+                            notification_type=notification_types[new_status],
+                            title=f"Order #{order.id} Status Update",
+                            message=status_messages[new_status],
+                            link=f"/orders/"
+                        )
             
-            messages.success(request, "Order status updated.")
+            if changed:
+                messages.success(request, "Order status updated.")
+            else:
+                messages.error(request, "The order changed in the meantime. Please review it and try again.")
     return redirect("shops:owner_dashboard")
 
 
@@ -386,7 +384,14 @@ def submit_feedback(request, order_id):
             feedback.user = request.user
             feedback.shop = order.shop
             feedback.order = order
-            feedback.save()
+            try:
+                with transaction.atomic():
+                    feedback.save()
+                    record_feedback(feedback)
+            except IntegrityError:
+                # A concurrent submission for the same order got there first
+                messages.info(request, "You have already submitted feedback for this order.")
+                return redirect("orders:list")
             
             # Notify shop owner of new feedback
             create_notification(
@@ -416,3 +421,28 @@ def feedback_list(request):
         feedbacks = Feedback.objects.filter(user=request.user).select_related("shop", "order")
     
     return render(request, "orders/feedback_list.html", {"feedbacks": feedbacks})
+
+
+@login_required
+@shop_owner_required
+def export_orders(request):
+    """Stream the shop's order history as CSV or JSON Lines"""
+    shop = get_object_or_404(Shop, owner=request.user)
+    fmt = request.GET.get("format", "csv")
+    if fmt not in EXPORT_FORMATS:
+        return HttpResponseBadRequest("Unsupported export format.")
+    
+    try:
+        start_date = request.GET.get("start_date")
+        end_date = request.GET.get("end_date")
+        start_date = datetime.strptime(start_date, "%Y-%m-%d").date() if start_date else None
+        end_date = datetime.strptime(end_date, "%Y-%m-%d").date() if end_date else None
+    except ValueError:
+        return HttpResponseBadRequest("Dates must be in YYYY-MM-DD format.")
+    
+    orders = export_queryset(shop=shop, start_date=start_date, end_date=end_date)
+    content_type = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    response = StreamingHttpResponse(iter_export(fmt, orders), content_type=content_type)
+    filename = f"orders-{shop.id}-{timezone.localdate():%Y%m%d}.{fmt}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -0,0 +1,151 @@
+"""
+Incremental columnar warehouse dump for offline analysis.
+
+Each table is written as Parquet files partitioned by the local date rows were
+created on:
+
+    <root>/<table>/date=YYYY-MM-DD/part-<first id>-<last id>.parquet
+
+A per-table watermark (the highest primary key exported so far) is kept in
+<root>/_watermarks.json, so every run only reads rows created since the
+previous one. Rows of the current local day are left for the next run, which
+keeps day partitions closed once written and lets same-day status changes
+settle before an order is exported.
+
+Parquet needs pyarrow (or fastparquet), which is optional and not part of the
+web app's requirements.
+"""
+
+import importlib.util
+import json
+import os
+from datetime import datetime, time
+
+import pandas as pd
+from django.utils import timezone
+
+from accounts.models import WalletTopUp
+from payments.models import Payment
+
+from .models import Feedback, Order, OrderItem
+
+
+WATERMARK_FILE = "_watermarks.json"
+BATCH_SIZE = 50000
+
+# table -> (model, exported columns, column holding the creation time)
+WAREHOUSE_TABLES = {
+    "orders": (
+        Order,
+        ["id", "shop_id", "user_id", "status", "total_price", "token_number", "pickup_time", "created_at"],
+        "created_at",
+    ),
+    "order_items": (
+        OrderItem,
+        ["id", "order_id", "order__shop_id", "menu_item_id", "quantity", "price", "order__created_at"],
+        "order__created_at",
+    ),
+    "payments": (
+        Payment,
+        ["id", "order_id", "order__shop_id", "payment_method", "payment_status", "created_at"],
+        "created_at",
+    ),
+    "feedback": (
+        Feedback,
+        ["id", "order_id", "shop_id", "user_id", "rating", "comment", "created_at"],
+        "created_at",
+    ),
+    # The payer's UPI handle is left out on purpose
+    "wallet_topups": (
+        WalletTopUp,
+        ["id", "wallet_id", "wallet__profile__user_id", "amount", "payment_source", "reference_id", "created_at"],
+        "created_at",
+    ),
+}
+
+
+class ParquetUnavailable(Exception):
+    """Neither pyarrow nor fastparquet is installed"""
+
+
+def parquet_available():
+    return any(importlib.util.find_spec(engine) for engine in ("pyarrow", "fastparquet"))
+
+
+def read_watermarks(root):
+    path = os.path.join(root, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as handle:
+        return json.load(handle)
+
+
+def write_watermarks(root, watermarks):
+    # Write-then-rename so an interrupted run never leaves a truncated file
+    path = os.path.join(root, WATERMARK_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as handle:
+        json.dump(watermarks, handle, indent=2, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def default_cutoff():
+    """Start of the current local day"""
+    return timezone.make_aware(datetime.combine(timezone.localdate(), time.min))
+
+
+def iter_table_batches(table, after_id=0, cutoff=None, batch_size=BATCH_SIZE):
+    """
+    DataFrames of rows with id > after_id created before cutoff, in primary key
+    order, one keyset-paginated query per batch. Column names use "__" lookups
+    with the relation path dropped (order__shop_id -> shop_id).
+    """
+    model, columns, created_field = WAREHOUSE_TABLES[table]
+    names = [column.rsplit("__", 1)[-1] for column in columns]
+    rows = model.objects.order_by("id")
+    if cutoff is not None:
+        rows = rows.filter(**{f"{created_field}__lt": cutoff})
+
+    tz = timezone.get_current_timezone()
+    while True:
+        batch = list(rows.filter(id__gt=after_id).values_list(*columns)[:batch_size])
+        if not batch:
+            return
+        frame = pd.DataFrame.from_records(batch, columns=names)
+        created = pd.to_datetime(frame[names[columns.index(created_field)]], utc=True)
+        frame["date"] = created.dt.tz_convert(tz).dt.date.astype(str)
+        yield frame
+        after_id = int(frame["id"].iloc[-1])
+
+
+def write_partitions(root, table, frame):
+    """Write one batch, split into one file per date partition; returns the paths"""
+    paths = []
+    for day, rows in frame.groupby("date", sort=True):
+        directory = os.path.join(root, table, f"date={day}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"part-{rows['id'].iloc[0]}-{rows['id'].iloc[-1]}.parquet")
+        rows.drop(columns="date").to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def dump_warehouse(root, tables=None, cutoff=None, batch_size=BATCH_SIZE):
+    """
+    Append rows created since the last run to the warehouse at root.
+    Returns {table: rows written}. The watermark advances after every batch, so
+    an interrupted run resumes where it stopped.
+    """
+    if not parquet_available():
+        raise ParquetUnavailable("pyarrow or fastparquet is required to write Parquet files")
+    os.makedirs(root, exist_ok=True)
+    cutoff = cutoff or default_cutoff()
+    watermarks = read_watermarks(root)
+    written = {}
+    for table in tables or WAREHOUSE_TABLES:
+        written[table] = 0
+        for frame in iter_table_batches(table, watermarks.get(table, 0), cutoff, batch_size):
+            write_partitions(root, table, frame)
+            watermarks[table] = int(frame["id"].iloc[-1])
+            write_watermarks(root, watermarks)
+            written[table] += len(frame)
+    return written
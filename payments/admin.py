@@ -1,4 +1,7 @@
 from django.contrib import admin
+from django.db import transaction
+
+from shops.rollups import record_payment, record_payment_removed
 
 from .models import Payment, PaymentConfig
 
@@ -19,3 +22,25 @@ class PaymentConfigAdmin(admin.ModelAdmin):
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ("order", "payment_method", "payment_status", "created_at")
     list_filter = ("payment_method", "payment_status")
+
+    def save_model(self, request, obj, form, change):
+        """Move the payment between payment rollup rows, as OrderAdmin does for orders"""
+        with transaction.atomic():
+            if change:
+                record_payment_removed(Payment.objects.select_for_update().select_related("order").get(pk=obj.pk))
+            super().save_model(request, obj, form, change)
+            record_payment(obj)
+
+    def delete_model(self, request, obj):
+        with transaction.atomic():
+            self._forget_payments(Payment.objects.filter(pk=obj.pk))
+            super().delete_model(request, obj)
+
+    def delete_queryset(self, request, queryset):
+        with transaction.atomic():
+            self._forget_payments(queryset)
+            super().delete_queryset(request, queryset)
+
+    def _forget_payments(self, payments):
+        for payment in payments.select_for_update().select_related("order"):
+            record_payment_removed(payment)
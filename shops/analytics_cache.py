@@ -0,0 +1,50 @@
+"""
+Cross-request cache for ShopAnalyticsService results.
+
+Entries are namespaced by a per-shop data version kept in the database
+(ShopDataVersion). The rollup write hooks move the version inside the same
+transaction as the order, status change or feedback, so once the change is
+committed no process reads back a result computed from the old data, whatever
+the cache backend; entries of old versions simply expire. Results kept outside
+the cache (analytics snapshots) are checked against the same version.
+"""
+
+import hashlib
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import ShopDataVersion
+
+
+def get_data_version(shop_id):
+    """Current data version of a shop, as committed to the database"""
+    version = ShopDataVersion.objects.filter(shop_id=shop_id).values_list("version", flat=True).first()
+    return version or 0
+
+
+def bump_data_version_on_commit(shop_id):
+    """
+    Move the shop's data version inside the current transaction; other
+    processes see the new version once it commits
+    """
+    updates = {"version": F("version") + 1}
+    if ShopDataVersion.objects.filter(shop_id=shop_id).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            ShopDataVersion.objects.create(shop_id=shop_id, version=1)
+    except IntegrityError:
+        # A concurrent writer created the row first
+        ShopDataVersion.objects.filter(shop_id=shop_id).update(**updates)
+
+
+def get_cache_timeout():
+    return getattr(settings, "ANALYTICS_CACHE_TIMEOUT", 300)
+
+
+def make_cache_key(shop_id, data_version, name, *parts):
+    """Cache key for one analytics result computed from the given data version"""
+    digest = hashlib.md5(repr(parts).encode("utf-8")).hexdigest()
+    return f"analytics:{shop_id}:{data_version}:{name}:{digest}"
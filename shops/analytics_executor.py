@@ -0,0 +1,94 @@
+"""
+Opt-in concurrent execution of independent analytics panels.
+
+With ANALYTICS_PARALLEL_PANELS enabled the dashboard submits every panel to a
+bounded thread pool. Each worker thread uses its own database connection and
+closes it when the panel finishes. A panel that raises, or runs longer than
+ANALYTICS_PANEL_TIMEOUT seconds counted from when a worker starts it, is
+replaced by its fallback value and reported as unavailable instead of failing
+the whole page. Panels queued behind busy workers are not charged for the
+wait; the page as a whole is bounded by one timeout per round of workers.
+"""
+
+import logging
+import math
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class Panel:
+    """A deferred call to one analytics method plus the value shown if it fails"""
+
+    def __init__(self, func, *args, fallback=None, **kwargs):
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.fallback = {} if fallback is None else fallback
+
+    def __call__(self):
+        return self.func(*self.args, **self.kwargs)
+
+
+def _run_in_worker(panel, name, started):
+    started[name] = time.monotonic()
+    try:
+        return panel()
+    finally:
+        # Worker threads get their own connections; don't leak them back into the pool
+        connections.close_all()
+
+
+def run_panels(panels, parallel=None, max_workers=None, timeout=None):
+    """
+    Evaluate a dict of name -> Panel, allowing each panel `timeout` seconds
+    from when it starts running. Returns (results, unavailable) where
+    unavailable lists the panels that fell back.
+    """
+    if parallel is None:
+        parallel = getattr(settings, "ANALYTICS_PARALLEL_PANELS", False)
+    if not parallel:
+        return {name: panel() for name, panel in panels.items()}, []
+
+    max_workers = max_workers or getattr(settings, "ANALYTICS_PANEL_WORKERS", 4)
+    timeout = timeout or getattr(settings, "ANALYTICS_PANEL_TIMEOUT", 10)
+
+    results = {}
+    unavailable = []
+    started = {}
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analytics-panel")
+    try:
+        futures = {name: executor.submit(_run_in_worker, panel, name, started) for name, panel in panels.items()}
+        # A panel still waiting for a worker when every round could have run is given up too
+        page_deadline = time.monotonic() + timeout * math.ceil(len(panels) / max_workers)
+        pending = dict(futures)
+        while pending:
+            now = time.monotonic()
+            for name, future in list(pending.items()):
+                if future.done() and future.exception() is None:
+                    results[name] = future.result()
+                elif future.done():
+                    logger.warning("Analytics panel %s unavailable", name, exc_info=future.exception())
+                    results[name] = panels[name].fallback
+                    unavailable.append(name)
+                elif now >= (started[name] + timeout if name in started else page_deadline):
+                    logger.warning("Analytics panel %s unavailable: timed out", name)
+                    future.cancel()
+                    results[name] = panels[name].fallback
+                    unavailable.append(name)
+                else:
+                    continue
+                del pending[name]
+            if pending:
+                expiries = [started[name] + timeout for name in pending if name in started]
+                next_expiry = min(expiries + [page_deadline])
+                wait(pending.values(), timeout=max(0, next_expiry - time.monotonic()), return_when=FIRST_COMPLETED)
+    finally:
+        # Don't block the response on panels that overran their timeout
+        executor.shutdown(wait=False, cancel_futures=True)
+    return {name: results[name] for name in panels}, [name for name in panels if name in unavailable]
@@ -0,0 +1,232 @@
+"""
+Lazily-loaded analytics dashboard panels.
+
+The dashboard page renders only its filter shell; each panel is then fetched
+from its own JSON endpoint, which returns the rendered panel markup plus the
+series its charts are drawn from. Responses carry an ETag derived from the
+shop's analytics data version, the filter parameters and the current window
+hour, so a browser revalidating an unchanged panel gets a 304.
+"""
+
+import hashlib
+from datetime import datetime, timedelta
+
+from django.utils import timezone
+from django.utils.cache import quote_etag
+
+from .analytics_cache import make_cache_key
+from .analytics_executor import Panel
+
+
+REPORT_TYPES = ('hourly', 'daily', 'weekly', 'monthly')
+
+
+def get_analytics_params(request, now=None):
+    """Period, report type and date range selected by the dashboard filters"""
+    return parse_analytics_params(request.GET, now)
+
+
+def parse_analytics_params(query, now=None):
+    """Analytics filters from a query dict; relative periods end at now"""
+    now = now or timezone.now()
+    period = query.get('period', '30')  # Default 30 days
+    report_type = query.get('report', 'daily')  # daily, weekly, monthly, hourly
+    start_date_str = query.get('start_date')
+    end_date_str = query.get('end_date')
+    if report_type not in REPORT_TYPES:
+        report_type = 'daily'
+
+    # Determine date range
+    end_date = now
+
+    if start_date_str and end_date_str:
+        # Use custom date range
+        try:
+            start_date = timezone.make_aware(datetime.strptime(start_date_str, '%Y-%m-%d'))
+            end_date = timezone.make_aware(datetime.strptime(end_date_str, '%Y-%m-%d')).replace(hour=23, minute=59, second=59)
+            days = (end_date - start_date).days + 1
+        except ValueError:
+            # Fall back to period if date parsing fails
+            try:
+                days = int(period)
+            except ValueError:
+                days = 30
+            start_date = now - timedelta(days=days)
+    else:
+        # Use period
+        try:
+            days = int(period)
+        except ValueError:
+            days = 30
+        start_date = now - timedelta(days=days)
+
+    return {
+        'period': days,
+        'report_type': report_type,
+        'start_date': start_date,
+        'end_date': end_date,
+    }
+
+
+def _summary_panels(analytics, params):
+    return {
+        'summary': Panel(
+            analytics.get_summary_stats,
+            timezone.localdate(params['start_date']),
+            timezone.localdate(params['end_date']),
+        ),
+    }
+
+
+def _summary_charts(context):
+    stats = context['summary'].get('period_stats', {})
+    return {
+        'orderStatusChart': {
+            'labels': ['Pending', 'Preparing', 'Ready', 'Collected', 'Cancelled'],
+            'counts': [stats.get(key, 0) for key in ('pending', 'preparing', 'ready', 'collected', 'cancelled')],
+        },
+    }
+
+
+def _time_report_panels(analytics, params):
+    report_type = params['report_type']
+    if report_type == 'hourly':
+        time_report = Panel(analytics.get_hourly_report, 24)
+    elif report_type == 'weekly':
+        time_report = Panel(analytics.get_weekly_report, 4)
+    elif report_type == 'monthly':
+        time_report = Panel(analytics.get_monthly_report, 12)
+    else:  # daily
+        time_report = Panel(analytics.get_daily_report, min(params['period'], analytics.MAX_DAILY_REPORT_DAYS))
+    return {'time_report': time_report}
+
+
+TIME_REPORT_SERIES = {
+    'hourly': ('hourly_data', 'hour_label'),
+    'daily': ('daily_data', 'date_label'),
+    'weekly': ('weekly_data', 'week_label'),
+    'monthly': ('monthly_data', 'month'),
+}
+
+
+def _time_report_charts(context):
+    data_key, label_key = TIME_REPORT_SERIES[context['report_type']]
+    rows = context['time_report'].get(data_key, [])
+    return {
+        'trend': {
+            'labels': [row[label_key] for row in rows],
+            'revenue': [float(row['revenue'] or 0) for row in rows],
+            'orders': [row['total_orders'] or 0 for row in rows],
+        },
+    }
+
+
+def _item_panels(analytics, params):
+    return {
+        'most_ordered': Panel(analytics.get_most_ordered_items, params['period'], limit=10, fallback=[]),
+        'least_sold': Panel(analytics.get_least_sold_items, params['period'], limit=10, fallback=[]),
+    }
+
+
+def _item_charts(context):
+    top_items = context['most_ordered'][:10]
+    return {
+        'topItemsChart': {
+            'labels': [item['menu_item__name'] for item in top_items],
+            'quantities': [item['total_quantity'] for item in top_items],
+            'revenues': [float(item['total_revenue'] or 0) for item in top_items],
+        },
+    }
+
+
+def _order_value_panels(analytics, params):
+    return {
+        'order_values': Panel(
+            analytics.get_order_value_stats,
+            timezone.localdate(params['start_date']),
+            timezone.localdate(params['end_date']),
+        ),
+    }
+
+
+def _payment_panels(analytics, params):
+    return {'payment_analysis': Panel(analytics.get_payment_method_analysis, params['period'])}
+
+
+def _payment_charts(context):
+    methods = context['payment_analysis'].get('methods', [])
+    return {
+        'paymentMethodChart': {
+            'labels': [method['method'] for method in methods],
+            'counts': [method['count'] for method in methods],
+        },
+    }
+
+
+def _peak_hour_panels(analytics, params):
+    return {
+        'peak_hours': Panel(analytics.get_peak_hours_analysis, params['period']),
+        'peak_heatmap': Panel(analytics.get_weekday_hour_heatmap, params['period']),
+    }
+
+
+def _staffing_panels(analytics, params):
+    return {'staffing': Panel(analytics.get_staffing_plan)}
+
+
+def _customer_panels(analytics, params):
+    return {'customer_segments': Panel(analytics.get_customer_segments)}
+
+
+def _customer_charts(context):
+    segments = context['customer_segments'].get('segments', [])
+    return {
+        'customerSegmentChart': {
+            'labels': [segment['name'] for segment in segments],
+            'counts': [segment['customers'] for segment in segments],
+        },
+    }
+
+
+def _insight_panels(analytics, params):
+    # Reuses the other panels' results through the shared analytics cache
+    return {'ml_insights': Panel(analytics.get_ml_insights, params['period'], fallback=[])}
+
+
+def _no_charts(context):
+    return {}
+
+
+# name -> (fragment template, panels to compute, chart series)
+PANELS = {
+    'summary': ('shops/analytics/summary.html', _summary_panels, _summary_charts),
+    'time-report': ('shops/analytics/time_report.html', _time_report_panels, _time_report_charts),
+    'items': ('shops/analytics/items.html', _item_panels, _item_charts),
+    'order-values': ('shops/analytics/order_values.html', _order_value_panels, _no_charts),
+    'payments': ('shops/analytics/payments.html', _payment_panels, _payment_charts),
+    'peak-hours': ('shops/analytics/peak_hours.html', _peak_hour_panels, _no_charts),
+    'staffing': ('shops/analytics/staffing.html', _staffing_panels, _no_charts),
+    'customers': ('shops/analytics/customers.html', _customer_panels, _customer_charts),
+    'insights': ('shops/analytics/insights.html', _insight_panels, _no_charts),
+}
+
+
+def panel_etag(analytics, panel, params, snapshot=None):
+    """
+    Validator for one panel response. Changes whenever the shop's data version,
+    the filters, the analytics engine, the hour the windows end in or the
+    precomputed snapshot served changes.
+    """
+    key = make_cache_key(
+        analytics.shop.id,
+        analytics.data_version,
+        f'panel:{panel}',
+        analytics.backend,
+        snapshot.computed_at.isoformat() if snapshot else None,
+        analytics._window_anchor(),
+        params['period'],
+        params['report_type'],
+        timezone.localdate(params['start_date']),
+        timezone.localdate(params['end_date']),
+    )
+    return quote_etag(hashlib.md5(key.encode('utf-8')).hexdigest())
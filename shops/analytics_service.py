@@ -3,12 +3,165 @@ Advanced Analytics Service for Shop Performance Analysis
 Includes ML and Data Science features for comprehensive business insights
 """
 
-from collections import defaultdict
-from datetime import datetime, timedelta
+from datetime import date, datetime, time, timedelta
 from decimal import Decimal
-from django.db.models import Count, Sum, Avg, Q, F
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import DateField, DecimalField, F, FilteredRelation, Q, Sum, Value
+from django.db.models.functions import Coalesce, ExtractHour, ExtractIsoWeekDay, Trunc
 from django.utils import timezone
+import calendar
+import inspect
+import math
 import statistics
+import threading
+
+import numpy as np
+
+from .analytics_cache import get_cache_timeout, get_data_version, make_cache_key
+from .models import (
+    ShopDayItemRollup,
+    ShopDayPaymentRollup,
+    ShopDayRatingRollup,
+    ShopDayRollup,
+    ShopHourRollup,
+)
+
+
+_MISSING = object()
+
+
+def _to_json(value):
+    """Panel result -> JSON-safe value; types JSON lacks are tagged so _from_json restores them"""
+    if isinstance(value, dict):
+        return {key: _to_json(item) for key, item in value.items()}
+    if isinstance(value, (list, np.ndarray)):
+        return [_to_json(item) for item in value]
+    if isinstance(value, tuple):
+        return {"__tuple__": [_to_json(item) for item in value]}
+    if isinstance(value, Decimal):
+        return {"__decimal__": str(value)}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, date):
+        return {"__date__": value.isoformat()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _parse_datetime(value):
+    value = datetime.fromisoformat(value)
+    return timezone.localtime(value) if timezone.is_aware(value) else value
+
+
+_JSON_TAGS = {
+    "__tuple__": lambda items: tuple(_from_json(item) for item in items),
+    "__decimal__": Decimal,
+    "__datetime__": _parse_datetime,
+    "__date__": date.fromisoformat,
+}
+
+
+def _from_json(value):
+    if isinstance(value, list):
+        return [_from_json(item) for item in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            tag, item = next(iter(value.items()))
+            if tag in _JSON_TAGS:
+                return _JSON_TAGS[tag](item)
+        return {key: _from_json(item) for key, item in value.items()}
+    return value
+
+
+def memoized(method):
+    """
+    Cache a panel method's result on the service instance and, unless disabled,
+    in the shared Django cache under the shop's current data version.
+    Calls are keyed by method name plus the bound arguments (defaults applied), so
+    get_daily_report(30) and get_daily_report(days=30) share one entry; windows are
+    always resolved against the instance's pinned `now`.
+    """
+    signature = inspect.signature(method)
+    
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        bound = signature.bind(self, *args, **kwargs)
+        bound.apply_defaults()
+        key = (method.__name__,) + tuple(bound.arguments.items())[1:]
+        with self._memo_lock:
+            if key in self._memo:
+                self.memo_stats['hits'] += 1
+                return self._memo[key]
+            self.memo_stats['misses'] += 1
+        
+        cache_key = None
+        if self.cache_timeout:
+            cache_key = make_cache_key(
+                self.shop.id, self.data_version, method.__name__, self.backend, self._window_anchor(), key[1:]
+            )
+            result = cache.get(cache_key, _MISSING)
+            with self._memo_lock:
+                if result is not _MISSING:
+                    self.cache_stats['hits'] += 1
+                    self._memo[key] = result
+                    return result
+                self.cache_stats['misses'] += 1
+        
+        result = method(self, *args, **kwargs)
+        with self._memo_lock:
+            self._memo[key] = result
+        if cache_key:
+            cache.set(cache_key, result, self.cache_timeout)
+        return result
+    
+    return wrapper
+
+
+def get_analytics_service(shop, **kwargs):
+    """Analytics service for a shop using the engine selected by ANALYTICS_BACKEND"""
+    if getattr(settings, 'ANALYTICS_BACKEND', 'rollups') == 'numpy':
+        from .analytics_numpy import NumpyShopAnalyticsService
+        return NumpyShopAnalyticsService(shop, **kwargs)
+    return ShopAnalyticsService(shop, **kwargs)
+
+
+def _truncate(value, granularity):
+    """Floor a naive local datetime to the start of its hour/day/week/month bucket"""
+    if granularity == 'hour':
+        return value.replace(minute=0, second=0, microsecond=0)
+    value = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'week':
+        return value - timedelta(days=value.weekday())
+    if granularity == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def _bucket_key(value, tz):
+    """Naive local bucket start for a truncated date or aware datetime"""
+    if isinstance(value, datetime):
+        return timezone.make_naive(value, tz)
+    return datetime.combine(value, time.min)
+
+
+def _shift_months(value, months):
+    """Move a month-aligned datetime by a number of calendar months"""
+    month_index = value.year * 12 + value.month - 1 + months
+    return value.replace(year=month_index // 12, month=month_index % 12 + 1)
+
+
+def _next_bucket(value, granularity):
+    """Start of the bucket following the given bucket start"""
+    if granularity == 'hour':
+        return value + timedelta(hours=1)
+    if granularity == 'week':
+        return value + timedelta(weeks=1)
+    if granularity == 'month':
+        return _shift_months(value, 1)
+    return value + timedelta(days=1)
 
 
 class ShopAnalyticsService:
@@ -17,12 +170,56 @@ class ShopAnalyticsService:
     Provides ML-based insights and data-driven recommendations
     """
     
-    def __init__(self, shop):
+    backend = 'rollups'
+    
+    # Longest window rendered as one row per day on the dashboard
+    MAX_DAILY_REPORT_DAYS = 90
+    
+    def __init__(self, shop, now=None, use_cache=True):
         self.shop = shop
+        # Every window is resolved against the same instant so memoized panels agree
+        self.now = now or timezone.now()
+        self.cache_timeout = get_cache_timeout() if use_cache else 0
+        self._memo = {}
+        # Panels may run on several threads (see analytics_executor)
+        self._memo_lock = threading.Lock()
+        self.memo_stats = {'hits': 0, 'misses': 0}
+        self.cache_stats = {'hits': 0, 'misses': 0}
+        self._data_version = None
+    
+    @property
+    def data_version(self):
+        """Shop data version the shared cache entries are keyed on, read once per service"""
+        with self._memo_lock:
+            if self._data_version is None:
+                self._data_version = get_data_version(self.shop.id)
+            return self._data_version
+    
+    def export_results(self, exclude=()):
+        """
+        Results memoized so far as JSON-safe [key, result] pairs (see
+        analytics_snapshots), leaving out the methods named in exclude
+        """
+        with self._memo_lock:
+            return [
+                [_to_json(key), _to_json(result)]
+                for key, result in self._memo.items()
+                if key[0] not in exclude
+            ]
+    
+    def preload_results(self, results):
+        """Reuse results exported by a service pinned to the same `now`"""
+        restored = {_from_json(key): _from_json(result) for key, result in results}
+        with self._memo_lock:
+            self._memo.update(restored)
+    
+    def _window_anchor(self):
+        """Local clock hour that all relative windows are measured from"""
+        return timezone.localtime(self.now).strftime('%Y-%m-%d %H')
     
     def get_time_range(self, period_type='daily', days=None):
         """Get time range based on period type"""
-        now = timezone.now()
+        now = self.now
         
         if period_type == 'hourly':
             start_date = now - timedelta(days=1)  # Last 24 hours
@@ -37,117 +234,78 @@ class ShopAnalyticsService:
         
         return start_date, now
     
+    def _window_start_date(self, period_days):
+        """First local calendar day covered by a 'last N days' window"""
+        return timezone.localdate(self.now - timedelta(days=period_days))
+    
+    @memoized
     def get_most_ordered_items(self, period_days=30, limit=10):
         """
         Analyze most ordered items with quantity, revenue, and frequency metrics
         """
-        from orders.models import OrderItem, Order
-        
-        start_date = timezone.now() - timedelta(days=period_days)
-        
-        items = (
-            OrderItem.objects
-            .filter(
-                order__shop=self.shop,
-                order__created_at__gte=start_date,
-                order__status=Order.STATUS_COLLECTED
-            )
+        items = list(
+            ShopDayItemRollup.objects
+            .filter(shop=self.shop, date__gte=self._window_start_date(period_days))
             .values('menu_item__id', 'menu_item__name', 'menu_item__category__name')
             .annotate(
                 total_quantity=Sum('quantity'),
-                total_revenue=Sum(F('quantity') * F('price')),
-                order_count=Count('order', distinct=True),
-                avg_quantity_per_order=Avg('quantity')
+                total_revenue=Sum('revenue'),
+                order_count=Sum('order_count')
             )
+            .filter(total_quantity__gt=0)
             .order_by('-total_quantity')[:limit]
         )
         
-        return list(items)
+        for item in items:
+            item['avg_quantity_per_order'] = item['total_quantity'] / item['order_count'] if item['order_count'] else 0
+        
+        return items
     
+    @memoized
     def get_least_sold_items(self, period_days=30, limit=10):
         """
-        Identify least sold items that might need promotion or removal
+        Identify least sold items that might need promotion or removal.
+        One query over the available menu, left-joined to the window's item rollups,
+        so unsold items come back with zero totals.
         """
-        from orders.models import OrderItem, Order
         from menu.models import MenuItem
         
-        start_date = timezone.now() - timedelta(days=period_days)
-        
-        # Get all available menu items
-        all_items = MenuItem.objects.filter(shop=self.shop, is_available=True)
-        
-        # Get items with their sales
-        items_with_sales = (
-            OrderItem.objects
-            .filter(
-                order__shop=self.shop,
-                order__created_at__gte=start_date,
-                order__status=Order.STATUS_COLLECTED
-            )
-            .values('menu_item__id', 'menu_item__name', 'menu_item__category__name')
+        window_sales = FilteredRelation(
+            'day_rollups',
+            condition=Q(day_rollups__date__gte=self._window_start_date(period_days))
+        )
+        items = (
+            MenuItem.objects
+            .filter(shop=self.shop, is_available=True)
+            .annotate(window_sales=window_sales)
+            .values('id', 'name', 'category__name')
             .annotate(
-                total_quantity=Sum('quantity'),
-                total_revenue=Sum(F('quantity') * F('price')),
-                order_count=Count('order', distinct=True)
+                total_quantity=Coalesce(Sum('window_sales__quantity'), 0),
+                total_revenue=Coalesce(Sum('window_sales__revenue'), Value(Decimal('0.00')), output_field=DecimalField()),
+                order_count=Coalesce(Sum('window_sales__order_count'), 0)
             )
-            .order_by('total_quantity')[:limit]
+            .order_by('total_quantity', 'name')[:limit]
         )
         
-        # Also find items with zero sales
-        items_with_sales_ids = OrderItem.objects.filter(
-            order__shop=self.shop,
-            order__created_at__gte=start_date
-        ).values_list('menu_item__id', flat=True).distinct()
-        
-        zero_sales_items = all_items.exclude(id__in=items_with_sales_ids).values(
-            'id', 'name', 'category__name', 'price'
-        )[:limit]
-        
-        # Combine and format
-        least_sold = []
-        
-        for item in zero_sales_items:
-            least_sold.append({
+        return [
+            {
                 'menu_item__id': item['id'],
                 'menu_item__name': item['name'],
                 'menu_item__category__name': item['category__name'],
-                'total_quantity': 0,
-                'total_revenue': Decimal('0.00'),
-                'order_count': 0,
-                'status': 'No sales'
-            })
-        
-        for item in items_with_sales:
-            if len(least_sold) < limit:
-                item['status'] = 'Low sales'
-                least_sold.append(item)
-        
-        return least_sold[:limit]
+                'total_quantity': item['total_quantity'],
+                'total_revenue': item['total_revenue'],
+                'order_count': item['order_count'],
+                'status': 'Low sales' if item['total_quantity'] else 'No sales'
+            }
+            for item in items
+        ]
     
+    @memoized
     def get_payment_method_analysis(self, period_days=30):
         """
         Analyze payment method preferences with detailed breakdown
         """
-        from payments.models import Payment
-        from orders.models import Order
-        
-        start_date = timezone.now() - timedelta(days=period_days)
-        
-        payment_stats = (
-            Payment.objects
-            .filter(
-                order__shop=self.shop,
-                order__created_at__gte=start_date,
-                payment_status=Payment.STATUS_PAID
-            )
-            .values('payment_method')
-            .annotate(
-                count=Count('id'),
-                total_amount=Sum('order__total_price'),
-                avg_amount=Avg('order__total_price')
-            )
-            .order_by('-count')
-        )
+        payment_stats = self._payment_totals(period_days)
         
         total_payments = sum(stat['count'] for stat in payment_stats)
         
@@ -166,7 +324,7 @@ class ShopAnalyticsService:
                 'count': stat['count'],
                 'percentage': round(percentage, 2),
                 'total_amount': stat['total_amount'] or Decimal('0.00'),
-                'avg_amount': stat['avg_amount'] or Decimal('0.00')
+                'avg_amount': (stat['total_amount'] or Decimal('0.00')) / stat['count']
             })
         
         return {
@@ -175,25 +333,59 @@ class ShopAnalyticsService:
             'most_used': payment_data[0] if payment_data else None
         }
     
+    def _payment_totals(self, period_days):
+        """Paid transactions and amount per payment method, most used first"""
+        return list(
+            ShopDayPaymentRollup.objects
+            .filter(shop=self.shop, date__gte=self._window_start_date(period_days))
+            .values('payment_method')
+            .annotate(
+                count=Sum('payment_count'),
+                total_amount=Sum('total_amount')
+            )
+            .filter(count__gt=0)
+            .order_by('-count')
+        )
+    
+    def _hour_rollups_in_window(self, period_days):
+        start_date = timezone.make_aware(datetime.combine(self._window_start_date(period_days), time.min))
+        return ShopHourRollup.objects.filter(shop=self.shop, hour_start__gte=start_date)
+    
+    def _hour_of_day_counts(self, period_days):
+        """Orders per local hour of day, grouped in the database (at most 24 rows)"""
+        tz = timezone.get_current_timezone()
+        return dict(
+            self._hour_rollups_in_window(period_days)
+            .annotate(hour=ExtractHour('hour_start', tzinfo=tz))
+            .values('hour')
+            .annotate(count=Sum('total_orders'))
+            .values_list('hour', 'count')
+            .order_by()
+        )
+    
+    def _weekday_hour_counts(self, period_days):
+        """Orders per (ISO weekday, hour), grouped in the database (at most 7 x 24 rows)"""
+        tz = timezone.get_current_timezone()
+        return {
+            (row['weekday'], row['hour']): row['count']
+            for row in (
+                self._hour_rollups_in_window(period_days)
+                .annotate(
+                    weekday=ExtractIsoWeekDay('hour_start', tzinfo=tz),
+                    hour=ExtractHour('hour_start', tzinfo=tz)
+                )
+                .values('weekday', 'hour')
+                .annotate(count=Sum('total_orders'))
+                .order_by()
+            )
+        }
+    
+    @memoized
     def get_peak_hours_analysis(self, period_days=30):
         """
         Identify peak hours for orders using time-series analysis
         """
-        from orders.models import Order
-        
-        start_date = timezone.now() - timedelta(days=period_days)
-        
-        # Get all orders in the period
-        orders = Order.objects.filter(
-            shop=self.shop,
-            created_at__gte=start_date
-        ).values_list('created_at', flat=True)
-        
-        # Analyze by hour of day
-        hourly_distribution = defaultdict(int)
-        for order_time in orders:
-            hour = order_time.hour
-            hourly_distribution[hour] += 1
+        hourly_distribution = self._hour_of_day_counts(period_days)
         
         # Format hourly data
         hourly_data = []
@@ -220,38 +412,110 @@ class ShopAnalyticsService:
             'busiest_hour': peak_hours[0] if peak_hours else None
         }
     
+    @memoized
+    def get_weekday_hour_heatmap(self, period_days=30):
+        """
+        Orders per day of week and hour of day (7 x 24 grid)
+        """
+        counts = self._weekday_hour_counts(period_days)
+        max_count = max(counts.values(), default=0)
+        
+        days = []
+        for weekday, day_name in enumerate(calendar.day_name, start=1):
+            hours = []
+            for hour in range(24):
+                count = counts.get((weekday, hour), 0)
+                hours.append({
+                    'hour': hour,
+                    'count': count,
+                    'intensity': round(count / max_count, 2) if max_count else 0
+                })
+            days.append({'weekday': weekday, 'day_name': day_name, 'hours': hours})
+        
+        return {'days': days, 'max_count': max_count}
+    
+    def _bucket_totals(self, granularity, first_bucket, end):
+        """
+        Orders, completed orders and revenue per bucket in one grouped query over the
+        hour/day rollups, keyed by naive local bucket start. Empty buckets are absent.
+        """
+        tz = timezone.get_current_timezone()
+        
+        if granularity == 'hour':
+            rollups = ShopHourRollup.objects.filter(
+                shop=self.shop,
+                hour_start__gte=timezone.make_aware(first_bucket, tz),
+                hour_start__lte=end
+            )
+            bucket = Trunc('hour_start', 'hour', tzinfo=tz)
+        else:
+            rollups = ShopDayRollup.objects.filter(
+                shop=self.shop,
+                date__gte=first_bucket.date(),
+                date__lte=timezone.localtime(end, tz).date()
+            )
+            bucket = Trunc('date', granularity, output_field=DateField())
+        
+        rows = (
+            rollups
+            .annotate(bucket=bucket)
+            .values('bucket')
+            .annotate(
+                total_orders=Sum('total_orders'),
+                completed_orders=Sum('collected_orders'),
+                revenue=Sum('revenue')
+            )
+            .order_by()
+        )
+        return {_bucket_key(row['bucket'], tz): row for row in rows}
+    
+    def _bucket_series(self, granularity, start, end):
+        """
+        Orders, completed orders, revenue and AOV per time bucket between start and end.
+        Buckets are aligned to the local timezone and gaps are zero-filled.
+        """
+        tz = timezone.get_current_timezone()
+        first_bucket = _truncate(timezone.localtime(start, tz).replace(tzinfo=None), granularity)
+        last_bucket = _truncate(timezone.localtime(end, tz).replace(tzinfo=None), granularity)
+        totals = self._bucket_totals(granularity, first_bucket, end)
+        
+        series = []
+        bucket = first_bucket
+        while bucket <= last_bucket:
+            row = totals.get(bucket, {})
+            completed_orders = row.get('completed_orders', 0)
+            revenue = row.get('revenue') or Decimal('0.00')
+            series.append({
+                'start': bucket,
+                'total_orders': row.get('total_orders', 0),
+                'completed_orders': completed_orders,
+                'revenue': revenue,
+                'avg_order_value': revenue / completed_orders if completed_orders > 0 else Decimal('0.00')
+            })
+            bucket = _next_bucket(bucket, granularity)
+        
+        return series
+    
+    @memoized
     def get_daily_report(self, days=30):
         """
         Daily performance report with trends
         """
-        from orders.models import Order
-        
-        start_date = timezone.now() - timedelta(days=days)
-        end_date = timezone.now()
+        end_date = self.now
+        start_date = end_date - timedelta(days=days)
         
         daily_data = []
-        current_date = start_date.date()
-        
-        while current_date <= end_date.date():
-            orders = Order.objects.filter(
-                shop=self.shop,
-                created_at__date=current_date
-            )
-            
-            completed = orders.filter(status=Order.STATUS_COLLECTED)
-            revenue = completed.aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-            
+        for bucket in self._bucket_series('day', start_date, end_date):
+            current_date = bucket['start'].date()
             daily_data.append({
                 'date': current_date,
                 'date_label': current_date.strftime('%Y-%m-%d'),
                 'day_name': current_date.strftime('%A'),
-                'total_orders': orders.count(),
-                'completed_orders': completed.count(),
-                'revenue': revenue,
-                'avg_order_value': revenue / completed.count() if completed.count() > 0 else Decimal('0.00')
+                'total_orders': bucket['total_orders'],
+                'completed_orders': bucket['completed_orders'],
+                'revenue': bucket['revenue'],
+                'avg_order_value': bucket['avg_order_value']
             })
-            
-            current_date += timedelta(days=1)
         
         # Calculate trend
         if len(daily_data) >= 7:
@@ -267,117 +531,142 @@ class ShopAnalyticsService:
             'trend_direction': 'up' if trend > 0 else 'down' if trend < 0 else 'stable'
         }
     
+    @memoized
     def get_weekly_report(self, weeks=4):
         """
-        Weekly aggregated performance report
+        Weekly aggregated performance report (calendar weeks starting Monday)
         """
-        from orders.models import Order
+        now = self.now
+        local_now = timezone.localtime(now).replace(tzinfo=None)
+        start_date = timezone.make_aware(_truncate(local_now, 'week') - timedelta(weeks=weeks - 1))
         
         weekly_data = []
-        now = timezone.now()
-        
-        for i in range(weeks):
-            week_end = now - timedelta(weeks=i)
-            week_start = week_end - timedelta(days=7)
-            
-            orders = Order.objects.filter(
-                shop=self.shop,
-                created_at__gte=week_start,
-                created_at__lt=week_end
-            )
-            
-            completed = orders.filter(status=Order.STATUS_COLLECTED)
-            revenue = completed.aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-            
+        for bucket in self._bucket_series('week', start_date, now):
+            week_start = bucket['start'].date()
+            week_end = week_start + timedelta(days=6)
             weekly_data.append({
-                'week_start': week_start.date(),
-                'week_end': week_end.date(),
+                'week_start': week_start,
+                'week_end': week_end,
                 'week_label': f"{week_start.strftime('%b %d')} - {week_end.strftime('%b %d')}",
-                'total_orders': orders.count(),
-                'completed_orders': completed.count(),
-                'revenue': revenue,
-                'avg_daily_orders': orders.count() / 7
+                'total_orders': bucket['total_orders'],
+                'completed_orders': bucket['completed_orders'],
+                'revenue': bucket['revenue'],
+                'avg_daily_orders': bucket['total_orders'] / 7
             })
         
-        weekly_data.reverse()
         return {'weekly_data': weekly_data}
     
+    @memoized
     def get_monthly_report(self, months=12):
         """
         Monthly performance report with year-over-year comparison
         """
-        from orders.models import Order
+        now = self.now
+        local_now = timezone.localtime(now).replace(tzinfo=None)
+        start_date = timezone.make_aware(_shift_months(_truncate(local_now, 'month'), -(months - 1)))
         
         monthly_data = []
-        now = timezone.now()
-        
-        for i in range(months):
-            # Calculate month start and end
-            if i == 0:
-                month_end = now
-                month_start = now.replace(day=1)
-            else:
-                month_end = (now.replace(day=1) - timedelta(days=1))
-                for _ in range(i - 1):
-                    month_end = (month_end.replace(day=1) - timedelta(days=1))
-                month_start = month_end.replace(day=1)
-            
-            orders = Order.objects.filter(
-                shop=self.shop,
-                created_at__gte=month_start,
-                created_at__lt=month_end + timedelta(days=1)
-            )
-            
-            completed = orders.filter(status=Order.STATUS_COLLECTED)
-            revenue = completed.aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-            
+        for bucket in self._bucket_series('month', start_date, now):
+            month_start = bucket['start']
             monthly_data.append({
                 'month': month_start.strftime('%B %Y'),
                 'month_short': month_start.strftime('%b %Y'),
                 'year': month_start.year,
                 'month_num': month_start.month,
-                'total_orders': orders.count(),
-                'completed_orders': completed.count(),
-                'revenue': revenue,
-                'avg_order_value': revenue / completed.count() if completed.count() > 0 else Decimal('0.00')
+                'total_orders': bucket['total_orders'],
+                'completed_orders': bucket['completed_orders'],
+                'revenue': bucket['revenue'],
+                'avg_order_value': bucket['avg_order_value']
             })
         
-        monthly_data.reverse()
         return {'monthly_data': monthly_data}
     
+    @memoized
     def get_hourly_report(self, hours=24):
         """
-        Hourly report for the last 24 hours
+        Hourly report for the last 24 hours (including the current hour)
         """
-        from orders.models import Order
+        now = self.now
+        local_now = timezone.localtime(now).replace(tzinfo=None)
+        start_date = timezone.make_aware(_truncate(local_now, 'hour') - timedelta(hours=hours - 1))
         
         hourly_data = []
-        now = timezone.now()
-        
-        for i in range(hours):
-            hour_end = now - timedelta(hours=i)
-            hour_start = hour_end - timedelta(hours=1)
-            
-            orders = Order.objects.filter(
-                shop=self.shop,
-                created_at__gte=hour_start,
-                created_at__lt=hour_end
-            )
-            
-            completed = orders.filter(status=Order.STATUS_COLLECTED)
-            revenue = completed.aggregate(total=Sum('total_price'))['total'] or Decimal('0.00')
-            
+        for bucket in self._bucket_series('hour', start_date, now):
+            hour_start = timezone.make_aware(bucket['start'])
             hourly_data.append({
                 'hour_start': hour_start,
                 'hour_label': hour_start.strftime('%I:%M %p'),
-                'total_orders': orders.count(),
-                'completed_orders': completed.count(),
-                'revenue': revenue
+                'total_orders': bucket['total_orders'],
+                'completed_orders': bucket['completed_orders'],
+                'revenue': bucket['revenue']
             })
         
-        hourly_data.reverse()
         return {'hourly_data': hourly_data}
     
+    @memoized
+    def get_summary_stats(self, start_day, end_day):
+        """
+        Headline numbers for a range of local days: status breakdown, revenue against
+        the preceding period of equal length, all-time revenue and the rating histogram.
+        Uses two conditional-aggregation queries regardless of the range length.
+        """
+        period_length = (end_day - start_day).days + 1
+        previous_start = start_day - timedelta(days=period_length)
+        current = Q(date__gte=start_day, date__lte=end_day)
+        previous = Q(date__gte=previous_start, date__lt=start_day)
+        
+        order_totals = ShopDayRollup.objects.filter(shop=self.shop).aggregate(
+            total_orders=Sum('total_orders', filter=current),
+            pending=Sum('pending_orders', filter=current),
+            preparing=Sum('preparing_orders', filter=current),
+            ready=Sum('ready_orders', filter=current),
+            collected=Sum('collected_orders', filter=current),
+            cancelled=Sum('cancelled_orders', filter=current),
+            total_revenue=Sum('revenue', filter=current),
+            previous_revenue=Sum('revenue', filter=previous),
+            all_time_revenue=Sum('revenue')
+        )
+        
+        rating_filter = Q(date__gte=start_day, date__lte=end_day)
+        rating_totals = ShopDayRatingRollup.objects.filter(shop=self.shop).aggregate(
+            total=Sum('feedback_count', filter=rating_filter),
+            weighted=Sum(F('rating') * F('feedback_count'), filter=rating_filter),
+            **{
+                str(rating): Sum('feedback_count', filter=rating_filter & Q(rating=rating))
+                for rating in range(5, 0, -1)
+            }
+        )
+        
+        period_stats = {
+            status: order_totals[status] or 0
+            for status in ('total_orders', 'pending', 'preparing', 'ready', 'collected', 'cancelled')
+        }
+        total_revenue = order_totals['total_revenue'] or Decimal('0.00')
+        previous_revenue = order_totals['previous_revenue'] or Decimal('0.00')
+        
+        # Calculate revenue growth percentage
+        if previous_revenue > 0:
+            revenue_growth = ((total_revenue - previous_revenue) / previous_revenue) * 100
+        else:
+            revenue_growth = 100 if total_revenue > 0 else 0
+        
+        total_feedbacks = rating_totals['total'] or 0
+        
+        return {
+            'period_stats': period_stats,
+            'total_revenue': total_revenue,
+            'avg_order_value': total_revenue / period_stats['collected'] if period_stats['collected'] else Decimal('0.00'),
+            'previous_revenue': previous_revenue,
+            'revenue_growth': revenue_growth,
+            'all_time_revenue': order_totals['all_time_revenue'] or Decimal('0.00'),
+            'avg_rating': rating_totals['weighted'] / total_feedbacks if total_feedbacks else 0,
+            'total_feedbacks': total_feedbacks,
+            'rating_distribution': {
+                str(rating): rating_totals[str(rating)] or 0
+                for rating in range(5, 0, -1)
+            }
+        }
+    
     def get_comprehensive_analytics(self, period_days=30):
         """
         Get all analytics in one comprehensive report
@@ -387,22 +676,119 @@ class ShopAnalyticsService:
             'least_sold': self.get_least_sold_items(period_days),
             'payment_methods': self.get_payment_method_analysis(period_days),
             'peak_hours': self.get_peak_hours_analysis(period_days),
-            'daily_report': self.get_daily_report(period_days),
+            'daily_report': self.get_daily_report(min(period_days, self.MAX_DAILY_REPORT_DAYS)),
             'weekly_report': self.get_weekly_report(4),
             'monthly_report': self.get_monthly_report(12),
             'hourly_report': self.get_hourly_report(24)
         }
     
+    @memoized
+    def get_demand_forecast(self, days=7):
+        """
+        Stored pickup-slot forecast (see shops.forecasting) for the coming days,
+        checked against the shop's per-slot order limit
+        """
+        slots = list(
+            self.shop.slot_forecasts.filter(
+                slot_start__gte=self.now,
+                slot_start__lt=self.now + timedelta(days=days),
+            ).order_by('slot_start').values('slot_start', 'expected_orders')
+        )
+        capacity = self.shop.max_orders_per_slot
+        busiest = max(slots, key=lambda slot: slot['expected_orders'], default=None)
+        over_capacity = [slot for slot in slots if slot['expected_orders'] > capacity]
+        
+        return {
+            'slots': slots,
+            'total_expected': round(sum(slot['expected_orders'] for slot in slots), 1),
+            'busiest_slot': busiest,
+            'capacity': capacity,
+            'over_capacity': over_capacity,
+            # Smallest per-slot limit that covers every forecast slot
+            'suggested_capacity': max(capacity, math.ceil(busiest['expected_orders'])) if busiest else capacity,
+        }
+    
+    @memoized
+    def get_staffing_plan(self):
+        """
+        Stored staff recommendations (see shops.staffing) as a weekday x hour grid
+        over the hours that have orders
+        """
+        plans = list(
+            self.shop.staffing_plans.order_by('weekday', 'hour').values(
+                'weekday', 'hour', 'arrival_rate', 'staff', 'expected_wait_minutes',
+                'service_minutes', 'target_wait_minutes', 'computed_at'
+            )
+        )
+        if not plans:
+            return {'hours': [], 'days': [], 'peak': None}
+        
+        cells = {(plan['weekday'], plan['hour']): plan for plan in plans}
+        hours = sorted({plan['hour'] for plan in plans})
+        max_staff = max(plan['staff'] for plan in plans)
+        days = []
+        for weekday, day_name in enumerate(calendar.day_name, start=1):
+            row = []
+            for hour in hours:
+                plan = cells.get((weekday, hour))
+                row.append({
+                    'hour': hour,
+                    'plan': plan,
+                    'intensity': round(plan['staff'] / max_staff, 2) if plan else 0
+                })
+            days.append({'weekday': weekday, 'day_name': day_name, 'hours': row})
+        
+        peak = max(plans, key=lambda plan: (plan['staff'], plan['arrival_rate']))
+        return {
+            'hours': hours,
+            'days': days,
+            'peak': dict(peak, day_name=calendar.day_name[peak['weekday'] - 1]),
+            'service_minutes': plans[0]['service_minutes'],
+            'target_wait_minutes': plans[0]['target_wait_minutes'],
+            'computed_at': plans[0]['computed_at'],
+        }
+    
+    @memoized
+    def get_order_value_stats(self, start_day, end_day, approximate=None):
+        """
+        Order value average and percentiles plus distinct customers for a range of
+        local days (see shops.approximate). Long ranges are estimated from a
+        sample with confidence intervals unless approximate is False.
+        """
+        from .approximate import order_value_stats
+        
+        return order_value_stats(self.shop, start_day, end_day, approximate)
+    
+    @memoized
+    def get_customer_rfm(self):
+        """
+        Every customer's recency, frequency and monetary scores and segment
+        (see shops.segmentation), biggest spenders first
+        """
+        from .segmentation import customer_rfm
+        
+        return customer_rfm(self.shop, self.now)
+    
+    @memoized
+    def get_customer_segments(self):
+        """Customer count, share and revenue of every RFM segment"""
+        from .segmentation import summarize_segments
+        
+        customers = self.get_customer_rfm()
+        return {
+            'total_customers': len(customers),
+            'segments': summarize_segments(customers),
+        }
+    
+    @memoized
     def get_ml_insights(self, period_days=30):
         """
         Machine Learning based insights and recommendations
         """
-        from orders.models import Order
-        
         insights = []
         
         # Analyze most ordered items
-        top_items = self.get_most_ordered_items(period_days, limit=5)
+        top_items = self.get_most_ordered_items(period_days)
         if top_items:
             top_item = top_items[0]
             insights.append({
@@ -412,7 +798,7 @@ class ShopAnalyticsService:
             })
         
         # Analyze least sold items
-        least_items = self.get_least_sold_items(period_days, limit=5)
+        least_items = self.get_least_sold_items(period_days)
         no_sales_items = [item for item in least_items if item['total_quantity'] == 0]
         if no_sales_items:
             insights.append({
@@ -440,8 +826,36 @@ class ShopAnalyticsService:
                 'message': f"Your busiest hour is {hour['hour_label']} with {hour['count']} orders. Ensure adequate staffing during this time."
             })
         
+        # Next week's demand from the stored slot forecast
+        forecast = self.get_demand_forecast()
+        if forecast['busiest_slot'] and forecast['busiest_slot']['expected_orders'] > 0:
+            busiest = forecast['busiest_slot']
+            slot_label = timezone.localtime(busiest['slot_start']).strftime('%a %I:%M %p')
+            if forecast['over_capacity']:
+                insights.append({
+                    'type': 'warning',
+                    'category': 'Demand Forecast',
+                    'message': f"{len(forecast['over_capacity'])} pickup slots in the next 7 days are forecast to exceed your limit of {forecast['capacity']} orders per slot (busiest: {slot_label}, ~{busiest['expected_orders']:.1f} orders). Consider raising it to {forecast['suggested_capacity']}."
+                })
+            else:
+                insights.append({
+                    'type': 'info',
+                    'category': 'Demand Forecast',
+                    'message': f"About {forecast['total_expected']:.0f} orders are forecast for the next 7 days. The busiest pickup slot is {slot_label} with ~{busiest['expected_orders']:.1f} orders."
+                })
+        
+        # Kitchen staffing from the queueing model
+        staffing = self.get_staffing_plan()
+        if staffing['peak']:
+            peak = staffing['peak']
+            insights.append({
+                'type': 'info',
+                'category': 'Staffing',
+                'message': f"Plan for {peak['staff']} kitchen staff on {peak['day_name']}s at {peak['hour']:02d}:00, when about {peak['arrival_rate']:.1f} orders arrive per hour, to keep waits under {staffing['target_wait_minutes']:.0f} minutes."
+            })
+        
         # Revenue trend
-        daily_report = self.get_daily_report(period_days)
+        daily_report = self.get_daily_report(min(period_days, self.MAX_DAILY_REPORT_DAYS))
         if daily_report['trend_percentage'] != 0:
             direction = 'increased' if daily_report['trend_direction'] == 'up' else 'decreased'
             insights.append({
@@ -0,0 +1,162 @@
+"""
+Precomputed analytics dashboard snapshots.
+
+The precompute_analytics command computes every dashboard panel, plus the
+comprehensive report, for each shop with the default filters and stores the
+results in AnalyticsSnapshot. Shops are spread over a pool of worker
+processes that only compute; the parent closes its database connections
+before the pool forks, so every worker opens and reuses a single connection
+of its own, and then writes the snapshots they return one after another.
+
+While a snapshot is younger than ANALYTICS_SNAPSHOT_MAX_AGE and the shop's
+data version (ShopDataVersion, see analytics_cache) has not moved since
+it was computed, the unfiltered dashboard is served from it with a "computed at"
+label instead of querying; any filter, or ?live=1, computes the panels on demand
+as before. The version is read from the database, so a snapshot computed by the
+command is served by every web process whatever the cache backend.
+"""
+
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.db import connections
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .analytics_cache import get_data_version
+from .analytics_executor import run_panels
+from .analytics_panels import PANELS, parse_analytics_params
+from .analytics_service import get_analytics_service
+from .models import AnalyticsSnapshot, Shop, ShopDataVersion
+
+
+logger = logging.getLogger(__name__)
+
+# Memoized results left out of snapshots: the per-customer RFM list grows with
+# the customer base, and the customers panel only reads its segment summary
+SNAPSHOT_EXCLUDED_RESULTS = ("get_customer_rfm",)
+
+
+def get_snapshot_max_age():
+    return getattr(settings, "ANALYTICS_SNAPSHOT_MAX_AGE", 26 * 60 * 60)
+
+
+def build_snapshot(shop, now=None):
+    """Compute one shop's dashboard; returns the AnalyticsSnapshot fields, without writing"""
+    started = time.monotonic()
+    # Read the version first: an order placed while computing makes the snapshot stale
+    data_version = get_data_version(shop.id)
+    # Skip the shared cache: a snapshot must not be assembled from stale entries
+    analytics = get_analytics_service(shop, now=now, use_cache=False)
+    params = parse_analytics_params({}, analytics.now)
+    for _template, build_panels, _charts in PANELS.values():
+        run_panels(build_panels(analytics, params), parallel=False)
+    analytics.get_comprehensive_analytics(params['period'])
+
+    return {
+        "shop_id": shop.id,
+        "backend": analytics.backend,
+        "computed_at": analytics.now,
+        "duration_seconds": round(time.monotonic() - started, 3),
+        "data_version": data_version,
+        "results": analytics.export_results(exclude=SNAPSHOT_EXCLUDED_RESULTS),
+    }
+
+
+def store_snapshot(fields):
+    """Write the fields returned by build_snapshot; returns the AnalyticsSnapshot"""
+    fields = dict(fields)
+    snapshot, _ = AnalyticsSnapshot.objects.update_or_create(shop_id=fields.pop("shop_id"), defaults=fields)
+    return snapshot
+
+
+def compute_snapshot(shop, now=None):
+    """Compute and store one shop's snapshot; returns the AnalyticsSnapshot"""
+    return store_snapshot(build_snapshot(shop, now))
+
+
+def _init_worker():
+    # Spawned (rather than forked) workers start without a configured Django
+    from django.apps import apps
+    if not apps.ready:
+        django.setup()
+
+
+def _build_shop_snapshot(shop_id, now):
+    return build_snapshot(Shop.objects.get(id=shop_id), now)
+
+
+def precompute_snapshots(shop_ids=None, workers=None, now=None):
+    """
+    Refresh the snapshots of the given shops (all by default) on `workers`
+    processes, or inline with workers=1. Returns (shops done, shop ids that failed).
+
+    Workers only read; the parent writes every snapshot itself, so the pool
+    never competes for the database write lock (SQLite allows one writer).
+    """
+    now = now or timezone.now()
+    shop_ids = list(
+        Shop.objects.filter(id__in=shop_ids).values_list("id", flat=True)
+        if shop_ids else Shop.objects.values_list("id", flat=True)
+    )
+    workers = workers or getattr(settings, "ANALYTICS_PRECOMPUTE_WORKERS", None) or multiprocessing.cpu_count()
+    workers = min(workers, len(shop_ids)) or 1
+
+    done = 0
+    failed = []
+    if workers == 1:
+        for shop_id in shop_ids:
+            try:
+                store_snapshot(_build_shop_snapshot(shop_id, now))
+                done += 1
+            except Exception:
+                logger.exception("Analytics snapshot for shop %s failed", shop_id)
+                failed.append(shop_id)
+        return done, failed
+
+    # A connection inherited through fork would be shared with the parent
+    connections.close_all()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+        futures = {executor.submit(_build_shop_snapshot, shop_id, now): shop_id for shop_id in shop_ids}
+        for future in as_completed(futures):
+            try:
+                store_snapshot(future.result())
+                done += 1
+            except Exception:
+                logger.exception("Analytics snapshot for shop %s failed", futures[future])
+                failed.append(futures[future])
+    return done, failed
+
+
+def get_fresh_snapshot(shop, now=None):
+    """
+    The shop's snapshot if it is recent, current and from the current engine,
+    else None. Its results are deferred and only loaded by snapshot_service.
+    """
+    now = now or timezone.now()
+    stored_version = ShopDataVersion.objects.filter(shop_id=OuterRef("shop_id")).values("version")
+    snapshot = (
+        AnalyticsSnapshot.objects.filter(
+            shop=shop,
+            computed_at__gte=now - timedelta(seconds=get_snapshot_max_age()),
+            data_version=Coalesce(Subquery(stored_version), 0),
+        )
+        .defer("results")
+        .first()
+    )
+    if snapshot is None or snapshot.backend != get_analytics_service(shop).backend:
+        return None
+    return snapshot
+
+
+def snapshot_service(shop, snapshot):
+    """Analytics service pinned to the snapshot's time with its results preloaded"""
+    analytics = get_analytics_service(shop, now=snapshot.computed_at)
+    analytics.preload_results(snapshot.results)
+    return analytics
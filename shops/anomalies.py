@@ -0,0 +1,174 @@
+"""
+Order-volume and revenue anomaly detection.
+
+Every shop's hourly and daily series are read from the rollup tables with one
+query per granularity and scored together on numpy arrays. Each point of the
+latest cycle (the last 24 hours, or the last 7 days) is compared with the same
+position in the earlier cycles (the same hour on earlier days, the same
+weekday in earlier weeks): the expected value is their exponentially weighted
+average, the spread their median absolute deviation, and a point whose robust
+z-score reaches the threshold is stored as a ShopAnomaly. Owners get one
+notification per shop and run listing the newly found anomalies.
+
+Rollup revenue only counts collected orders, so revenue is checked on the daily
+series alone; the last 24 hours still hold orders waiting to be collected.
+"""
+
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Notification
+
+from .models import Shop, ShopAnomaly, ShopDayRollup, ShopHourRollup
+
+
+HOURLY_HISTORY_DAYS = 28
+DAILY_HISTORY_WEEKS = 8
+SMOOTHING = 0.3
+THRESHOLD = 3.5
+MAD_TO_SIGMA = 1.4826  # MAD of normally distributed data -> standard deviation
+# Floors on the spread so a very steady series does not alert on small wobbles
+MIN_RELATIVE_SPREAD = 0.25
+MIN_SPREAD = 1.0
+NOTIFIED_ANOMALIES = 3
+
+
+def hourly_series(shop_ids, end, days=HOURLY_HISTORY_DAYS):
+    """Array (shop, day, hour) of non-cancelled orders in the days of hours before end"""
+    start = end - timedelta(days=days)
+    orders = np.zeros((len(shop_ids), days * 24))
+    rows = ShopHourRollup.objects.filter(
+        shop_id__in=shop_ids, hour_start__gte=start, hour_start__lt=end
+    ).values_list("shop_id", "hour_start", "total_orders", "cancelled_orders")
+    index = {shop_id: position for position, shop_id in enumerate(shop_ids)}
+    for shop_id, hour_start, total, cancelled in rows:
+        orders[index[shop_id], int((hour_start - start).total_seconds() // 3600)] = total - cancelled
+    return orders.reshape(len(shop_ids), days, 24)
+
+
+def daily_series(shop_ids, end_day, weeks=DAILY_HISTORY_WEEKS):
+    """Arrays (shop, week, day) of non-cancelled orders and revenue in the weeks before end_day"""
+    start_day = end_day - timedelta(weeks=weeks)
+    orders = np.zeros((len(shop_ids), weeks * 7))
+    revenue = np.zeros((len(shop_ids), weeks * 7))
+    rows = ShopDayRollup.objects.filter(
+        shop_id__in=shop_ids, date__gte=start_day, date__lt=end_day
+    ).values_list("shop_id", "date", "total_orders", "cancelled_orders", "revenue")
+    index = {shop_id: position for position, shop_id in enumerate(shop_ids)}
+    for shop_id, day, total, cancelled, day_revenue in rows:
+        position = (day - start_day).days
+        orders[index[shop_id], position] = total - cancelled
+        revenue[index[shop_id], position] = float(day_revenue)
+    shape = (len(shop_ids), weeks, 7)
+    return orders.reshape(shape), revenue.reshape(shape)
+
+
+def robust_scores(series, alpha=SMOOTHING):
+    """
+    Expected value and robust z-score of every point in the latest cycle of a
+    (shop, cycle, position) array, against the same position in earlier cycles
+    """
+    history, latest = series[:, :-1, :], series[:, -1, :]
+    weights = alpha * (1 - alpha) ** np.arange(history.shape[1] - 1, -1, -1)
+    expected = np.einsum("c,scp->sp", weights / weights.sum(), history)
+    deviation = np.abs(history - np.median(history, axis=1, keepdims=True))
+    spread = np.maximum(
+        np.median(deviation, axis=1) * MAD_TO_SIGMA,
+        np.maximum(expected * MIN_RELATIVE_SPREAD, MIN_SPREAD),
+    )
+    return expected, (latest - expected) / spread
+
+
+def established(series):
+    """Shops with orders in at least half of the earlier cycles; new shops have no usual level yet"""
+    active = series[:, :-1, :].sum(axis=2) > 0
+    return active.mean(axis=1) >= 0.5
+
+
+def _flag(shop_ids, granularity, metric, series, period_starts, threshold, detected_at):
+    expected, scores = robust_scores(series)
+    flagged = (np.abs(scores) >= threshold) & established(series)[:, np.newaxis]
+    for shop_position, position in zip(*np.nonzero(flagged)):
+        yield ShopAnomaly(
+            shop_id=shop_ids[shop_position],
+            granularity=granularity,
+            metric=metric,
+            period_start=period_starts[position],
+            value=float(series[shop_position, -1, position]),
+            expected=round(float(expected[shop_position, position]), 2),
+            score=round(float(scores[shop_position, position]), 2),
+            detected_at=detected_at,
+        )
+
+
+def describe(anomaly):
+    """One line for the owner, e.g. 'Orders dropped to 2 (usually about 12) on Mon 13 Oct, 12:00'"""
+    start = timezone.localtime(anomaly.period_start)
+    when = start.strftime("%a %d %b, %H:%M") if anomaly.granularity == ShopAnomaly.GRANULARITY_HOUR else start.strftime("%a %d %b")
+    if anomaly.metric == ShopAnomaly.METRIC_REVENUE:
+        value, expected = f"₹{anomaly.value:.0f}", f"₹{anomaly.expected:.0f}"
+    else:
+        value, expected = f"{anomaly.value:.0f}", f"{anomaly.expected:.0f}"
+    change = "dropped to" if anomaly.is_drop else "jumped to"
+    return f"{anomaly.get_metric_display()} {change} {value} (usually about {expected}) on {when}"
+
+
+@transaction.atomic
+def detect_anomalies(shop_ids=None, threshold=THRESHOLD, now=None):
+    """Score every shop's latest hours and days, store new anomalies and notify owners; returns them"""
+    now = now or timezone.now()
+    shops = list(Shop.objects.filter(id__in=shop_ids) if shop_ids else Shop.objects.all())
+    shop_ids = [shop.id for shop in shops]
+
+    hour_end = timezone.localtime(now).replace(minute=0, second=0, microsecond=0)
+    day_end = timezone.localdate(now)
+    hour_starts = [hour_end - timedelta(hours=24 - offset) for offset in range(24)]
+    day_starts = [
+        timezone.make_aware(datetime.combine(day_end - timedelta(days=7 - offset), time.min))
+        for offset in range(7)
+    ]
+    daily_orders, daily_revenue = daily_series(shop_ids, day_end)
+
+    candidates = [
+        *_flag(shop_ids, ShopAnomaly.GRANULARITY_HOUR, ShopAnomaly.METRIC_ORDERS, hourly_series(shop_ids, hour_end), hour_starts, threshold, now),
+        *_flag(shop_ids, ShopAnomaly.GRANULARITY_DAY, ShopAnomaly.METRIC_ORDERS, daily_orders, day_starts, threshold, now),
+        *_flag(shop_ids, ShopAnomaly.GRANULARITY_DAY, ShopAnomaly.METRIC_REVENUE, daily_revenue, day_starts, threshold, now),
+    ]
+
+    # The windows of consecutive runs overlap; only report each period once
+    known = set(
+        ShopAnomaly.objects.filter(shop_id__in=shop_ids, period_start__gte=day_starts[0]).values_list(
+            "shop_id", "granularity", "metric", "period_start"
+        )
+    )
+    anomalies = [
+        anomaly for anomaly in candidates
+        if (anomaly.shop_id, anomaly.granularity, anomaly.metric, anomaly.period_start) not in known
+    ]
+    ShopAnomaly.objects.bulk_create(anomalies)
+
+    by_shop = {}
+    for anomaly in anomalies:
+        by_shop.setdefault(anomaly.shop_id, []).append(anomaly)
+    link = reverse("shops:analytics")
+    notifications = []
+    for shop in shops:
+        found = sorted(by_shop.get(shop.id, []), key=lambda anomaly: abs(anomaly.score), reverse=True)
+        if not found:
+            continue
+        lines = [describe(anomaly) for anomaly in found[:NOTIFIED_ANOMALIES]]
+        if len(found) > NOTIFIED_ANOMALIES:
+            lines.append(f"and {len(found) - NOTIFIED_ANOMALIES} more")
+        notifications.append(Notification(
+            user_id=shop.owner_id,
+            notification_type=Notification.NOTIFICATION_SALES_ANOMALY,
+            title=f"Unusual sales activity at {shop.name}",
+            message=". ".join(lines) + ".",
+            link=link,
+        ))
+    Notification.objects.bulk_create(notifications)
+    return anomalies
@@ -0,0 +1,186 @@
+"""
+Order-value distribution and distinct customers over a range of days, exact or
+approximate.
+
+Small ranges are answered exactly from one query. When the rollups say the
+range holds more orders than ANALYTICS_APPROXIMATE_ROWS, only the orders of a
+sample of customers are read: those whose stored Order.customer_bucket (user
+id modulo CUSTOMER_BUCKETS) is below a cut-off chosen for about
+ANALYTICS_SAMPLE_ROWS orders. The (shop, customer_bucket, created_at) index
+covers that filter, so rows of unsampled customers are never visited, and the
+sample is streamed in chunks into a quantile sketch and per-customer totals,
+so the time and memory spent stay bounded however long the range is.
+
+A customer's orders are sampled together, so the sample is clustered and the
+confidence intervals treat each sampled customer as one unit. Every
+approximate number carries a 95% confidence interval:
+
+- average order value: the ratio of the sampled customers' order value to
+  their order count, +/- 1.96 cluster (linearised) standard errors;
+- percentiles: the sketch read at the ranks bounding the sample quantile, with
+  the order count deflated by the clustering design effect;
+- distinct customers: sampled customers scaled by the sampling rate, with the
+  binomial error of which customers were sampled.
+"""
+
+import math
+from datetime import datetime, time, timedelta
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from orders.models import CUSTOMER_BUCKETS, Order
+
+from .models import ShopDayRollup
+from .sketches import QuantileSketch
+
+
+Z_95 = 1.96
+PERCENTILES = (50, 90, 99)
+CHUNK_SIZE = 5000
+
+
+def get_approximate_threshold():
+    return getattr(settings, "ANALYTICS_APPROXIMATE_ROWS", 200000)
+
+
+def get_sample_rows():
+    return getattr(settings, "ANALYTICS_SAMPLE_ROWS", 20000)
+
+
+def estimate_order_rows(shop, start_day, end_day):
+    """Non-cancelled orders in the range according to the day rollups (one aggregate query)"""
+    totals = ShopDayRollup.objects.filter(shop=shop, date__gte=start_day, date__lte=end_day).aggregate(
+        orders=Sum(F("total_orders") - F("cancelled_orders"))
+    )
+    return totals["orders"] or 0
+
+
+def _orders_in_range(shop, start_day, end_day):
+    start = timezone.make_aware(datetime.combine(start_day, time.min))
+    end = timezone.make_aware(datetime.combine(end_day + timedelta(days=1), time.min))
+    return (
+        Order.objects.filter(shop=shop, created_at__gte=start, created_at__lt=end)
+        .exclude(status=Order.STATUS_CANCELLED)
+        .order_by()
+    )
+
+
+def _estimate(value, low=None, high=None, digits=2):
+    return {
+        "value": round(value, digits),
+        "low": None if low is None else round(low, digits),
+        "high": None if high is None else round(high, digits),
+    }
+
+
+def exact_order_value_stats(orders):
+    rows = np.array(list(orders.values_list("total_price", "user_id")), dtype=float).reshape(-1, 2)
+    values, users = rows[:, 0], rows[:, 1]
+    if not len(values):
+        return None
+    return {
+        "approximate": False,
+        "sample_rate": 1.0,
+        "sampled_orders": len(values),
+        "average_order_value": _estimate(float(values.mean())),
+        "percentiles": [
+            dict(_estimate(float(np.percentile(values, percentile))), percentile=percentile)
+            for percentile in PERCENTILES
+        ],
+        "customers": _estimate(len(np.unique(users)), digits=0),
+    }
+
+
+def approximate_order_value_stats(orders, estimated_rows, sample_rows=None):
+    sample_rows = sample_rows or get_sample_rows()
+    buckets = max(1, min(CUSTOMER_BUCKETS, math.ceil(CUSTOMER_BUCKETS * sample_rows / estimated_rows)))
+    rate = buckets / CUSTOMER_BUCKETS
+    sample = (
+        orders.filter(customer_bucket__lt=buckets)
+        .values_list("total_price", "user_id")
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+
+    values_sketch = QuantileSketch()
+    customer_totals = {}  # user id -> [order value, orders]
+    total_squares = 0.0
+    while chunk := list(islice(sample, CHUNK_SIZE)):
+        rows = np.array(chunk, dtype=float)
+        values = rows[:, 0]
+        values_sketch.add(values)
+        total_squares += float(np.square(values).sum())
+        users, inverse = np.unique(rows[:, 1].astype(np.int64), return_inverse=True)
+        sums = np.bincount(inverse, weights=values)
+        counts = np.bincount(inverse)
+        for user, value, count in zip(users.tolist(), sums.tolist(), counts.tolist()):
+            totals = customer_totals.setdefault(user, [0.0, 0])
+            totals[0] += value
+            totals[1] += count
+    if not customer_totals:
+        return None
+
+    totals = np.array(list(customer_totals.values()), dtype=float)
+    customer_values, customer_orders = totals[:, 0], totals[:, 1]
+    customers_sampled = len(totals)
+    count = int(customer_orders.sum())
+    mean = float(customer_values.sum()) / count
+
+    # Ratio-estimator variance with sampled customers as the units
+    residuals = customer_values - mean * customer_orders
+    cluster_variance = (
+        customers_sampled / max(customers_sampled - 1, 1) * float(np.square(residuals).sum()) / count ** 2
+    )
+    margin = Z_95 * math.sqrt((1 - rate) * cluster_variance)
+
+    # Orders of one customer carry less information than independent orders
+    order_variance = max(total_squares / count - mean * mean, 0.0) * count / max(count - 1, 1)
+    design_effect = max(1.0, cluster_variance / (order_variance / count)) if order_variance else 1.0
+    effective_orders = count / design_effect
+
+    percentiles = []
+    for percentile in PERCENTILES:
+        q = percentile / 100
+        spread = Z_95 * math.sqrt(q * (1 - q) / effective_orders)
+        percentiles.append(dict(
+            _estimate(
+                values_sketch.quantile(q),
+                values_sketch.quantile(max(q - spread, 0.0)),
+                values_sketch.quantile(min(q + spread, 1.0)),
+            ),
+            percentile=percentile,
+        ))
+
+    customers = customers_sampled / rate
+    customers_margin = Z_95 * math.sqrt(customers_sampled * (1 - rate)) / rate
+    return {
+        "approximate": True,
+        "sample_rate": rate,
+        "sampled_orders": count,
+        "sampled_customers": customers_sampled,
+        "average_order_value": _estimate(mean, mean - margin, mean + margin),
+        "percentiles": percentiles,
+        "customers": _estimate(customers, max(customers - customers_margin, customers_sampled), customers + customers_margin, digits=0),
+    }
+
+
+def order_value_stats(shop, start_day, end_day, approximate=None):
+    """
+    Average and percentiles of order value and distinct customers in the range,
+    or None without orders. approximate=None samples when the estimated row
+    count exceeds ANALYTICS_APPROXIMATE_ROWS.
+    """
+    estimated_rows = estimate_order_rows(shop, start_day, end_day)
+    if not estimated_rows:
+        return None
+    if approximate is None:
+        approximate = estimated_rows > get_approximate_threshold()
+
+    orders = _orders_in_range(shop, start_day, end_day)
+    stats = approximate_order_value_stats(orders, estimated_rows) if approximate else exact_order_value_stats(orders)
+    if stats is None:
+        return None
+    return dict(stats, estimated_orders=estimated_rows)
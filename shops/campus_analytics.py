@@ -0,0 +1,146 @@
+"""
+Campus-wide analytics across every shop, for staff.
+
+Everything is read from the rollup tables with grouped queries over all shops
+at once, so the number of queries does not grow with the number of shops:
+campus totals, the daily series, shop rankings with percentile ranks computed
+by a window function, and the weekday x hour heatmap. The assembled report is
+cached for ANALYTICS_CACHE_TIMEOUT seconds per period and local hour.
+"""
+
+import calendar
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import F, Q, Sum, Value, Window
+from django.db.models.functions import Coalesce, ExtractHour, ExtractIsoWeekDay, PercentRank
+from django.utils import timezone
+
+from .analytics_cache import get_cache_timeout
+from .models import Shop, ShopDayRollup, ShopHourRollup
+
+
+PERIOD_CHOICES = (7, 30, 90)
+BUSIEST_SHOPS = 5
+
+
+def _totals(start_day):
+    totals = ShopDayRollup.objects.filter(date__gte=start_day).aggregate(
+        total_orders=Sum("total_orders"),
+        cancelled=Sum("cancelled_orders"),
+        collected=Sum("collected_orders"),
+        revenue=Sum("revenue"),
+    )
+    totals = {key: value or 0 for key, value in totals.items()}
+    totals["revenue"] = totals["revenue"] or Decimal("0.00")
+    totals["average_order_value"] = (
+        totals["revenue"] / totals["collected"] if totals["collected"] else Decimal("0.00")
+    )
+    return totals
+
+
+def _daily_series(start_day, end_day):
+    by_day = {
+        row["date"]: row
+        for row in ShopDayRollup.objects.filter(date__gte=start_day)
+        .values("date")
+        .annotate(orders=Sum("total_orders"), revenue=Sum("revenue"))
+        .order_by()
+    }
+    series = []
+    day = start_day
+    while day <= end_day:
+        row = by_day.get(day, {})
+        series.append({
+            "date": day,
+            "date_label": day.strftime("%d %b"),
+            "orders": row.get("orders") or 0,
+            "revenue": row.get("revenue") or Decimal("0.00"),
+        })
+        day += timedelta(days=1)
+    return series
+
+
+def _shop_rankings(start_day):
+    """Every shop with its orders and revenue in the window and their percentile ranks"""
+    in_window = Q(day_rollups__date__gte=start_day)
+    shops = (
+        Shop.objects.annotate(
+            orders=Coalesce(Sum("day_rollups__total_orders", filter=in_window), 0),
+            revenue=Coalesce(Sum("day_rollups__revenue", filter=in_window), Value(Decimal("0.00"))),
+        )
+        .annotate(
+            orders_percentile=Window(PercentRank(), order_by=F("orders").asc()),
+            revenue_percentile=Window(PercentRank(), order_by=F("revenue").asc()),
+        )
+        .values("id", "name", "orders", "revenue", "orders_percentile", "revenue_percentile")
+        .order_by("-revenue", "name")
+    )
+    return [
+        dict(
+            shop,
+            orders_percentile=round(shop["orders_percentile"] * 100),
+            revenue_percentile=round(shop["revenue_percentile"] * 100),
+        )
+        for shop in shops
+    ]
+
+
+def _heatmap(start):
+    tz = timezone.get_current_timezone()
+    counts = {
+        (row["weekday"], row["hour"]): row["count"]
+        for row in ShopHourRollup.objects.filter(hour_start__gte=start)
+        .annotate(weekday=ExtractIsoWeekDay("hour_start", tzinfo=tz), hour=ExtractHour("hour_start", tzinfo=tz))
+        .values("weekday", "hour")
+        .annotate(count=Sum("total_orders"))
+        .order_by()
+    }
+    max_count = max(counts.values(), default=0)
+    days = []
+    for weekday, day_name in enumerate(calendar.day_name, start=1):
+        hours = []
+        for hour in range(24):
+            count = counts.get((weekday, hour), 0)
+            hours.append({
+                "hour": hour,
+                "count": count,
+                "intensity": round(count / max_count, 2) if max_count else 0,
+            })
+        days.append({"weekday": weekday, "day_name": day_name, "hours": hours})
+    return {"days": days, "max_count": max_count}
+
+
+def build_campus_report(period_days=30, now=None):
+    """Campus totals, daily series, shop rankings and heatmap for the last period_days days"""
+    now = now or timezone.now()
+    end_day = timezone.localdate(now)
+    start_day = end_day - timedelta(days=period_days - 1)
+    rankings = _shop_rankings(start_day)
+    return {
+        "period_days": period_days,
+        "start_day": start_day,
+        "end_day": end_day,
+        "totals": _totals(start_day),
+        "daily": _daily_series(start_day, end_day),
+        "shops": rankings,
+        "active_shops": sum(1 for shop in rankings if shop["orders"]),
+        "busiest_shops": sorted(rankings, key=lambda shop: (-shop["orders"], shop["name"]))[:BUSIEST_SHOPS],
+        "heatmap": _heatmap(timezone.make_aware(datetime.combine(start_day, time.min))),
+        "computed_at": now,
+    }
+
+
+def get_campus_report(period_days=30, now=None):
+    """build_campus_report, shared across requests for the cache timeout within the local hour"""
+    now = now or timezone.now()
+    timeout = get_cache_timeout()
+    if not timeout:
+        return build_campus_report(period_days, now)
+    key = f"analytics:campus:{period_days}:{timezone.localtime(now):%Y%m%d%H}"
+    report = cache.get(key)
+    if report is None:
+        report = build_campus_report(period_days, now)
+        cache.set(key, report, timeout)
+    return report
@@ -0,0 +1,136 @@
+"""
+Pickup-slot demand forecasting.
+
+Orders are counted per shop, week, day of week, hour and 15-minute quarter by
+pickup time. Each (day of week, hour) cell is smoothed across the past weeks
+with simple exponential smoothing, so the latest week weighs most, and split
+into pickup slots by the smoothed share each quarter takes of that hour. All
+shops are fitted together on numpy arrays built from a single query.
+
+The nightly forecast_demand command stores the coming week's per-slot forecast in
+ShopSlotForecast, where the analytics insights and slot capacity planning read
+it back.
+"""
+
+from datetime import datetime, time, timedelta
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+from django.utils import timezone
+
+from orders.models import Order
+
+from .analytics_cache import bump_data_version_on_commit
+from .models import Shop, ShopSlotForecast
+
+
+SLOT_MINUTES = 15
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+HISTORY_WEEKS = 8
+SMOOTHING = 0.5
+FORECAST_DAYS = 7
+
+
+def forecast_anchor(now=None):
+    """Forecasts cover the week from the start of the current local day"""
+    return timezone.make_aware(datetime.combine(timezone.localdate(now or timezone.now()), time.min))
+
+
+def weekly_slot_counts(shop_ids, anchor, weeks=HISTORY_WEEKS):
+    """
+    Array (shop, week, weekday, hour, quarter) of non-cancelled orders picked
+    up in the weeks before anchor; week 0 is the oldest, weekday 0 is Monday.
+    """
+    counts = np.zeros((len(shop_ids), weeks, 7, 24, SLOTS_PER_HOUR))
+    rows = (
+        Order.objects.filter(
+            shop_id__in=shop_ids,
+            pickup_time__gt=anchor - timedelta(weeks=weeks),
+            pickup_time__lt=anchor,
+        )
+        .exclude(status=Order.STATUS_CANCELLED)
+        .values_list("shop_id", "pickup_time")
+        .order_by()
+    )
+    frame = pd.DataFrame.from_records(rows, columns=["shop_id", "pickup_time"])
+    if frame.empty:
+        return counts
+
+    tz = timezone.get_current_timezone()
+    local = pd.to_datetime(frame["pickup_time"], utc=True).dt.tz_convert(tz).dt.tz_localize(None)
+    age = (timezone.localtime(anchor).replace(tzinfo=None) - local) // pd.Timedelta(weeks=1)
+    np.add.at(
+        counts,
+        (
+            pd.Index(shop_ids).get_indexer(frame["shop_id"]),
+            weeks - 1 - age.to_numpy(),
+            local.dt.weekday.to_numpy(),
+            local.dt.hour.to_numpy(),
+            local.dt.minute.to_numpy() // SLOT_MINUTES,
+        ),
+        1,
+    )
+    return counts
+
+
+def fit_forecasts(counts, alpha=SMOOTHING):
+    """Expected orders per (shop, weekday, hour, quarter) for the coming week"""
+    weeks = counts.shape[1]
+
+    # Simple exponential smoothing over weeks, initialised with the shop's first
+    # week with orders so a new shop is not dragged towards zero by the weeks
+    # before it opened. Weight of a week `age` weeks back, for `length` weeks
+    # of history: alpha * (1 - alpha) ** age, and (1 - alpha) ** age for the
+    # initial week; the weights sum to 1.
+    active = counts.sum(axis=(2, 3, 4)) > 0
+    length = (weeks - np.where(active.any(axis=1), active.argmax(axis=1), weeks))[:, np.newaxis]
+    age = np.arange(weeks - 1, -1, -1)
+    weights = np.where(age < length - 1, alpha * (1 - alpha) ** age, 0.0)
+    weights = np.where(age == length - 1, (1 - alpha) ** age, weights)
+
+    hourly = np.einsum("sw,swdhq->sdh", weights, counts)
+    quarters = np.einsum("sw,swdhq->shq", weights, counts)
+    hour_totals = quarters.sum(axis=2, keepdims=True)
+    share = np.divide(
+        quarters,
+        hour_totals,
+        out=np.full_like(quarters, 1 / SLOTS_PER_HOUR),
+        where=hour_totals > 0,
+    )
+    return hourly[..., np.newaxis] * share[:, np.newaxis, :, :]
+
+
+def _slot_rows(shop, forecast, anchor, computed_at):
+    """ShopSlotForecast rows for the shop's open slots in the week from anchor"""
+    first_day = timezone.localdate(anchor)
+    for offset in range(FORECAST_DAYS):
+        day = first_day + timedelta(days=offset)
+        for hour in range(24):
+            for quarter in range(SLOTS_PER_HOUR):
+                slot_time = time(hour, quarter * SLOT_MINUTES)
+                if not shop.opening_time <= slot_time <= shop.closing_time:
+                    continue
+                yield ShopSlotForecast(
+                    shop=shop,
+                    slot_start=timezone.make_aware(datetime.combine(day, slot_time)),
+                    expected_orders=round(float(forecast[day.weekday(), hour, quarter]), 3),
+                    computed_at=computed_at,
+                )
+
+
+@transaction.atomic
+def run_forecasts(shop_ids=None, weeks=HISTORY_WEEKS, alpha=SMOOTHING, now=None):
+    """Refit and store next week's slot forecasts; returns the number of slots written"""
+    now = now or timezone.now()
+    anchor = forecast_anchor(now)
+    shops = list(Shop.objects.filter(id__in=shop_ids) if shop_ids else Shop.objects.all())
+    forecasts = fit_forecasts(weekly_slot_counts([shop.id for shop in shops], anchor, weeks), alpha)
+
+    rows = []
+    for shop, forecast in zip(shops, forecasts):
+        rows.extend(_slot_rows(shop, forecast, anchor, now))
+        bump_data_version_on_commit(shop.id)
+    ShopSlotForecast.objects.filter(shop__in=shops).delete()
+    ShopSlotForecast.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
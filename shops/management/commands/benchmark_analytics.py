@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shops.analytics_numpy import NumpyShopAnalyticsService
+from shops.analytics_service import ShopAnalyticsService
+from shops.models import Shop
+
+
+class Command(BaseCommand):
+    help = "Time the rollup and NumPy analytics engines on the same shop and check that they agree."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--shop", type=int, dest="shop_id", help="Shop id (defaults to the first shop).")
+        parser.add_argument("--period", type=int, default=30, help="Window in days (default 30).")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per engine (default 3).")
+
+    def handle(self, *args, **options):
+        shops = Shop.objects.order_by("id")
+        shop = shops.filter(id=options["shop_id"]).first() if options["shop_id"] else shops.first()
+        if shop is None:
+            raise CommandError("No matching shop found.")
+
+        results = {}
+        for engine in (ShopAnalyticsService, NumpyShopAnalyticsService):
+            timings = []
+            for _ in range(options["repeat"]):
+                started = time.perf_counter()
+                service = engine(shop, use_cache=False)
+                report = service.get_comprehensive_analytics(options["period"])
+                report["weekday_heatmap"] = service.get_weekday_hour_heatmap(options["period"])
+                timings.append((time.perf_counter() - started) * 1000)
+            results[engine.backend] = report
+            self.stdout.write(
+                f"{engine.backend:>8}: best {min(timings):.1f} ms, mean {sum(timings) / len(timings):.1f} ms"
+            )
+
+        mismatched = [
+            panel for panel in results["rollups"]
+            if results["rollups"][panel] != results["numpy"][panel]
+        ]
+        if mismatched:
+            self.stdout.write(self.style.WARNING(f"Engines disagree on: {', '.join(mismatched)}"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Both engines produced identical panels."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shops.anomalies import THRESHOLD, detect_anomalies
+
+
+class Command(BaseCommand):
+    help = "Flag unusual drops and spikes in every shop's hourly and daily orders and revenue, and notify the owners."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            type=int,
+            action="append",
+            dest="shop_ids",
+            help="Only check the given shop id (can be repeated). Defaults to every shop.",
+        )
+        parser.add_argument(
+            "--threshold",
+            type=float,
+            default=THRESHOLD,
+            help=f"Robust z-score a period must reach to be reported (default {THRESHOLD}).",
+        )
+
+    def handle(self, *args, **options):
+        if options["threshold"] <= 0:
+            raise CommandError("--threshold must be positive.")
+        anomalies = detect_anomalies(shop_ids=options["shop_ids"], threshold=options["threshold"])
+        shops = len({anomaly.shop_id for anomaly in anomalies})
+        self.stdout.write(self.style.SUCCESS(f"Found {len(anomalies)} new anomalies in {shops} shops."))
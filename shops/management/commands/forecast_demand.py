@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from shops.forecasting import HISTORY_WEEKS, SMOOTHING, run_forecasts
+
+
+class Command(BaseCommand):
+    help = "Fit the seasonal demand model and store next week's order forecast per 15-minute pickup slot."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            type=int,
+            action="append",
+            dest="shop_ids",
+            help="Only forecast the given shop id (can be repeated). Defaults to every shop.",
+        )
+        parser.add_argument("--weeks", type=int, default=HISTORY_WEEKS, help=f"Weeks of history (default {HISTORY_WEEKS}).")
+        parser.add_argument("--alpha", type=float, default=SMOOTHING, help=f"Smoothing factor (default {SMOOTHING}).")
+
+    def handle(self, *args, **options):
+        written = run_forecasts(shop_ids=options["shop_ids"], weeks=options["weeks"], alpha=options["alpha"])
+        self.stdout.write(self.style.SUCCESS(f"Stored forecasts for {written} pickup slots."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shops.staffing import HISTORY_WEEKS, TARGET_WAIT_MINUTES, run_staffing
+
+
+class Command(BaseCommand):
+    help = "Recommend kitchen staff per weekday and hour with an Erlang C queueing model and store the plan."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            type=int,
+            action="append",
+            dest="shop_ids",
+            help="Only plan the given shop id (can be repeated). Defaults to every shop.",
+        )
+        parser.add_argument("--weeks", type=int, default=HISTORY_WEEKS, help=f"Weeks of history (default {HISTORY_WEEKS}).")
+        parser.add_argument(
+            "--target-wait",
+            type=float,
+            default=TARGET_WAIT_MINUTES,
+            help=f"Longest acceptable average wait in minutes before an order is started (default {TARGET_WAIT_MINUTES}).",
+        )
+
+    def handle(self, *args, **options):
+        if options["target_wait"] <= 0:
+            raise CommandError("--target-wait must be positive.")
+        planned = run_staffing(shop_ids=options["shop_ids"], weeks=options["weeks"], target_wait=options["target_wait"])
+        self.stdout.write(self.style.SUCCESS(f"Planned staffing for {planned} shop hours."))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shops.analytics_snapshots import precompute_snapshots
+
+
+class Command(BaseCommand):
+    help = "Precompute every shop's analytics dashboard on a pool of worker processes and store the snapshots."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            type=int,
+            action="append",
+            dest="shop_ids",
+            help="Only precompute the given shop id (can be repeated). Defaults to every shop.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            help="Worker processes (default ANALYTICS_PRECOMPUTE_WORKERS or the CPU count); 1 runs inline.",
+        )
+
+    def handle(self, *args, **options):
+        if options["workers"] is not None and options["workers"] < 1:
+            raise CommandError("--workers must be at least 1.")
+        done, failed = precompute_snapshots(shop_ids=options["shop_ids"], workers=options["workers"])
+        if failed:
+            raise CommandError(f"Snapshots failed for shops {', '.join(map(str, sorted(failed)))} ({done} succeeded).")
+        self.stdout.write(self.style.SUCCESS(f"Precomputed analytics for {done} shops."))
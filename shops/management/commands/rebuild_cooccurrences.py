@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from shops.recommendations import rebuild_cooccurrences
+
+
+class Command(BaseCommand):
+    help = "Recompute the menu item co-occurrence counts behind the \"Customers also ordered\" recommendations."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            type=int,
+            action="append",
+            dest="shop_ids",
+            help="Only rebuild the given shop id (can be repeated). Defaults to every shop.",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_cooccurrences(shop_ids=options["shop_ids"])
+        self.stdout.write(self.style.SUCCESS(f"Co-occurrences rebuilt: {written} item pairs."))
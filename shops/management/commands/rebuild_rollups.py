@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from shops.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the analytics rollup tables from the raw order, payment and feedback tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--shop",
+            type=int,
+            action="append",
+            dest="shop_ids",
+            help="Only rebuild the given shop id (can be repeated). Defaults to every shop.",
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(shop_ids=options["shop_ids"])
+        for model_name, count in written.items():
+            self.stdout.write(f"{model_name}: {count} rows")
+        self.stdout.write(self.style.SUCCESS("Rollups rebuilt."))
@@ -0,0 +1,210 @@
+# Generated by Django 5.2.18 on 2026-10-16 22:42
+
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+
+ORDER_STATUSES = ("pending", "preparing", "ready", "collected", "cancelled")
+
+
+def _order_counter_annotations():
+    annotations = {
+        "total": Count("id"),
+        "revenue_sum": Sum("total_price", filter=Q(status="collected")),
+    }
+    for status in ORDER_STATUSES:
+        annotations[f"{status}_count"] = Count("id", filter=Q(status=status))
+    return annotations
+
+
+def _order_counter_values(row):
+    values = {"total_orders": row["total"], "revenue": row["revenue_sum"] or Decimal("0.00")}
+    for status in ORDER_STATUSES:
+        values[f"{status}_orders"] = row[f"{status}_count"]
+    return values
+
+
+def build_rollups(apps, schema_editor):
+    """Fill the rollups from the existing orders, as the rebuild_rollups command does"""
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+    Feedback = apps.get_model("orders", "Feedback")
+    Payment = apps.get_model("payments", "Payment")
+    ShopDayRollup = apps.get_model("shops", "ShopDayRollup")
+    ShopHourRollup = apps.get_model("shops", "ShopHourRollup")
+    ShopDayItemRollup = apps.get_model("shops", "ShopDayItemRollup")
+    ShopDayPaymentRollup = apps.get_model("shops", "ShopDayPaymentRollup")
+    ShopDayRatingRollup = apps.get_model("shops", "ShopDayRatingRollup")
+    tz = timezone.get_current_timezone()
+
+    day_rows = (
+        Order.objects.values("shop_id", day=TruncDate("created_at", tzinfo=tz))
+        .annotate(**_order_counter_annotations())
+        .order_by()
+    )
+    ShopDayRollup.objects.bulk_create(
+        (ShopDayRollup(shop_id=row["shop_id"], date=row["day"], **_order_counter_values(row)) for row in day_rows.iterator()),
+        batch_size=1000,
+    )
+    hour_rows = (
+        Order.objects.values("shop_id", hour=Trunc("created_at", "hour", tzinfo=tz))
+        .annotate(**_order_counter_annotations())
+        .order_by()
+    )
+    ShopHourRollup.objects.bulk_create(
+        (ShopHourRollup(shop_id=row["shop_id"], hour_start=row["hour"], **_order_counter_values(row)) for row in hour_rows.iterator()),
+        batch_size=1000,
+    )
+    item_rows = (
+        OrderItem.objects.filter(order__status="collected")
+        .values("order__shop_id", "menu_item_id", day=TruncDate("order__created_at", tzinfo=tz))
+        .annotate(
+            quantity_sum=Sum("quantity"),
+            revenue_sum=Sum(F("quantity") * F("price")),
+            orders=Count("order", distinct=True),
+        )
+        .order_by()
+    )
+    ShopDayItemRollup.objects.bulk_create(
+        (
+            ShopDayItemRollup(
+                shop_id=row["order__shop_id"],
+                menu_item_id=row["menu_item_id"],
+                date=row["day"],
+                quantity=row["quantity_sum"],
+                revenue=row["revenue_sum"],
+                order_count=row["orders"],
+            )
+            for row in item_rows.iterator()
+        ),
+        batch_size=1000,
+    )
+    payment_rows = (
+        Payment.objects.filter(payment_status="paid")
+        .values("order__shop_id", "payment_method", day=TruncDate("order__created_at", tzinfo=tz))
+        .annotate(payments=Count("id"), amount=Sum("order__total_price"))
+        .order_by()
+    )
+    ShopDayPaymentRollup.objects.bulk_create(
+        (
+            ShopDayPaymentRollup(
+                shop_id=row["order__shop_id"],
+                date=row["day"],
+                payment_method=row["payment_method"],
+                payment_count=row["payments"],
+                total_amount=row["amount"] or Decimal("0.00"),
+            )
+            for row in payment_rows.iterator()
+        ),
+        batch_size=1000,
+    )
+    rating_rows = (
+        Feedback.objects.values("shop_id", "rating", day=TruncDate("created_at", tzinfo=tz))
+        .annotate(feedbacks=Count("id"))
+        .order_by()
+    )
+    ShopDayRatingRollup.objects.bulk_create(
+        (
+            ShopDayRatingRollup(shop_id=row["shop_id"], date=row["day"], rating=row["rating"], feedback_count=row["feedbacks"])
+            for row in rating_rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_menuitem_image'),
+        ('orders', '0002_feedback'),
+        ('payments', '0002_paymentconfig'),
+        ('shops', '0003_shop_email_shop_phone_number'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopDayItemRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('quantity', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('order_count', models.IntegerField(default=0)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_rollups', to='menu.menuitem')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_rollups', to='shops.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['shop', 'date'], name='shops_shopd_shop_id_fe3d84_idx')],
+                'constraints': [models.UniqueConstraint(fields=('menu_item', 'date'), name='unique_item_rollup_per_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopDayPaymentRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('payment_method', models.CharField(max_length=10)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_rollups', to='shops.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'date', 'payment_method'), name='unique_payment_rollup_per_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopDayRatingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('rating', models.IntegerField()),
+                ('feedback_count', models.IntegerField(default=0)),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rating_rollups', to='shops.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'date', 'rating'), name='unique_rating_rollup_per_day')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopDayRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_orders', models.IntegerField(default=0)),
+                ('pending_orders', models.IntegerField(default=0)),
+                ('preparing_orders', models.IntegerField(default=0)),
+                ('ready_orders', models.IntegerField(default=0)),
+                ('collected_orders', models.IntegerField(default=0)),
+                ('cancelled_orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('date', models.DateField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='day_rollups', to='shops.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'date'), name='unique_day_rollup_per_shop')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ShopHourRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_orders', models.IntegerField(default=0)),
+                ('pending_orders', models.IntegerField(default=0)),
+                ('preparing_orders', models.IntegerField(default=0)),
+                ('ready_orders', models.IntegerField(default=0)),
+                ('collected_orders', models.IntegerField(default=0)),
+                ('cancelled_orders', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('hour_start', models.DateTimeField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hour_rollups', to='shops.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'hour_start'), name='unique_hour_rollup_per_shop')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0004_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopSlotForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot_start', models.DateTimeField()),
+                ('expected_orders', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slot_forecasts', to='shops.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'slot_start'), name='unique_forecast_per_slot')],
+            },
+        ),
+    ]
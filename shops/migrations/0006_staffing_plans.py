@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:04
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0005_slot_forecasts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopStaffingPlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(help_text='ISO weekday, 1 = Monday')),
+                ('hour', models.PositiveSmallIntegerField()),
+                ('arrival_rate', models.FloatField(help_text='Average orders per hour')),
+                ('service_minutes', models.FloatField(help_text='Average preparation minutes per order')),
+                ('staff', models.PositiveSmallIntegerField()),
+                ('expected_wait_minutes', models.FloatField()),
+                ('target_wait_minutes', models.FloatField()),
+                ('computed_at', models.DateTimeField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='staffing_plans', to='shops.shop')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('shop', 'weekday', 'hour'), name='unique_staffing_plan_per_hour')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('menu', '0002_menuitem_image'),
+        ('shops', '0006_staffing_plans'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ItemCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('order_count', models.IntegerField(default=0)),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cooccurrences', to='menu.menuitem')),
+                ('other_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cooccurring', to='menu.menuitem')),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='item_cooccurrences', to='shops.shop')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['item', '-order_count'], name='shops_itemc_item_id_7aab0b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'other_item'), name='unique_item_pair')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0007_item_cooccurrences'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopAnomaly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('hour', 'Hour'), ('day', 'Day')], max_length=10)),
+                ('metric', models.CharField(choices=[('orders', 'Orders'), ('revenue', 'Revenue')], max_length=10)),
+                ('period_start', models.DateTimeField()),
+                ('value', models.FloatField()),
+                ('expected', models.FloatField()),
+                ('score', models.FloatField(help_text='Robust z-score; negative for drops')),
+                ('detected_at', models.DateTimeField()),
+                ('shop', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='anomalies', to='shops.shop')),
+            ],
+            options={
+                'ordering': ['-period_start'],
+                'constraints': [models.UniqueConstraint(fields=('shop', 'granularity', 'metric', 'period_start'), name='unique_anomaly_per_period')],
+            },
+        ),
+    ]
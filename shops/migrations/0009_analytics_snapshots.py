@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-16 23:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0008_shop_anomalies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('backend', models.CharField(max_length=20)),
+                ('computed_at', models.DateTimeField()),
+                ('duration_seconds', models.FloatField(default=0)),
+                ('results', models.BinaryField()),
+                ('shop', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='analytics_snapshot', to='shops.shop')),
+            ],
+        ),
+    ]
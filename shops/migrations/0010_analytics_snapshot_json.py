@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:23
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0009_analytics_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analyticssnapshot',
+            name='data_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        # Pickled results cannot be converted; existing snapshots are recomputed
+        # by the next precompute_analytics run (version 0 never matches until then)
+        migrations.RemoveField(
+            model_name='analyticssnapshot',
+            name='results',
+        ),
+        migrations.AddField(
+            model_name='analyticssnapshot',
+            name='results',
+            field=models.JSONField(default=list, encoder=django.core.serializers.json.DjangoJSONEncoder),
+        ),
+    ]
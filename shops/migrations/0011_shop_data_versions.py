@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shops', '0010_analytics_snapshot_json'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShopDataVersion',
+            fields=[
+                ('shop', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='data_version', serialize=False, to='shops.shop')),
+                ('version', models.BigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db import models
 
 
@@ -16,3 +17,225 @@ class Shop(models.Model):
 
     def __str__(self):
         return self.name
+
+
+class OrderRollup(models.Model):
+    """Order counters shared by the per-day and per-hour rollup tables."""
+    total_orders = models.IntegerField(default=0)
+    pending_orders = models.IntegerField(default=0)
+    preparing_orders = models.IntegerField(default=0)
+    ready_orders = models.IntegerField(default=0)
+    collected_orders = models.IntegerField(default=0)
+    cancelled_orders = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ShopDayRollup(OrderRollup):
+    """Orders per shop and local calendar day."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="day_rollups")
+    date = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "date"], name="unique_day_rollup_per_shop"),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.date}"
+
+
+class ShopHourRollup(OrderRollup):
+    """Orders per shop and clock hour."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="hour_rollups")
+    hour_start = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "hour_start"], name="unique_hour_rollup_per_shop"),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.hour_start}"
+
+
+class ShopDayItemRollup(models.Model):
+    """Collected quantity and revenue per menu item and day."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="item_rollups")
+    menu_item = models.ForeignKey("menu.MenuItem", on_delete=models.CASCADE, related_name="day_rollups")
+    date = models.DateField()
+    quantity = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["menu_item", "date"], name="unique_item_rollup_per_day"),
+        ]
+        indexes = [
+            models.Index(fields=["shop", "date"]),
+        ]
+
+    def __str__(self):
+        return f"{self.menu_item_id} - {self.date}"
+
+
+class ShopDayPaymentRollup(models.Model):
+    """Paid transactions per payment method and day."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="payment_rollups")
+    date = models.DateField()
+    payment_method = models.CharField(max_length=10)
+    payment_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "date", "payment_method"],
+                name="unique_payment_rollup_per_day",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.date} - {self.payment_method}"
+
+
+class ShopDayRatingRollup(models.Model):
+    """Feedback count per star rating and day."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="rating_rollups")
+    date = models.DateField()
+    rating = models.IntegerField()
+    feedback_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "date", "rating"], name="unique_rating_rollup_per_day"),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.date} - {self.rating}★"
+
+
+class ShopSlotForecast(models.Model):
+    """Forecast number of orders for one 15-minute pickup slot."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="slot_forecasts")
+    slot_start = models.DateTimeField()
+    expected_orders = models.FloatField(default=0)
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "slot_start"], name="unique_forecast_per_slot"),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.slot_start} - {self.expected_orders:.1f}"
+
+
+class ShopStaffingPlan(models.Model):
+    """Recommended kitchen staff for one weekday and hour (Erlang C model)."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="staffing_plans")
+    weekday = models.PositiveSmallIntegerField(help_text="ISO weekday, 1 = Monday")
+    hour = models.PositiveSmallIntegerField()
+    arrival_rate = models.FloatField(help_text="Average orders per hour")
+    service_minutes = models.FloatField(help_text="Average preparation minutes per order")
+    staff = models.PositiveSmallIntegerField()
+    expected_wait_minutes = models.FloatField()
+    target_wait_minutes = models.FloatField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["shop", "weekday", "hour"], name="unique_staffing_plan_per_hour"),
+        ]
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.weekday} {self.hour:02d}:00 - {self.staff} staff"
+
+
+class ItemCooccurrence(models.Model):
+    """Number of orders containing both menu items (stored in both directions)."""
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="item_cooccurrences")
+    item = models.ForeignKey("menu.MenuItem", on_delete=models.CASCADE, related_name="cooccurrences")
+    other_item = models.ForeignKey("menu.MenuItem", on_delete=models.CASCADE, related_name="cooccurring")
+    order_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["item", "other_item"], name="unique_item_pair"),
+        ]
+        indexes = [
+            # Neighbours of the items in a cart come from one index range scan per item
+            models.Index(fields=["item", "-order_count"]),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} + {self.other_item_id} x {self.order_count}"
+
+
+class ShopAnomaly(models.Model):
+    """An hour or day whose orders or revenue fell far outside the shop's usual level."""
+    GRANULARITY_HOUR = "hour"
+    GRANULARITY_DAY = "day"
+    GRANULARITY_CHOICES = [
+        (GRANULARITY_HOUR, "Hour"),
+        (GRANULARITY_DAY, "Day"),
+    ]
+
+    METRIC_ORDERS = "orders"
+    METRIC_REVENUE = "revenue"
+    METRIC_CHOICES = [
+        (METRIC_ORDERS, "Orders"),
+        (METRIC_REVENUE, "Revenue"),
+    ]
+
+    shop = models.ForeignKey(Shop, on_delete=models.CASCADE, related_name="anomalies")
+    granularity = models.CharField(max_length=10, choices=GRANULARITY_CHOICES)
+    metric = models.CharField(max_length=10, choices=METRIC_CHOICES)
+    period_start = models.DateTimeField()
+    value = models.FloatField()
+    expected = models.FloatField()
+    score = models.FloatField(help_text="Robust z-score; negative for drops")
+    detected_at = models.DateTimeField()
+
+    class Meta:
+        ordering = ["-period_start"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["shop", "granularity", "metric", "period_start"],
+                name="unique_anomaly_per_period",
+            ),
+        ]
+
+    @property
+    def is_drop(self):
+        return self.score < 0
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.metric} {self.granularity} {self.period_start} ({self.score:+.1f})"
+
+
+class ShopDataVersion(models.Model):
+    """Counter moved in the same transaction as every change to a shop's analytics data."""
+    shop = models.OneToOneField(Shop, on_delete=models.CASCADE, primary_key=True, related_name="data_version")
+    version = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.shop.name} - v{self.version}"
+
+
+class AnalyticsSnapshot(models.Model):
+    """Dashboard results precomputed for a shop by the precompute_analytics command."""
+    shop = models.OneToOneField(Shop, on_delete=models.CASCADE, related_name="analytics_snapshot")
+    backend = models.CharField(max_length=20)
+    computed_at = models.DateTimeField()
+    duration_seconds = models.FloatField(default=0)
+    # ShopDataVersion.version the results were computed from
+    data_version = models.BigIntegerField(default=0)
+    # ShopAnalyticsService.export_results(): [memo key, result] pairs
+    results = models.JSONField(encoder=DjangoJSONEncoder, default=list)
+
+    def __str__(self):
+        return f"{self.shop.name} - {self.computed_at}"
@@ -0,0 +1,95 @@
+"""
+"Customers also ordered" recommendations from menu item co-occurrence.
+
+ItemCooccurrence counts, for every ordered pair of menu items of a shop, the
+orders that contained both; each pair is stored in both directions so the
+neighbours of an item are one range of the (item, -order_count) index.
+Checkout calls record_order_items inside the order transaction, which costs a
+fixed number of queries however large the cart, and rebuild_cooccurrences
+recomputes the table from OrderItem with one grouped self-join.
+"""
+
+from itertools import permutations
+
+from django.db import transaction
+from django.db.models import Count, F, Sum
+
+from menu.models import MenuItem
+from orders.models import OrderItem
+
+from .models import ItemCooccurrence, Shop
+
+
+RECOMMENDATION_LIMIT = 4
+
+
+def record_order_items(order, item_ids):
+    """Count one more order for every pair of the given menu items"""
+    item_ids = sorted(set(item_ids))
+    if len(item_ids) < 2:
+        return
+    # Make sure every pair row exists, then increment them all in one UPDATE:
+    # a pair created by a concurrent checkout is skipped here and still counted
+    ItemCooccurrence.objects.bulk_create(
+        [
+            ItemCooccurrence(shop_id=order.shop_id, item_id=item_id, other_item_id=other_item_id, order_count=0)
+            for item_id, other_item_id in permutations(item_ids, 2)
+        ],
+        ignore_conflicts=True,
+    )
+    ItemCooccurrence.objects.filter(item_id__in=item_ids, other_item_id__in=item_ids).update(
+        order_count=F("order_count") + 1
+    )
+
+
+def forget_order_items(order, item_ids):
+    """Count one order less for every pair of the given menu items, e.g. when it is deleted"""
+    item_ids = sorted(set(item_ids))
+    if len(item_ids) < 2:
+        return
+    ItemCooccurrence.objects.filter(
+        item_id__in=item_ids, other_item_id__in=item_ids, order_count__gt=0
+    ).update(order_count=F("order_count") - 1)
+
+
+@transaction.atomic
+def rebuild_cooccurrences(shop_ids=None):
+    """Recompute the co-occurrence counts from the order history; returns the rows written"""
+    shops = Shop.objects.filter(id__in=shop_ids) if shop_ids else Shop.objects.all()
+    rows = (
+        OrderItem.objects.filter(order__shop__in=shops)
+        .annotate(other=F("order__items__menu_item"))
+        .exclude(other=F("menu_item"))
+        .values("order__shop_id", "menu_item_id", "other")
+        .annotate(orders=Count("order_id", distinct=True))
+        .order_by()
+    )
+    pairs = [
+        ItemCooccurrence(
+            shop_id=row["order__shop_id"],
+            item_id=row["menu_item_id"],
+            other_item_id=row["other"],
+            order_count=row["orders"],
+        )
+        for row in rows
+    ]
+    ItemCooccurrence.objects.filter(shop__in=shops).delete()
+    ItemCooccurrence.objects.bulk_create(pairs, batch_size=1000)
+    return len(pairs)
+
+
+def recommended_items(shop, item_ids=(), limit=RECOMMENDATION_LIMIT):
+    """
+    Available menu items most often ordered together with item_ids, best first,
+    in a single query. Without item_ids, the items that appear in the most
+    combinations at the shop.
+    """
+    items = MenuItem.objects.filter(shop=shop, is_available=True)
+    if item_ids:
+        items = items.filter(cooccurring__item_id__in=item_ids).exclude(id__in=item_ids)
+    return list(
+        items.annotate(together=Sum("cooccurring__order_count"))
+        .filter(together__gt=0)
+        .select_related("category")
+        .order_by("-together", "name")[:limit]
+    )
@@ -0,0 +1,299 @@
+"""
+Incrementally maintained per-shop rollup tables used by the analytics dashboard.
+
+The write paths in orders.views and the order and payment admins call the
+record_* helpers inside the same transaction as the change, and rebuild_rollups()
+recomputes every table from the raw Order/OrderItem/Payment/Feedback rows.
+Both bump the shop's analytics data version on commit so cached dashboard
+results are invalidated.
+"""
+
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Trunc, TruncDate
+from django.utils import timezone
+
+from orders.models import Feedback, Order, OrderItem
+from payments.models import Payment
+
+from .analytics_cache import bump_data_version_on_commit
+from .models import (
+    Shop,
+    ShopDayItemRollup,
+    ShopDayPaymentRollup,
+    ShopDayRatingRollup,
+    ShopDayRollup,
+    ShopHourRollup,
+)
+
+
+STATUS_FIELDS = {
+    Order.STATUS_PENDING: "pending_orders",
+    Order.STATUS_PREPARING: "preparing_orders",
+    Order.STATUS_READY: "ready_orders",
+    Order.STATUS_COLLECTED: "collected_orders",
+    Order.STATUS_CANCELLED: "cancelled_orders",
+}
+
+
+def local_day(value):
+    """Local calendar date of an aware datetime"""
+    return timezone.localtime(value).date()
+
+
+def local_hour(value):
+    """Start of the local clock hour containing an aware datetime"""
+    return timezone.localtime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def _bump(model, lookup, **deltas):
+    """Atomically add deltas to the rollup row identified by lookup, creating it if needed"""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    updates = {field: F(field) + delta for field, delta in deltas.items()}
+    if model.objects.filter(**lookup).update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            model.objects.create(**lookup, **deltas)
+    except IntegrityError:
+        # A concurrent writer created the row first
+        model.objects.filter(**lookup).update(**updates)
+
+
+def _bump_order_counters(order, sign, status):
+    deltas = {
+        "total_orders": sign,
+        STATUS_FIELDS[status]: sign,
+    }
+    if status == Order.STATUS_COLLECTED:
+        deltas["revenue"] = sign * order.total_price
+    _bump(ShopDayRollup, {"shop_id": order.shop_id, "date": local_day(order.created_at)}, **deltas)
+    _bump(ShopHourRollup, {"shop_id": order.shop_id, "hour_start": local_hour(order.created_at)}, **deltas)
+
+
+def _bump_items(order, sign):
+    day = local_day(order.created_at)
+    for item in order.items.all():
+        _bump(
+            ShopDayItemRollup,
+            {"shop_id": order.shop_id, "menu_item_id": item.menu_item_id, "date": day},
+            quantity=sign * item.quantity,
+            revenue=sign * item.quantity * item.price,
+            order_count=sign,
+        )
+
+
+def _bump_payment(order, payment, sign):
+    if payment is None or payment.payment_status != Payment.STATUS_PAID:
+        return
+    _bump(
+        ShopDayPaymentRollup,
+        {
+            "shop_id": order.shop_id,
+            "date": local_day(order.created_at),
+            "payment_method": payment.payment_method,
+        },
+        payment_count=sign,
+        total_amount=sign * order.total_price,
+    )
+
+
+def _bump_rating(feedback, sign):
+    _bump(
+        ShopDayRatingRollup,
+        {"shop_id": feedback.shop_id, "date": local_day(feedback.created_at), "rating": feedback.rating},
+        feedback_count=sign,
+    )
+
+
+def record_order_placed(order, payment=None):
+    """Count a newly created order (and its payment) in the rollups"""
+    _bump_order_counters(order, 1, order.status)
+    if order.status == Order.STATUS_COLLECTED:
+        _bump_items(order, 1)
+    _bump_payment(order, payment, 1)
+    bump_data_version_on_commit(order.shop_id)
+
+
+def record_order_removed(order, payment=None):
+    """Take an order that is about to be deleted (and its payment) back out of the rollups"""
+    _bump_order_counters(order, -1, order.status)
+    if order.status == Order.STATUS_COLLECTED:
+        _bump_items(order, -1)
+    _bump_payment(order, payment, -1)
+    bump_data_version_on_commit(order.shop_id)
+
+
+def record_payment(payment):
+    """Count a payment created or changed outside checkout, e.g. in the admin"""
+    _bump_payment(payment.order, payment, 1)
+    bump_data_version_on_commit(payment.order.shop_id)
+
+
+def record_payment_removed(payment):
+    """Stop counting a payment that is deleted or about to be replaced by an edit"""
+    _bump_payment(payment.order, payment, -1)
+    bump_data_version_on_commit(payment.order.shop_id)
+
+
+def record_status_change(order, old_status):
+    """Move an order between status counters after order.status has changed"""
+    if old_status == order.status:
+        return
+    deltas = {STATUS_FIELDS[old_status]: -1, STATUS_FIELDS[order.status]: 1}
+    if old_status == Order.STATUS_COLLECTED:
+        deltas["revenue"] = -order.total_price
+    if order.status == Order.STATUS_COLLECTED:
+        deltas["revenue"] = order.total_price
+    _bump(ShopDayRollup, {"shop_id": order.shop_id, "date": local_day(order.created_at)}, **deltas)
+    _bump(ShopHourRollup, {"shop_id": order.shop_id, "hour_start": local_hour(order.created_at)}, **deltas)
+
+    if old_status == Order.STATUS_COLLECTED:
+        _bump_items(order, -1)
+    elif order.status == Order.STATUS_COLLECTED:
+        _bump_items(order, 1)
+    bump_data_version_on_commit(order.shop_id)
+
+
+def record_feedback(feedback):
+    """Count a newly submitted rating"""
+    _bump_rating(feedback, 1)
+    bump_data_version_on_commit(feedback.shop_id)
+
+
+def record_feedback_removed(feedback):
+    """Stop counting a rating that is deleted or about to be replaced by an edit"""
+    _bump_rating(feedback, -1)
+    bump_data_version_on_commit(feedback.shop_id)
+
+
+def _order_counter_annotations():
+    annotations = {
+        "total": Count("id"),
+        "revenue_sum": Sum("total_price", filter=Q(status=Order.STATUS_COLLECTED)),
+    }
+    for status, field in STATUS_FIELDS.items():
+        annotations[field + "_count"] = Count("id", filter=Q(status=status))
+    return annotations
+
+
+def _order_counter_values(row):
+    values = {
+        "total_orders": row["total"],
+        "revenue": row["revenue_sum"] or Decimal("0.00"),
+    }
+    for field in STATUS_FIELDS.values():
+        values[field] = row[field + "_count"]
+    return values
+
+
+@transaction.atomic
+def rebuild_rollups(shop_ids=None, batch_size=1000):
+    """
+    Recompute every rollup table from the raw tables with one grouped query per table.
+    Returns the number of rows written per rollup model.
+    """
+    tz = timezone.get_current_timezone()
+    orders = Order.objects.all()
+    items = OrderItem.objects.filter(order__status=Order.STATUS_COLLECTED)
+    payments = Payment.objects.filter(payment_status=Payment.STATUS_PAID)
+    feedbacks = Feedback.objects.all()
+    rollup_models = [ShopDayRollup, ShopHourRollup, ShopDayItemRollup, ShopDayPaymentRollup, ShopDayRatingRollup]
+
+    if shop_ids is not None:
+        orders = orders.filter(shop_id__in=shop_ids)
+        items = items.filter(order__shop_id__in=shop_ids)
+        payments = payments.filter(order__shop_id__in=shop_ids)
+        feedbacks = feedbacks.filter(shop_id__in=shop_ids)
+        for model in rollup_models:
+            model.objects.filter(shop_id__in=shop_ids).delete()
+    else:
+        for model in rollup_models:
+            model.objects.all().delete()
+
+    day_rows = (
+        orders.values("shop_id", day=TruncDate("created_at", tzinfo=tz))
+        .annotate(**_order_counter_annotations())
+        .order_by()
+    )
+    hour_rows = (
+        orders.values("shop_id", hour=Trunc("created_at", "hour", tzinfo=tz))
+        .annotate(**_order_counter_annotations())
+        .order_by()
+    )
+    item_rows = (
+        items.values("order__shop_id", "menu_item_id", day=TruncDate("order__created_at", tzinfo=tz))
+        .annotate(
+            quantity_sum=Sum("quantity"),
+            revenue_sum=Sum(F("quantity") * F("price")),
+            orders=Count("order", distinct=True),
+        )
+        .order_by()
+    )
+    payment_rows = (
+        payments.values("order__shop_id", "payment_method", day=TruncDate("order__created_at", tzinfo=tz))
+        .annotate(payments=Count("id"), amount=Sum("order__total_price"))
+        .order_by()
+    )
+    rating_rows = (
+        feedbacks.values("shop_id", "rating", day=TruncDate("created_at", tzinfo=tz))
+        .annotate(feedbacks=Count("id"))
+        .order_by()
+    )
+
+    written = {}
+    written[ShopDayRollup] = ShopDayRollup.objects.bulk_create(
+        (
+            ShopDayRollup(shop_id=row["shop_id"], date=row["day"], **_order_counter_values(row))
+            for row in day_rows.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    written[ShopHourRollup] = ShopHourRollup.objects.bulk_create(
+        (
+            ShopHourRollup(shop_id=row["shop_id"], hour_start=row["hour"], **_order_counter_values(row))
+            for row in hour_rows.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    written[ShopDayItemRollup] = ShopDayItemRollup.objects.bulk_create(
+        (
+            ShopDayItemRollup(
+                shop_id=row["order__shop_id"],
+                menu_item_id=row["menu_item_id"],
+                date=row["day"],
+                quantity=row["quantity_sum"],
+                revenue=row["revenue_sum"],
+                order_count=row["orders"],
+            )
+            for row in item_rows.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    written[ShopDayPaymentRollup] = ShopDayPaymentRollup.objects.bulk_create(
+        (
+            ShopDayPaymentRollup(
+                shop_id=row["order__shop_id"],
+                date=row["day"],
+                payment_method=row["payment_method"],
+                payment_count=row["payments"],
+                total_amount=row["amount"] or Decimal("0.00"),
+            )
+            for row in payment_rows.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    written[ShopDayRatingRollup] = ShopDayRatingRollup.objects.bulk_create(
+        (
+            ShopDayRatingRollup(shop_id=row["shop_id"], date=row["day"], rating=row["rating"], feedback_count=row["feedbacks"])
+            for row in rating_rows.iterator()
+        ),
+        batch_size=batch_size,
+    )
+    for shop_id in shop_ids if shop_ids is not None else Shop.objects.values_list("id", flat=True):
+        bump_data_version_on_commit(shop_id)
+    return {model.__name__: len(rows) for model, rows in written.items()}
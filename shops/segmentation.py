@@ -0,0 +1,142 @@
+"""
+RFM (recency, frequency, monetary) customer segmentation.
+
+A shop's non-cancelled orders are grouped per customer in a single query:
+days since the last order, number of orders and total spend. Each measure is
+scored 1-5 by the customer's percentile rank among the shop's customers (5 is
+most recent, most frequent, biggest spender) and the recency and frequency
+scores place the customer in a segment. Scoring runs on numpy arrays, so tens
+of thousands of customers cost one query and a few array passes.
+"""
+
+import numpy as np
+from django.db.models import Count, Max, Sum
+
+from orders.models import Order
+
+
+SCORE_LEVELS = 5
+
+# (name, description) in the order the rules in segment_customers are tried
+SEGMENTS = (
+    ("Champions", "Ordered recently and order often"),
+    ("Regulars", "Order often and still come back"),
+    ("New", "First order was recent"),
+    ("At risk", "Used to order often but have not been back lately"),
+    ("One-timers", "Ordered once, a while ago"),
+    ("Lapsed", "Have not ordered for a while"),
+    ("Occasional", "Order now and then"),
+)
+
+CSV_COLUMNS = [
+    "customer", "last_order", "days_since_last_order", "orders", "spend",
+    "recency_score", "frequency_score", "monetary_score", "segment",
+]
+
+
+def customer_totals(shop):
+    """Per-customer last order time, order count and spend at a shop, in one grouped query"""
+    return list(
+        Order.objects.filter(shop=shop)
+        .exclude(status=Order.STATUS_CANCELLED)
+        .values("user_id", "user__username")
+        .annotate(last_order=Max("created_at"), orders=Count("id"), spend=Sum("total_price"))
+        .values_list("user__username", "last_order", "orders", "spend")
+        .order_by()
+    )
+
+
+def percentile_scores(values, levels=SCORE_LEVELS):
+    """Score 1..levels by percentile rank; tied values share the higher score"""
+    values = np.asarray(values, dtype=float)
+    if not values.size:
+        return np.zeros(0, dtype=int)
+    rank = np.searchsorted(np.sort(values), values, side="right") / values.size
+    return np.clip(np.ceil(rank * levels), 1, levels).astype(int)
+
+
+def segment_customers(days_since, frequency, monetary):
+    """Recency, frequency and monetary scores plus a SEGMENTS index for every customer"""
+    days_since = np.asarray(days_since, dtype=float)
+    frequency = np.asarray(frequency)
+    recency_score = percentile_scores(-days_since)
+    frequency_score = percentile_scores(frequency)
+    monetary_score = percentile_scores(monetary)
+
+    recent = recency_score >= 4
+    lapsing = recency_score <= 2
+    frequent = (frequency_score >= 4) & (frequency > 1)
+    returning = (frequency_score >= 3) & (frequency > 1)
+    once = frequency == 1
+    segment = np.select(
+        [
+            recent & frequent,
+            returning & ~lapsing,
+            recent & once,
+            returning & lapsing,
+            once,
+            lapsing,
+        ],
+        list(range(len(SEGMENTS) - 1)),
+        default=len(SEGMENTS) - 1,
+    )
+    return recency_score, frequency_score, monetary_score, segment
+
+
+def customer_rfm(shop, now):
+    """One dict per customer of the shop, biggest spenders first"""
+    rows = customer_totals(shop)
+    if not rows:
+        return []
+    names, last_orders, orders, spend = zip(*rows)
+    now_ts = now.timestamp()
+    days_since = np.floor(
+        (now_ts - np.fromiter((last.timestamp() for last in last_orders), float, len(rows))) / 86400
+    ).clip(min=0)
+    frequency = np.array(orders)
+    monetary = np.array(spend, dtype=float)
+    recency_score, frequency_score, monetary_score, segment = segment_customers(days_since, frequency, monetary)
+
+    return [
+        {
+            "customer": names[index],
+            "last_order": last_orders[index],
+            "days_since_last_order": int(days_since[index]),
+            "orders": int(frequency[index]),
+            "spend": spend[index],
+            "recency_score": int(recency_score[index]),
+            "frequency_score": int(frequency_score[index]),
+            "monetary_score": int(monetary_score[index]),
+            "segment": SEGMENTS[segment[index]][0],
+        }
+        for index in np.lexsort((np.array(names), -monetary))
+    ]
+
+
+def summarize_segments(customers):
+    """Customer count, share, revenue and averages for every segment, in SEGMENTS order"""
+    totals = {name: {"customers": 0, "revenue": 0, "orders": 0, "days": 0, "top_customers": []} for name, _ in SEGMENTS}
+    for customer in customers:
+        segment = totals[customer["segment"]]
+        segment["customers"] += 1
+        segment["revenue"] += customer["spend"]
+        segment["orders"] += customer["orders"]
+        segment["days"] += customer["days_since_last_order"]
+        if len(segment["top_customers"]) < 3:
+            segment["top_customers"].append(customer["customer"])
+
+    summary = []
+    for name, description in SEGMENTS:
+        segment = totals[name]
+        count = segment["customers"]
+        summary.append({
+            "name": name,
+            "description": description,
+            "customers": count,
+            "share": round(count / len(customers) * 100, 1) if customers else 0,
+            "revenue": segment["revenue"],
+            "avg_orders": round(segment["orders"] / count, 1) if count else 0,
+            "avg_days_since": round(segment["days"] / count) if count else 0,
+            "top_customers": segment["top_customers"],
+        })
+    return summary
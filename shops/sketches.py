@@ -0,0 +1,48 @@
+"""
+Sketches for approximate analytics.
+
+QuantileSketch (a DDSketch-style log-bucketed histogram) answers quantiles
+with a bounded relative error. It takes numpy arrays and uses memory
+independent of the number of values added, so a long window can be
+summarised chunk by chunk.
+"""
+
+import math
+
+import numpy as np
+
+
+class QuantileSketch:
+    """Quantiles of positive values, each answer within relative_accuracy of a true value"""
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if not values.size:
+            return
+        positive = values[values > 0]
+        self.zeros += int(values.size - positive.size)
+        self.count += int(values.size)
+        keys, counts = np.unique(np.ceil(np.log(positive) / self.log_gamma).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.bins[key] = self.bins.get(key, 0) + count
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if rank < seen:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
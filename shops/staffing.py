@@ -0,0 +1,140 @@
+"""
+Kitchen staffing recommendations from an M/M/c (Erlang C) queueing model.
+
+For every shop, ISO weekday and hour the arrival rate is the average number of
+non-cancelled orders due for pickup in that hour over the last few weeks. The
+service time is the shop's average preparation work per order: the quantity
+weighted sum of MenuItem.preparation_time_minutes over the order's items. The
+recommended staff count is the smallest number of cooks for which the expected
+wait before an order is started stays under the target.
+
+The plan_staffing command stores the plan in ShopStaffingPlan for the
+analytics page to read.
+"""
+
+from datetime import datetime, time, timedelta
+
+import numpy as np
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import ExtractHour, ExtractIsoWeekDay
+from django.utils import timezone
+
+from orders.models import Order, OrderItem
+
+from .analytics_cache import bump_data_version_on_commit
+from .models import Shop, ShopStaffingPlan
+
+
+HISTORY_WEEKS = 4
+TARGET_WAIT_MINUTES = 5
+DEFAULT_SERVICE_MINUTES = 10  # MenuItem.preparation_time_minutes default
+
+
+def recommend_staff(arrival_rate, service_minutes, target_wait=TARGET_WAIT_MINUTES):
+    """
+    Smallest staff count meeting the wait target for each cell, and the expected
+    wait in minutes at that count. arrival_rate is in orders per hour;
+    service_minutes broadcasts against it; target_wait must be positive.
+    """
+    arrival_rate = np.asarray(arrival_rate, dtype=float)
+    service_rate = 60.0 / np.broadcast_to(service_minutes, arrival_rate.shape)  # orders per hour per cook
+    load = arrival_rate / service_rate  # offered load in Erlangs
+
+    staff = np.zeros(arrival_rate.shape, dtype=int)
+    wait = np.zeros(arrival_rate.shape)
+    blocking = np.ones(arrival_rate.shape)
+    servers = 0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        # The expected wait falls towards zero as staff grows, so every cell is met eventually
+        while (staff == 0).any():
+            servers += 1
+            # Erlang B by recursion, then Erlang C (probability of waiting) from it
+            blocking = load * blocking / (servers + load * blocking)
+            waiting = servers * blocking / (servers - load * (1 - blocking))
+            expected_wait = np.where(
+                load < servers,
+                waiting / (servers * service_rate - arrival_rate) * 60,
+                np.inf,
+            )
+            met = (staff == 0) & (expected_wait <= target_wait)
+            staff[met] = servers
+            wait[met] = expected_wait[met]
+    return staff, wait
+
+
+def hourly_arrival_rates(shop_ids, end, weeks=HISTORY_WEEKS):
+    """Array (shop, ISO weekday - 1, hour) of average orders per hour in the weeks before end"""
+    tz = timezone.get_current_timezone()
+    counts = np.zeros((len(shop_ids), 7, 24))
+    rows = (
+        Order.objects.filter(
+            shop_id__in=shop_ids,
+            pickup_time__gte=end - timedelta(weeks=weeks),
+            pickup_time__lt=end,
+        )
+        .exclude(status=Order.STATUS_CANCELLED)
+        .annotate(weekday=ExtractIsoWeekDay("pickup_time", tzinfo=tz), hour=ExtractHour("pickup_time", tzinfo=tz))
+        .values("shop_id", "weekday", "hour")
+        .annotate(orders=Count("id"))
+        .order_by()
+    )
+    index = {shop_id: position for position, shop_id in enumerate(shop_ids)}
+    for row in rows:
+        counts[index[row["shop_id"]], row["weekday"] - 1, row["hour"]] = row["orders"]
+    # Every weekday occurs exactly once per week of history
+    return counts / weeks
+
+
+def service_minutes_per_order(shop_ids, end, weeks=HISTORY_WEEKS):
+    """Average preparation minutes per order for each shop, in one grouped query"""
+    rows = (
+        OrderItem.objects.filter(
+            order__shop_id__in=shop_ids,
+            order__pickup_time__gte=end - timedelta(weeks=weeks),
+            order__pickup_time__lt=end,
+        )
+        .exclude(order__status=Order.STATUS_CANCELLED)
+        .values("order__shop_id")
+        .annotate(
+            work=Sum(F("quantity") * F("menu_item__preparation_time_minutes")),
+            orders=Count("order_id", distinct=True),
+        )
+        .order_by()
+    )
+    minutes = {row["order__shop_id"]: row["work"] / row["orders"] for row in rows if row["work"]}
+    return np.array([minutes.get(shop_id, DEFAULT_SERVICE_MINUTES) for shop_id in shop_ids], dtype=float)
+
+
+@transaction.atomic
+def run_staffing(shop_ids=None, weeks=HISTORY_WEEKS, target_wait=TARGET_WAIT_MINUTES, now=None):
+    """Recompute and store every shop's staffing plan; returns the number of hours planned"""
+    now = now or timezone.now()
+    end = timezone.make_aware(datetime.combine(timezone.localdate(now), time.min))
+    shops = list(Shop.objects.filter(id__in=shop_ids) if shop_ids else Shop.objects.all())
+    shop_ids = [shop.id for shop in shops]
+
+    rates = hourly_arrival_rates(shop_ids, end, weeks)
+    service = service_minutes_per_order(shop_ids, end, weeks)
+    staff, wait = recommend_staff(rates, service[:, np.newaxis, np.newaxis], target_wait)
+
+    rows = [
+        ShopStaffingPlan(
+            shop_id=shop_ids[position],
+            weekday=weekday + 1,
+            hour=hour,
+            arrival_rate=round(float(rates[position, weekday, hour]), 3),
+            service_minutes=round(float(service[position]), 2),
+            staff=int(staff[position, weekday, hour]),
+            expected_wait_minutes=round(float(wait[position, weekday, hour]), 2),
+            target_wait_minutes=target_wait,
+            computed_at=now,
+        )
+        for position, weekday, hour in zip(*np.nonzero(rates))
+    ]
+    ShopStaffingPlan.objects.filter(shop__in=shops).delete()
+    ShopStaffingPlan.objects.bulk_create(rows, batch_size=1000)
+    for shop_id in shop_ids:
+        bump_data_version_on_commit(shop_id)
+    return len(rows)
+
@@ -0,0 +1,907 @@
+import json
+import multiprocessing
+import threading
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from unittest import skipUnless
+
+import numpy as np
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import Notification, Profile
+from menu.models import Category, MenuItem
+from orders.models import Feedback, Order, OrderItem
+from payments.models import Payment
+
+from .analytics_snapshots import compute_snapshot, get_fresh_snapshot, precompute_snapshots, snapshot_service
+from .anomalies import detect_anomalies, robust_scores
+from .campus_analytics import build_campus_report, get_campus_report
+from .analytics_executor import Panel, run_panels
+from .analytics_numpy import NumpyShopAnalyticsService
+from .analytics_panels import PANELS
+from .analytics_service import ShopAnalyticsService, get_analytics_service
+from .forecasting import fit_forecasts, run_forecasts, weekly_slot_counts
+from .models import (
+    AnalyticsSnapshot,
+    ItemCooccurrence,
+    Shop,
+    ShopAnomaly,
+    ShopDayItemRollup,
+    ShopDayRollup,
+    ShopHourRollup,
+    ShopSlotForecast,
+)
+from .segmentation import segment_customers
+from .sketches import QuantileSketch
+from .recommendations import rebuild_cooccurrences, record_order_items, recommended_items
+from .staffing import recommend_staff, run_staffing
+from .rollups import rebuild_rollups, record_feedback, record_order_placed, record_status_change
+
+
+User = get_user_model()
+
+
+class AnalyticsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(
+            username="owner@example.com",
+            email="owner@example.com",
+            password="password123",
+        )
+        Profile.objects.create(user=self.owner, role=Profile.ROLE_SHOP_OWNER)
+        self.shop = Shop.objects.create(
+            name="Campus Cafe",
+            owner=self.owner,
+            opening_time=time(0, 0),
+            closing_time=time(23, 59),
+        )
+        self.category = Category.objects.create(shop=self.shop, name="Snacks")
+        self.menu_item = MenuItem.objects.create(
+            shop=self.shop,
+            category=self.category,
+            name="Veg Sandwich",
+            price=Decimal("50.00"),
+        )
+        self.students = []
+        for index in range(3):
+            student = User.objects.create_user(
+                username=f"student{index}@example.com",
+                password="password123",
+            )
+            Profile.objects.create(user=student, role=Profile.ROLE_COLLEGE_USER, college_id=f"COL{index}")
+            self.students.append(student)
+
+    def create_order(self, created_at, status=Order.STATUS_COLLECTED, total="50.00", user=None):
+        order = Order.objects.create(
+            user=user or self.students[0],
+            shop=self.shop,
+            pickup_time=created_at + timedelta(minutes=30),
+            status=status,
+            total_price=Decimal(total),
+        )
+        OrderItem.objects.create(order=order, menu_item=self.menu_item, quantity=1, price=Decimal(total))
+        Order.objects.filter(pk=order.pk).update(created_at=created_at)
+        order.created_at = created_at
+        record_order_placed(order)
+        return order
+
+
+class TimeBucketReportTests(AnalyticsTestCase):
+    def test_daily_report_groups_orders_in_one_query_and_zero_fills_gaps(self):
+        now = timezone.localtime()
+        self.create_order(now - timedelta(days=2), total="40.00")
+        self.create_order(now - timedelta(days=2), status=Order.STATUS_CANCELLED)
+        self.create_order(now, total="60.00")
+
+        with self.assertNumQueries(1):
+            report = ShopAnalyticsService(self.shop, use_cache=False).get_daily_report(days=7)
+
+        daily_data = report["daily_data"]
+        self.assertEqual(len(daily_data), 8)
+        self.assertEqual(daily_data[-1]["date"], now.date())
+
+        two_days_ago = daily_data[-3]
+        self.assertEqual(two_days_ago["total_orders"], 2)
+        self.assertEqual(two_days_ago["completed_orders"], 1)
+        self.assertEqual(two_days_ago["revenue"], Decimal("40.00"))
+        self.assertEqual(daily_data[-2]["total_orders"], 0)
+        self.assertEqual(daily_data[-2]["revenue"], Decimal("0.00"))
+
+    def test_hourly_and_monthly_reports_keep_template_shapes(self):
+        now = timezone.localtime()
+        self.create_order(now, total="75.00")
+
+        service = ShopAnalyticsService(self.shop)
+        hourly_data = service.get_hourly_report(24)["hourly_data"]
+        monthly_data = service.get_monthly_report(12)["monthly_data"]
+        weekly_data = service.get_weekly_report(4)["weekly_data"]
+
+        self.assertEqual(len(hourly_data), 24)
+        self.assertEqual(hourly_data[-1]["total_orders"], 1)
+        self.assertEqual(hourly_data[-1]["revenue"], Decimal("75.00"))
+        self.assertEqual(len(monthly_data), 12)
+        self.assertEqual(monthly_data[-1]["month_num"], now.month)
+        self.assertEqual(monthly_data[-1]["avg_order_value"], Decimal("75.00"))
+        self.assertEqual(len(weekly_data), 4)
+        self.assertEqual(weekly_data[-1]["completed_orders"], 1)
+
+
+class RollupTests(AnalyticsTestCase):
+    def test_status_changes_move_counters_and_item_sales(self):
+        order = self.create_order(timezone.localtime(), status=Order.STATUS_PENDING, total="80.00")
+
+        order.status = Order.STATUS_COLLECTED
+        order.save(update_fields=["status"])
+        record_status_change(order, Order.STATUS_PENDING)
+
+        day = ShopDayRollup.objects.get(shop=self.shop)
+        self.assertEqual(day.pending_orders, 0)
+        self.assertEqual(day.collected_orders, 1)
+        self.assertEqual(day.revenue, Decimal("80.00"))
+        item = ShopDayItemRollup.objects.get(menu_item=self.menu_item)
+        self.assertEqual(item.quantity, 1)
+        self.assertEqual(item.order_count, 1)
+
+    def test_rebuild_matches_incremental_counters(self):
+        now = timezone.localtime()
+        self.create_order(now - timedelta(days=400), total="30.00")
+        self.create_order(now - timedelta(days=1), status=Order.STATUS_CANCELLED)
+        self.create_order(now, total="45.00")
+        incremental = list(ShopDayRollup.objects.order_by("date").values())
+        incremental_items = list(ShopDayItemRollup.objects.order_by("date").values("date", "quantity", "revenue"))
+
+        rebuild_rollups()
+
+        rebuilt = list(ShopDayRollup.objects.order_by("date").values())
+        for row in incremental + rebuilt:
+            row.pop("id")
+        self.assertEqual(rebuilt, incremental)
+        self.assertEqual(
+            list(ShopDayItemRollup.objects.order_by("date").values("date", "quantity", "revenue")),
+            incremental_items,
+        )
+
+    def test_update_status_view_records_collection(self):
+        order = self.create_order(timezone.localtime(), status=Order.STATUS_READY)
+        self.client.force_login(self.owner)
+
+        self.client.post(reverse("orders:update_status", args=[order.id]), {"status": Order.STATUS_COLLECTED})
+
+        day = ShopDayRollup.objects.get(shop=self.shop)
+        self.assertEqual(day.ready_orders, 0)
+        self.assertEqual(day.collected_orders, 1)
+
+
+class AnalyticsDashboardTests(AnalyticsTestCase):
+    def test_dashboard_renders_every_report_type(self):
+        self.create_order(timezone.localtime() - timedelta(days=1))
+        self.client.force_login(self.owner)
+
+        for report_type in ("daily", "weekly", "monthly", "hourly"):
+            response = self.client.get(reverse("shops:analytics"), {"period": "30", "report": report_type})
+            self.assertEqual(response.status_code, 200)
+
+            for panel in PANELS:
+                response = self.client.get(
+                    reverse("shops:analytics_panel", args=[panel]), {"period": "30", "report": report_type}
+                )
+                self.assertEqual(response.status_code, 200)
+                payload = response.json()
+                self.assertTrue(payload["html"].strip())
+                self.assertEqual(payload["unavailable"], [])
+
+    def test_unchanged_panel_revalidates_with_304(self):
+        self.create_order(timezone.localtime() - timedelta(days=1))
+        self.client.force_login(self.owner)
+        url = reverse("shops:analytics_panel", args=["summary"])
+
+        first = self.client.get(url, {"period": "7"})
+        etag = first["ETag"]
+        self.assertEqual(first.json()["charts"]["orderStatusChart"]["counts"], [0, 0, 0, 1, 0])
+
+        self.assertEqual(self.client.get(url, {"period": "7"}, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {"period": "30"}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.create_order(timezone.localtime())
+        changed = self.client.get(url, {"period": "7"}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+    def test_unknown_panel_is_404(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("shops:analytics_panel", args=["nope"]))
+        self.assertEqual(response.status_code, 404)
+
+
+class MemoizationTests(AnalyticsTestCase):
+    def test_ml_insights_reuse_panels_already_computed(self):
+        self.create_order(timezone.localtime() - timedelta(days=1))
+        service = ShopAnalyticsService(self.shop)
+
+        service.get_most_ordered_items(30, limit=10)
+        service.get_least_sold_items(30, limit=10)
+        service.get_payment_method_analysis(30)
+        service.get_peak_hours_analysis(30)
+        service.get_daily_report(30)
+        service.get_demand_forecast()
+        service.get_staffing_plan()
+        self.assertEqual(service.memo_stats, {"hits": 0, "misses": 7})
+
+        with self.assertNumQueries(0):
+            insights = service.get_ml_insights(30)
+
+        self.assertTrue(insights)
+        self.assertEqual(service.memo_stats, {"hits": 7, "misses": 8})
+
+    def test_keyword_and_positional_calls_share_an_entry(self):
+        service = ShopAnalyticsService(self.shop)
+
+        first = service.get_daily_report(7)
+        second = service.get_daily_report(days=7)
+
+        self.assertIs(first, second)
+        self.assertEqual(service.memo_stats["hits"], 1)
+
+
+class AnalyticsCacheTests(AnalyticsTestCase):
+    def test_results_are_shared_across_requests_until_data_changes(self):
+        self.create_order(timezone.localtime() - timedelta(days=1))
+        first = ShopAnalyticsService(self.shop).get_daily_report(7)
+
+        second_service = ShopAnalyticsService(self.shop)
+        # Only the shop's data version is read
+        with self.assertNumQueries(1):
+            second = second_service.get_daily_report(7)
+        self.assertEqual(second, first)
+        self.assertEqual(second_service.cache_stats, {"hits": 1, "misses": 0})
+
+        # No cache entry is touched: the stored version alone retires the old results
+        self.create_order(timezone.localtime())
+
+        third = ShopAnalyticsService(self.shop).get_daily_report(7)
+        self.assertEqual(third["daily_data"][-1]["total_orders"], first["daily_data"][-1]["total_orders"] + 1)
+
+    def test_menu_changes_invalidate_cached_item_panels(self):
+        self.create_order(timezone.localtime() - timedelta(days=1))
+        coffee = MenuItem.objects.create(shop=self.shop, category=self.category, name="Cold Coffee", price=Decimal("40.00"))
+        least_sold = ShopAnalyticsService(self.shop).get_least_sold_items(30)
+        self.assertEqual(least_sold[0]["menu_item__name"], "Cold Coffee")
+        self.client.force_login(self.owner)
+
+        self.client.get(reverse("shops:toggle_item", args=[coffee.id]))
+        least_sold = ShopAnalyticsService(self.shop).get_least_sold_items(30)
+        self.assertEqual([item["menu_item__name"] for item in least_sold], ["Veg Sandwich"])
+
+    def test_cache_can_be_bypassed(self):
+        ShopAnalyticsService(self.shop).get_daily_report(7)
+
+        service = ShopAnalyticsService(self.shop, use_cache=False)
+        with self.assertNumQueries(1):
+            service.get_daily_report(7)
+        self.assertEqual(service.cache_stats, {"hits": 0, "misses": 0})
+
+
+class SummaryStatsTests(AnalyticsTestCase):
+    def test_summary_uses_fixed_query_count_for_any_range(self):
+        today = timezone.localdate()
+        now = timezone.localtime()
+        self.create_order(now, total="60.00")
+        self.create_order(now, status=Order.STATUS_PENDING)
+        self.create_order(now - timedelta(days=10), total="30.00")
+        record_feedback(Feedback.objects.create(user=self.students[0], shop=self.shop, rating=4))
+        record_feedback(Feedback.objects.create(user=self.students[1], shop=self.shop, rating=2))
+
+        for days in (7, 365 * 3):
+            with self.assertNumQueries(2):
+                summary = ShopAnalyticsService(self.shop, use_cache=False).get_summary_stats(
+                    today - timedelta(days=days), today
+                )
+
+        summary = ShopAnalyticsService(self.shop).get_summary_stats(today - timedelta(days=7), today)
+        self.assertEqual(summary["period_stats"]["total_orders"], 2)
+        self.assertEqual(summary["period_stats"]["pending"], 1)
+        self.assertEqual(summary["total_revenue"], Decimal("60.00"))
+        self.assertEqual(summary["previous_revenue"], Decimal("30.00"))
+        self.assertEqual(summary["revenue_growth"], Decimal("100"))
+        self.assertEqual(summary["all_time_revenue"], Decimal("90.00"))
+        self.assertEqual(summary["avg_rating"], 3)
+        self.assertEqual(summary["rating_distribution"], {"5": 0, "4": 1, "3": 0, "2": 1, "1": 0})
+
+
+class PeakHoursTests(AnalyticsTestCase):
+    def test_hour_histogram_and_heatmap_are_grouped_in_sql(self):
+        monday_noon = timezone.make_aware(datetime.combine(
+            timezone.localdate() - timedelta(days=timezone.localdate().weekday() + 7), time(12, 15)
+        ))
+        self.create_order(monday_noon)
+        self.create_order(monday_noon + timedelta(minutes=20))
+        self.create_order(monday_noon + timedelta(days=1, hours=6))
+        service = ShopAnalyticsService(self.shop, use_cache=False)
+
+        with self.assertNumQueries(1):
+            peak = service.get_peak_hours_analysis(30)
+        with self.assertNumQueries(1):
+            heatmap = service.get_weekday_hour_heatmap(30)
+
+        self.assertEqual(len(peak["hourly_distribution"]), 24)
+        self.assertEqual(peak["busiest_hour"]["hour"], 12)
+        self.assertEqual(peak["busiest_hour"]["count"], 2)
+        self.assertEqual([hour["hour"] for hour in peak["slow_hours"]], [12, 18])
+        self.assertEqual(heatmap["days"][0]["day_name"], "Monday")
+        self.assertEqual(heatmap["days"][0]["hours"][12]["count"], 2)
+        self.assertEqual(heatmap["days"][1]["hours"][18]["intensity"], 0.5)
+
+
+class NumpyBackendTests(AnalyticsTestCase):
+    def test_numpy_engine_matches_rollup_engine(self):
+        now = timezone.localtime()
+        for days_ago, status, total in [(0, Order.STATUS_COLLECTED, "40.00"), (3, Order.STATUS_CANCELLED, "20.00"),
+                                        (9, Order.STATUS_COLLECTED, "65.50"), (40, Order.STATUS_PENDING, "10.00"),
+                                        (200, Order.STATUS_COLLECTED, "99.99")]:
+            order = self.create_order(now - timedelta(days=days_ago, hours=days_ago % 5), status=status, total=total)
+            Payment.objects.create(
+                order=order,
+                payment_method=Payment.METHOD_WALLET if days_ago % 2 else Payment.METHOD_CASH,
+                payment_status=Payment.STATUS_PAID,
+            )
+        rebuild_rollups()
+
+        rollups = ShopAnalyticsService(self.shop, now=now, use_cache=False)
+        vectorized = NumpyShopAnalyticsService(self.shop, now=now, use_cache=False)
+
+        self.assertEqual(vectorized.get_comprehensive_analytics(30), rollups.get_comprehensive_analytics(30))
+        self.assertEqual(vectorized.get_weekday_hour_heatmap(365), rollups.get_weekday_hour_heatmap(365))
+
+    def test_setting_selects_engine(self):
+        with self.settings(ANALYTICS_BACKEND="numpy"):
+            self.assertIsInstance(get_analytics_service(self.shop), NumpyShopAnalyticsService)
+        self.assertNotIsInstance(get_analytics_service(self.shop), NumpyShopAnalyticsService)
+
+
+class LeastSoldItemsTests(AnalyticsTestCase):
+    def test_single_query_includes_unsold_items_first(self):
+        MenuItem.objects.create(shop=self.shop, category=self.category, name="Cold Coffee", price=Decimal("40.00"))
+        MenuItem.objects.create(shop=self.shop, name="Retired Dish", price=Decimal("10.00"), is_available=False)
+        now = timezone.localtime()
+        self.create_order(now, total="50.00")
+        self.create_order(now - timedelta(days=1), total="50.00")
+        self.create_order(now - timedelta(days=60), total="50.00")
+        self.create_order(now, status=Order.STATUS_CANCELLED)
+
+        with self.assertNumQueries(1):
+            least_sold = ShopAnalyticsService(self.shop, use_cache=False).get_least_sold_items(30)
+
+        self.assertEqual([item["menu_item__name"] for item in least_sold], ["Cold Coffee", "Veg Sandwich"])
+        self.assertEqual(least_sold[0]["status"], "No sales")
+        self.assertEqual(least_sold[0]["total_revenue"], Decimal("0.00"))
+        self.assertEqual(least_sold[1]["total_quantity"], 2)
+        self.assertEqual(least_sold[1]["order_count"], 2)
+        self.assertEqual(least_sold[1]["total_revenue"], Decimal("100.00"))
+        self.assertEqual(least_sold[1]["status"], "Low sales")
+
+
+class PanelExecutorTests(SimpleTestCase):
+    def test_parallel_panels_fall_back_on_timeout_and_errors(self):
+        release = threading.Event()
+
+        def slow_panel():
+            release.wait(5)
+            return ["late"]
+
+        def broken_panel():
+            raise RuntimeError("boom")
+
+        try:
+            with self.assertLogs("shops.analytics_executor", "WARNING"):
+                results, unavailable = run_panels(
+                    {
+                        "fast": Panel(lambda value: value * 2, 21),
+                        "slow": Panel(slow_panel, fallback=[]),
+                        "broken": Panel(broken_panel),
+                    },
+                    parallel=True,
+                    max_workers=3,
+                    timeout=0.2,
+                )
+        finally:
+            release.set()
+
+        self.assertEqual(results, {"fast": 42, "slow": [], "broken": {}})
+        self.assertEqual(sorted(unavailable), ["broken", "slow"])
+
+    def test_queued_panels_get_their_own_timeout(self):
+        def panel(value):
+            threading.Event().wait(0.15)
+            return value
+
+        results, unavailable = run_panels(
+            {f"panel-{number}": Panel(panel, number) for number in range(4)},
+            parallel=True,
+            max_workers=2,
+            timeout=0.25,
+        )
+
+        self.assertEqual(results, {f"panel-{number}": number for number in range(4)})
+        self.assertEqual(unavailable, [])
+
+    def test_sequential_mode_runs_inline(self):
+        results, unavailable = run_panels({"value": Panel(sum, [1, 2, 3])}, parallel=False)
+
+        self.assertEqual(results, {"value": 6})
+        self.assertEqual(unavailable, [])
+
+
+class DemandForecastTests(AnalyticsTestCase):
+    def test_smoothing_weights_recent_weeks_and_splits_hours_into_slots(self):
+        counts = np.zeros((1, 3, 7, 24, 4))
+        counts[0, :, 0, 12, 0] = [4, 2, 2]  # Monday 12:00, oldest week first
+        counts[0, :, 0, 12, 2] = [0, 0, 4]  # Monday 12:30, only last week
+
+        forecast = fit_forecasts(counts, alpha=0.5)[0]
+
+        # Week weights 0.25, 0.25, 0.5: 12:00 -> 2.5 and 12:30 -> 2.0 out of 4.5 for the hour
+        self.assertAlmostEqual(forecast[0, 12].sum(), 4.5)
+        self.assertAlmostEqual(forecast[0, 12, 0], 2.5)
+        self.assertAlmostEqual(forecast[0, 12, 2], 2.0)
+        self.assertEqual(forecast[1].sum(), 0)
+
+    def test_order_on_the_history_boundary_is_left_out(self):
+        anchor = timezone.make_aware(datetime.combine(timezone.localdate(), time(0, 0)))
+        oldest = anchor - timedelta(weeks=3)
+        self.create_order(oldest - timedelta(minutes=30))
+        self.create_order(oldest + timedelta(minutes=15) - timedelta(minutes=30))
+
+        counts = weekly_slot_counts([self.shop.id], anchor, weeks=3)
+
+        # Only the order just inside the window, in the oldest week; nothing wraps into the newest
+        self.assertEqual(counts.sum(), 1)
+        self.assertEqual(counts[0, 0].sum(), 1)
+        self.assertEqual(counts[0, -1].sum(), 0)
+
+    def test_batch_stores_slot_forecasts_and_reports_an_insight(self):
+        self.shop.opening_time = time(9, 0)
+        self.shop.closing_time = time(17, 0)
+        self.shop.max_orders_per_slot = 1
+        self.shop.save()
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        for weeks_back in (1, 2):
+            pickup = timezone.make_aware(datetime.combine(tomorrow - timedelta(weeks=weeks_back), time(12, 30)))
+            for student in self.students[:2]:
+                self.create_order(pickup - timedelta(minutes=30), user=student)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            written = run_forecasts(shop_ids=[self.shop.id])
+
+        # 09:00 to 17:00 inclusive is 33 slots a day
+        self.assertEqual(written, 33 * 7)
+        slot = ShopSlotForecast.objects.get(
+            shop=self.shop,
+            slot_start=timezone.make_aware(datetime.combine(tomorrow, time(12, 30))),
+        )
+        self.assertAlmostEqual(slot.expected_orders, 2.0)
+
+        forecast = ShopAnalyticsService(self.shop).get_demand_forecast()
+        self.assertEqual(forecast["busiest_slot"]["slot_start"], slot.slot_start)
+        self.assertEqual(forecast["suggested_capacity"], 2)
+        insights = ShopAnalyticsService(self.shop).get_ml_insights(30)
+        self.assertIn("Demand Forecast", [insight["category"] for insight in insights])
+
+
+class StaffingTests(AnalyticsTestCase):
+    def test_erlang_c_picks_smallest_staff_meeting_the_wait_target(self):
+        # 10-minute orders: one cook serves 6 per hour
+        staff, wait = recommend_staff(np.array([0.0, 3.0, 6.0, 12.0]), 10, target_wait=5)
+
+        # One cook at 3/hour: P(wait) = 0.5, wait = 0.5 / (6 - 3) hours = 10 minutes, too long
+        self.assertEqual(staff.tolist(), [1, 2, 2, 3])
+        # Two cooks at 6/hour: P(wait) = 1/3, wait = (1/3) / (12 - 6) hours
+        self.assertAlmostEqual(wait[2], 60 / 18)
+
+    def test_batch_plan_is_shown_on_the_analytics_page(self):
+        self.menu_item.preparation_time_minutes = 10
+        self.menu_item.save()
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        for weeks_back in (1, 2):
+            pickup = timezone.make_aware(datetime.combine(tomorrow - timedelta(weeks=weeks_back), time(12, 15)))
+            for student in self.students:
+                self.create_order(pickup - timedelta(minutes=30), user=student)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            planned = run_staffing(shop_ids=[self.shop.id], weeks=2)
+
+        self.assertEqual(planned, 1)
+        plan = ShopAnalyticsService(self.shop).get_staffing_plan()
+        self.assertEqual(plan["peak"]["weekday"], tomorrow.isoweekday())
+        self.assertEqual(plan["peak"]["arrival_rate"], 3.0)
+        self.assertEqual(plan["hours"], [12])
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("shops:analytics_panel", args=["staffing"]))
+        self.assertIn("Recommended Kitchen Staff", response.json()["html"])
+
+
+class RecommendationTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tea, self.samosa, self.juice = [
+            MenuItem.objects.create(shop=self.shop, category=self.category, name=name, price=Decimal("20.00"))
+            for name in ("Tea", "Samosa", "Juice")
+        ]
+
+    def place(self, *items):
+        order = self.create_order(timezone.now())
+        for item in items:
+            OrderItem.objects.create(order=order, menu_item=item, quantity=1, price=item.price)
+        record_order_items(order, [self.menu_item.id] + [item.id for item in items])
+        return order
+
+    def test_counts_are_maintained_in_constant_queries_and_match_a_rebuild(self):
+        self.place(self.tea)
+        order = self.create_order(timezone.now())
+        items = [self.menu_item, self.tea, self.samosa, self.juice]
+        for item in items[1:]:
+            OrderItem.objects.create(order=order, menu_item=item, quantity=1, price=item.price)
+        # Insert the missing pairs and increment them all, whatever the cart size
+        with self.assertNumQueries(2):
+            record_order_items(order, [item.id for item in items])
+
+        counts = {(row.item_id, row.other_item_id): row.order_count for row in ItemCooccurrence.objects.all()}
+        self.assertEqual(counts[(self.menu_item.id, self.tea.id)], 2)
+        self.assertEqual(counts[(self.tea.id, self.menu_item.id)], 2)
+        self.assertEqual(counts[(self.samosa.id, self.juice.id)], 1)
+        self.assertEqual(len(counts), 12)
+
+        self.assertEqual(rebuild_cooccurrences(shop_ids=[self.shop.id]), 12)
+        rebuilt = {(row.item_id, row.other_item_id): row.order_count for row in ItemCooccurrence.objects.all()}
+        self.assertEqual(rebuilt, counts)
+
+    def test_recommendations_are_read_in_one_query(self):
+        self.place(self.tea)
+        self.place(self.tea, self.samosa)
+        self.place(self.juice)
+        self.juice.is_available = False
+        self.juice.save()
+
+        with self.assertNumQueries(1):
+            recommended = recommended_items(self.shop, [self.menu_item.id])
+        self.assertEqual([item.name for item in recommended], ["Tea", "Samosa"])
+        self.assertEqual(recommended[0].together, 2)
+
+        self.client.force_login(self.students[0])
+        self.client.get(reverse("orders:add_to_cart", args=[self.tea.id]))
+        response = self.client.get(reverse("shops:detail", args=[self.shop.id]))
+        self.assertEqual([item.name for item in response.context["recommendations"]], ["Veg Sandwich", "Samosa"])
+        response = self.client.get(reverse("orders:cart"))
+        self.assertContains(response, "Customers also ordered")
+
+
+class CustomerSegmentationTests(AnalyticsTestCase):
+    def test_scores_rank_customers_within_the_shop(self):
+        recency, frequency, monetary, segment = segment_customers(
+            days_since=[1, 2, 40, 60, 3],
+            frequency=[9, 1, 8, 1, 4],
+            monetary=[900, 50, 800, 40, 200],
+        )
+
+        self.assertEqual(recency.tolist(), [5, 4, 2, 1, 3])
+        self.assertEqual(frequency.tolist(), [5, 2, 4, 2, 3])
+        self.assertEqual(monetary.tolist(), [5, 2, 4, 1, 3])
+        # Champions, New, At risk, One-timers, Regulars
+        self.assertEqual(segment.tolist(), [0, 2, 3, 4, 1])
+
+    def test_segments_are_computed_from_one_query_and_cached(self):
+        now = timezone.now()
+        for days_ago in (1, 3, 5):
+            self.create_order(now - timedelta(days=days_ago), user=self.students[0])
+        self.create_order(now - timedelta(days=2), user=self.students[1])
+        self.create_order(now - timedelta(days=60), user=self.students[2])
+        self.create_order(now - timedelta(days=1), status=Order.STATUS_CANCELLED, user=self.students[2])
+
+        # The shop's data version, then one grouped query
+        with self.assertNumQueries(2):
+            segments = ShopAnalyticsService(self.shop).get_customer_segments()
+        self.assertEqual(segments["total_customers"], 3)
+        by_name = {segment["name"]: segment for segment in segments["segments"]}
+        self.assertEqual(by_name["Champions"]["top_customers"], ["student0@example.com"])
+        self.assertEqual(by_name["New"]["customers"], 1)
+        self.assertEqual(by_name["One-timers"]["avg_days_since"], 60)
+
+        with self.assertNumQueries(1):
+            ShopAnalyticsService(self.shop).get_customer_segments()
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("shops:analytics_panel", args=["customers"]))
+        self.assertEqual(response.json()["charts"]["customerSegmentChart"]["counts"][0], 1)
+        response = self.client.get(reverse("shops:analytics_customers_csv"))
+        rows = response.content.decode().splitlines()
+        self.assertEqual(rows[0].split(",")[:2], ["customer", "last_order"])
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(rows[1].startswith("student0@example.com,"))
+
+    def test_customers_csv_quotes_usernames_a_spreadsheet_would_run_as_formulas(self):
+        customer = User.objects.create_user(username='=HYPERLINK("http://example.com/")', password="password123")
+        self.create_order(timezone.now() - timedelta(days=1), user=customer)
+
+        self.client.force_login(self.owner)
+        rows = self.client.get(reverse("shops:analytics_customers_csv")).content.decode().splitlines()
+        self.assertTrue(rows[1].startswith('"\'=HYPERLINK(""http://example.com/"")",'))
+
+
+class AnomalyDetectionTests(AnalyticsTestCase):
+    def test_scores_compare_each_position_with_earlier_cycles(self):
+        series = np.array([[[10, 0], [12, 0], [10, 0], [11, 1]]], dtype=float)
+        series[0, -1, 0] = 1
+
+        expected, scores = robust_scores(series, alpha=0.5)
+
+        # Weights 1/7, 2/7, 4/7 for the earlier cycles, oldest first
+        self.assertAlmostEqual(expected[0, 0], (10 + 24 + 40) / 7)
+        self.assertLess(scores[0, 0], -3.5)
+        # A single order where there usually are none stays under the spread floor
+        self.assertEqual(scores[0, 1], 1.0)
+
+    def test_batch_stores_drops_and_notifies_the_owner_once(self):
+        now = timezone.make_aware(datetime.combine(timezone.localdate(), time(15, 30)))
+        hour_end = now.replace(minute=0)
+        ShopHourRollup.objects.bulk_create([
+            ShopHourRollup(
+                shop=self.shop,
+                hour_start=hour_end - timedelta(days=days, hours=3),
+                total_orders=8 if days else 0,
+                collected_orders=8 if days else 0,
+            )
+            for days in range(28)
+        ])
+        today = timezone.localdate(now)
+        ShopDayRollup.objects.bulk_create([
+            ShopDayRollup(
+                shop=self.shop,
+                date=today - timedelta(days=days),
+                total_orders=40,
+                collected_orders=40,
+                revenue=Decimal("2000.00") if days != 2 else Decimal("100.00"),
+            )
+            for days in range(1, 57)
+        ])
+
+        # Shops, both series and the known anomalies, then two inserts, inside a savepoint
+        with self.assertNumQueries(8):
+            anomalies = detect_anomalies(now=now)
+
+        found = {(anomaly.granularity, anomaly.metric): anomaly for anomaly in anomalies}
+        self.assertEqual(set(found), {("hour", "orders"), ("day", "revenue")})
+        self.assertEqual(found[("hour", "orders")].period_start, hour_end - timedelta(hours=3))
+        self.assertEqual(found[("day", "revenue")].expected, 2000.0)
+        self.assertTrue(found[("day", "revenue")].is_drop)
+
+        notification = Notification.objects.get(user=self.owner)
+        self.assertEqual(notification.notification_type, Notification.NOTIFICATION_SALES_ANOMALY)
+        self.assertIn("Revenue dropped to ₹100 (usually about ₹2000)", notification.message)
+
+        # Overlapping windows on the next run do not report the same periods again
+        self.assertEqual(detect_anomalies(now=now + timedelta(minutes=45)), [])
+        self.assertEqual(ShopAnomaly.objects.count(), 2)
+        self.assertEqual(Notification.objects.filter(user=self.owner).count(), 1)
+
+
+class AnalyticsSnapshotTests(AnalyticsTestCase):
+    @override_settings(ANALYTICS_SNAPSHOT_MAX_AGE=3 * 24 * 60 * 60)
+    def test_unfiltered_dashboard_is_served_from_the_snapshot(self):
+        self.create_order(timezone.now() - timedelta(days=3))
+        self.create_order(timezone.now() - timedelta(hours=1))
+        # Computed as of the day before the second order, so only the live panels count it
+        self.assertEqual(precompute_snapshots(workers=1, now=timezone.now() - timedelta(days=2)), (1, []))
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("shops:analytics"))
+        self.assertContains(response, "Computed at")
+
+        url = reverse("shops:analytics_panel", args=["summary"])
+        for panel in PANELS:
+            payload = self.client.get(reverse("shops:analytics_panel", args=[panel])).json()
+            self.assertEqual(payload["unavailable"], [])
+            self.assertIsNotNone(payload["computed_at"])
+        # Only the request's own queries plus loading the snapshot
+        with CaptureQueriesContext(connection) as queries:
+            snapshot_counts = self.client.get(url).json()["charts"]["orderStatusChart"]["counts"]
+        tables = " ".join(query["sql"] for query in queries.captured_queries)
+        self.assertIn("shops_analyticssnapshot", tables)
+        self.assertNotIn("orders_order", tables)
+        self.assertNotIn("rollup", tables)
+        live = self.client.get(url, {"live": 1}).json()
+
+        self.assertEqual(snapshot_counts[3], 1)
+        self.assertEqual(live["charts"]["orderStatusChart"]["counts"][3], 2)
+        self.assertIsNone(live["computed_at"])
+
+    def test_results_are_only_loaded_to_render_a_panel(self):
+        self.create_order(timezone.now() - timedelta(days=1))
+        snapshot = compute_snapshot(self.shop)
+        stored = json.dumps(snapshot.results)
+        self.assertNotIn("get_customer_rfm", stored)
+        self.assertIn("get_customer_segments", stored)
+        self.client.force_login(self.owner)
+        url = reverse("shops:analytics_panel", args=["customers"])
+
+        def loads_results(*args, **kwargs):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(*args, **kwargs)
+            return response, any('."results"' in query["sql"] for query in queries.captured_queries)
+
+        response, loaded = loads_results(reverse("shops:analytics"))
+        self.assertContains(response, "Computed at")
+        self.assertFalse(loaded)
+        response, loaded = loads_results(url)
+        self.assertEqual(response.json()["unavailable"], [])
+        self.assertTrue(loaded)
+        response, loaded = loads_results(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(loaded)
+
+    # Forked workers read the in-memory test database through the inherited connection
+    @skipUnless(multiprocessing.get_start_method() == "fork", "needs forked worker processes")
+    def test_worker_processes_compute_and_the_parent_stores(self):
+        second_shop = Shop.objects.create(
+            name="Library Kiosk", owner=self.students[0], opening_time=time(0, 0), closing_time=time(23, 59)
+        )
+        self.create_order(timezone.now() - timedelta(days=1))
+
+        self.assertEqual(precompute_snapshots(workers=2), (2, []))
+
+        self.assertEqual(
+            set(AnalyticsSnapshot.objects.values_list("shop_id", flat=True)), {self.shop.id, second_shop.id}
+        )
+        snapshot = get_fresh_snapshot(self.shop)
+        self.assertIsNotNone(snapshot)
+        restored = snapshot_service(self.shop, snapshot)
+        with self.assertNumQueries(0):
+            daily = restored.get_daily_report(30)
+        self.assertEqual(sum(day["total_orders"] for day in daily["daily_data"]), 1)
+
+    def test_snapshot_results_round_trip_through_json(self):
+        self.create_order(timezone.now() - timedelta(days=1))
+        snapshot = compute_snapshot(self.shop)
+        snapshot.refresh_from_db()
+
+        live = get_analytics_service(self.shop, now=snapshot.computed_at, use_cache=False)
+        restored = snapshot_service(self.shop, snapshot)
+        end_day = timezone.localdate(snapshot.computed_at)
+        start_day = end_day - timedelta(days=30)
+        with self.assertNumQueries(0):
+            stats = restored.get_summary_stats(start_day, end_day)
+            daily = restored.get_daily_report(30)
+        self.assertEqual(stats, live.get_summary_stats(start_day, end_day))
+        self.assertEqual(daily, live.get_daily_report(30))
+        self.assertIsInstance(stats["total_revenue"], Decimal)
+        self.assertIsInstance(daily["daily_data"][0]["date"], type(end_day))
+
+    def test_snapshot_freshness_does_not_depend_on_the_cache(self):
+        self.create_order(timezone.now() - timedelta(days=1))
+        compute_snapshot(self.shop)
+        # A web process with its own cache has never seen the command's version
+        cache.clear()
+        self.assertIsNotNone(get_fresh_snapshot(self.shop))
+
+        self.client.force_login(self.owner)
+        self.assertContains(self.client.get(reverse("shops:analytics")), "Computed at")
+
+    def test_snapshot_is_dropped_once_the_shop_data_changes(self):
+        self.create_order(timezone.now() - timedelta(days=1))
+        compute_snapshot(self.shop)
+        self.assertIsNotNone(get_fresh_snapshot(self.shop))
+
+        self.create_order(timezone.now() - timedelta(hours=1))
+        self.assertIsNone(get_fresh_snapshot(self.shop))
+        self.client.force_login(self.owner)
+        self.assertNotContains(self.client.get(reverse("shops:analytics")), "Computed at")
+
+
+class CampusAnalyticsTests(AnalyticsTestCase):
+    def test_report_uses_grouped_queries_for_any_number_of_shops(self):
+        now = timezone.now()
+        self.create_order(now - timedelta(days=1))
+        self.create_order(now - timedelta(days=2), total="30.00")
+        other_owner = User.objects.create_user(username="other@example.com", password="password123")
+        for name in ("Juice Bar", "Tea Stall"):
+            shop = Shop.objects.create(name=name, owner=other_owner, opening_time=time(8, 0), closing_time=time(20, 0))
+        order = Order.objects.create(user=self.students[1], shop=shop, pickup_time=now, status=Order.STATUS_COLLECTED, total_price=Decimal("20.00"))
+        record_order_placed(order)
+
+        # Rankings, totals, daily series and heatmap
+        with self.assertNumQueries(4):
+            report = build_campus_report(30, now)
+
+        self.assertEqual(report["totals"]["total_orders"], 3)
+        self.assertEqual(report["totals"]["revenue"], Decimal("100.00"))
+        self.assertEqual(report["active_shops"], 2)
+        self.assertEqual([shop["name"] for shop in report["busiest_shops"]], ["Campus Cafe", "Tea Stall", "Juice Bar"])
+        ranks = {shop["name"]: shop["revenue_percentile"] for shop in report["shops"]}
+        self.assertEqual(ranks, {"Campus Cafe": 100, "Tea Stall": 50, "Juice Bar": 0})
+
+        get_campus_report(30, now)
+        with self.assertNumQueries(0):
+            get_campus_report(30, now)
+
+    def test_page_is_limited_to_staff(self):
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(reverse("shops:campus_analytics")).status_code, 302)
+
+        self.owner.is_staff = True
+        self.owner.save()
+        response = self.client.get(reverse("shops:campus_analytics"), {"period": 7})
+        self.assertContains(response, "Shop Rankings")
+
+
+class SketchTests(SimpleTestCase):
+    def test_quantile_sketch_stays_within_its_relative_accuracy(self):
+        values = np.random.default_rng(1).lognormal(4, 1, 20000)
+        sketch = QuantileSketch()
+        sketch.add(values[:5000])
+        sketch.add(values[5000:])
+
+        self.assertEqual(sketch.count, 20000)
+        for q in (0.5, 0.9, 0.99):
+            exact = np.quantile(values, q, method="lower")
+            self.assertAlmostEqual(sketch.quantile(q) / exact, 1, delta=0.011)
+
+
+class OrderValueStatsTests(AnalyticsTestCase):
+    def setUp(self):
+        super().setUp()
+        now = timezone.now()
+        for index, total in enumerate(("40.00", "60.00", "80.00", "120.00")):
+            self.create_order(now - timedelta(hours=index + 1), total=total, user=self.students[index % 3])
+        self.days = (timezone.localdate() - timedelta(days=1), timezone.localdate())
+
+    def test_small_ranges_are_exact(self):
+        stats = ShopAnalyticsService(self.shop).get_order_value_stats(*self.days)
+
+        self.assertFalse(stats["approximate"])
+        self.assertEqual(stats["average_order_value"]["value"], 75.0)
+        self.assertEqual(stats["percentiles"][0]["value"], 70.0)
+        self.assertEqual(stats["customers"]["value"], 3)
+
+    @override_settings(ANALYTICS_APPROXIMATE_ROWS=2, ANALYTICS_SAMPLE_ROWS=2)
+    def test_large_ranges_are_sampled_with_confidence_intervals(self):
+        # Estimated row count from the rollups, then one streamed sample
+        with self.assertNumQueries(2):
+            stats = ShopAnalyticsService(self.shop, use_cache=False).get_order_value_stats(*self.days)
+
+        self.assertTrue(stats["approximate"])
+        self.assertEqual(stats["sample_rate"], 0.5)
+        for estimate in [stats["average_order_value"], stats["customers"], *stats["percentiles"]]:
+            self.assertLessEqual(estimate["low"], estimate["value"])
+            self.assertLessEqual(estimate["value"], estimate["high"])
+
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("shops:analytics_panel", args=["order-values"]))
+        self.assertIn("95% confidence intervals", response.json()["html"])
+
+    @override_settings(ANALYTICS_APPROXIMATE_ROWS=2, ANALYTICS_SAMPLE_ROWS=20)
+    def test_sample_uses_stored_customer_buckets_and_clustered_intervals(self):
+        # Every customer always orders the same amount: 34 orders but only 3 independent units
+        now = timezone.now()
+        for index in range(30):
+            student = self.students[index % 3]
+            self.create_order(now - timedelta(minutes=index + 1), total=("40.00", "80.00", "120.00")[index % 3], user=student)
+
+        with CaptureQueriesContext(connection) as queries:
+            stats = ShopAnalyticsService(self.shop).get_order_value_stats(*self.days)
+
+        sample_sql = queries[-1]["sql"]
+        self.assertIn('"customer_bucket" <', sample_sql)
+        self.assertNotIn("MOD", sample_sql.upper())
+        self.assertEqual(stats["sampled_customers"], 3)
+        values = Order.objects.filter(shop=self.shop).values_list("total_price", flat=True)
+        values = np.array([float(value) for value in values])
+        independent_margin = 1.96 * values.std(ddof=1) / np.sqrt(len(values)) * np.sqrt(1 - stats["sample_rate"])
+        average = stats["average_order_value"]
+        self.assertGreater(average["high"] - average["value"], independent_margin)
@@ -2,6 +2,9 @@ from django.urls import path
 
 from .views import (
     analytics_dashboard,
+    analytics_customers_csv,
+    analytics_panel,
+    campus_analytics,
     owner_dashboard, 
     shop_detail, 
     shop_list,
@@ -25,6 +28,9 @@ urlpatterns = [
     path("shops/<int:shop_id>/", shop_detail, name="detail"),
     path("owner/dashboard/", owner_dashboard, name="owner_dashboard"),
     path("owner/analytics/", analytics_dashboard, name="analytics"),
+    path("owner/analytics/panels/<slug:panel>/", analytics_panel, name="analytics_panel"),
+    path("owner/analytics/customers.csv", analytics_customers_csv, name="analytics_customers_csv"),
+    path("staff/analytics/", campus_analytics, name="campus_analytics"),
     
     # Menu management
     path("owner/menu/", manage_menu, name="manage_menu"),
@@ -1,16 +1,25 @@
-from datetime import date, timedelta
+import csv
+from datetime import date
 from django.contrib import messages
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q, Count, Sum, Avg
+from django.db.models import Q
+from django.http import Http404, HttpResponse, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control
 from django.utils import timezone
 
 from accounts.decorators import shop_owner_required
 from menu.models import MenuItem, Category
 from menu.forms import MenuItemForm, CategoryForm
-from orders.models import Order, Feedback
+from menu.utils import bump_menu_version
+from orders.cart import CART_SHOP_KEY, get_cart, get_cart_summary
+from orders.models import Order
 
+from .analytics_cache import bump_data_version_on_commit
 from .models import Shop
+from .recommendations import recommended_items
 from .forms import ShopForm
 
 
@@ -42,13 +51,15 @@ def shop_detail(request, shop_id):
         items = items.filter(category_id=selected_category)
     
     # Get cart items count
-    cart = request.session.get("cart_items", {})
-    cart_items_count = 0
-    for quantity in cart.values():
-        try:
-            cart_items_count += int(quantity)
-        except (TypeError, ValueError):
-            continue
+    cart = get_cart(request.session)
+    summary = get_cart_summary(request.session)
+    cart_items_count = summary["count"] if summary else 0
+
+    # Pair suggestions with the cart when it holds items from this shop
+    cart_item_ids = []
+    if str(request.session.get(CART_SHOP_KEY)) == str(shop.id):
+        cart_item_ids = [int(item_id) for item_id in cart if str(item_id).isdigit()]
+    recommendations = recommended_items(shop, cart_item_ids)
     
     return render(request, "shops/shop_detail.html", {
         "shop": shop,
@@ -56,6 +67,8 @@ def shop_detail(request, shop_id):
         "cart_items_count": cart_items_count,
         "categories": categories,
         "selected_category": selected_category,
+        "recommendations": recommendations,
+        "recommendations_title": "Goes well with your cart" if cart_item_ids else "Popular combos",
     })
 
 
@@ -111,6 +124,8 @@ def add_menu_item(request):
             item = form.save(commit=False)
             item.shop = shop
             item.save()
+            bump_menu_version(shop.id)
+            bump_data_version_on_commit(shop.id)
             messages.success(request, f"Menu item '{item.name}' added successfully!")
             return redirect("shops:manage_menu")
     else:
@@ -130,6 +145,8 @@ def edit_menu_item(request, item_id):
         form = MenuItemForm(request.POST, request.FILES, instance=item, shop=shop)
         if form.is_valid():
             form.save()
+            bump_menu_version(shop.id)
+            bump_data_version_on_commit(shop.id)
             messages.success(request, f"Menu item '{item.name}' updated successfully!")
             return redirect("shops:manage_menu")
     else:
@@ -148,6 +165,8 @@ def delete_menu_item(request, item_id):
     if request.method == "POST":
         item_name = item.name
         item.delete()
+        bump_menu_version(shop.id)
+        bump_data_version_on_commit(shop.id)
         messages.success(request, f"Menu item '{item_name}' deleted successfully!")
         return redirect("shops:manage_menu")
     
@@ -163,6 +182,8 @@ def toggle_item_availability(request, item_id):
     
     item.is_available = not item.is_available
     item.save()
+    bump_menu_version(shop.id)
+    bump_data_version_on_commit(shop.id)
     
     status = "available" if item.is_available else "out of stock"
     messages.success(request, f"'{item.name}' is now marked as {status}!")
@@ -202,6 +223,7 @@ def edit_category(request, category_id):
         form = CategoryForm(request.POST, instance=category)
         if form.is_valid():
             form.save()
+            bump_data_version_on_commit(shop.id)
             messages.success(request, f"Category '{category.name}' updated successfully!")
             return redirect("shops:manage_menu")
     else:
@@ -220,6 +242,7 @@ def delete_category(request, category_id):
     if request.method == "POST":
         category_name = category.name
         category.delete()
+        bump_data_version_on_commit(shop.id)
         messages.success(request, f"Category '{category_name}' deleted successfully!")
         return redirect("shops:manage_menu")
     
@@ -250,146 +273,118 @@ def edit_shop_settings(request):
 @shop_owner_required
 def analytics_dashboard(request):
     """Sales analytics and performance dashboard for shop owners with ML insights"""
-    from .analytics_service import ShopAnalyticsService
-    from datetime import datetime
+    from .analytics_panels import PANELS, get_analytics_params
+    from .analytics_snapshots import get_fresh_snapshot
     
     shop = get_object_or_404(Shop, owner=request.user)
-    analytics = ShopAnalyticsService(shop)
-    
-    # Date range filter - support both period and custom dates
-    period = request.GET.get('period', '30')  # Default 30 days
-    report_type = request.GET.get('report', 'daily')  # daily, weekly, monthly, hourly
-    start_date_str = request.GET.get('start_date')
-    end_date_str = request.GET.get('end_date')
-    
-    # Determine date range
-    end_date = timezone.now()
-    
-    if start_date_str and end_date_str:
-        # Use custom date range
-        try:
-            start_date = timezone.make_aware(datetime.strptime(start_date_str, '%Y-%m-%d'))
-            end_date = timezone.make_aware(datetime.strptime(end_date_str, '%Y-%m-%d')).replace(hour=23, minute=59, second=59)
-            days = (end_date - start_date).days + 1
-        except ValueError:
-            # Fall back to period if date parsing fails
-            try:
-                days = int(period)
-            except ValueError:
-                days = 30
-            start_date = timezone.now() - timedelta(days=days)
-    else:
-        # Use period
-        try:
-            days = int(period)
-        except ValueError:
-            days = 30
-        start_date = timezone.now() - timedelta(days=days)
-    
-    # Calculate previous period for growth comparison
-    period_length = (end_date - start_date).days + 1
-    previous_start = start_date - timedelta(days=period_length)
-    previous_end = start_date
-    
-    # Current period orders
-    orders_in_period = Order.objects.filter(shop=shop, created_at__gte=start_date, created_at__lte=end_date)
-    
-    # Previous period orders
-    previous_orders = Order.objects.filter(shop=shop, created_at__gte=previous_start, created_at__lt=previous_end)
-    
-    period_stats = {
-        'total_orders': orders_in_period.count(),
-        'pending': orders_in_period.filter(status=Order.STATUS_PENDING).count(),
-        'preparing': orders_in_period.filter(status=Order.STATUS_PREPARING).count(),
-        'ready': orders_in_period.filter(status=Order.STATUS_READY).count(),
-        'collected': orders_in_period.filter(status=Order.STATUS_COLLECTED).count(),
-        'cancelled': orders_in_period.filter(status=Order.STATUS_CANCELLED).count(),
-    }
-    
-    # Revenue statistics (current period)
-    completed_orders = orders_in_period.filter(status=Order.STATUS_COLLECTED)
-    total_revenue = completed_orders.aggregate(total=Sum('total_price'))['total'] or 0
-    avg_order_value = completed_orders.aggregate(avg=Avg('total_price'))['avg'] or 0
     
-    # Previous period revenue for growth calculation
-    previous_completed = previous_orders.filter(status=Order.STATUS_COLLECTED)
-    previous_revenue = previous_completed.aggregate(total=Sum('total_price'))['total'] or 0
+    # The unfiltered dashboard is served from the precomputed snapshot while it is current
+    snapshot = None if request.GET else get_fresh_snapshot(shop)
     
-    # Calculate revenue growth percentage
-    if previous_revenue > 0:
-        revenue_growth = ((total_revenue - previous_revenue) / previous_revenue) * 100
-    else:
-        revenue_growth = 100 if total_revenue > 0 else 0
-    
-    # All-time revenue
-    all_time_revenue = Order.objects.filter(
-        shop=shop, 
-        status=Order.STATUS_COLLECTED
-    ).aggregate(total=Sum('total_price'))['total'] or 0
-    
-    # Feedback statistics
-    feedbacks = Feedback.objects.filter(shop=shop, created_at__gte=start_date, created_at__lte=end_date)
-    avg_rating = feedbacks.aggregate(avg=Avg('rating'))['avg'] or 0
-    total_feedbacks = feedbacks.count()
-    
-    # Rating distribution
-    rating_distribution = {
-        '5': feedbacks.filter(rating=5).count(),
-        '4': feedbacks.filter(rating=4).count(),
-        '3': feedbacks.filter(rating=3).count(),
-        '2': feedbacks.filter(rating=2).count(),
-        '1': feedbacks.filter(rating=1).count(),
+    # Only the filter shell is rendered here; every panel loads from analytics_panel
+    context = {
+        'shop': shop,
+        **get_analytics_params(request, now=snapshot.computed_at if snapshot else None),
+        'panels': list(PANELS),
+        'snapshot': snapshot,
     }
     
-    # === Advanced Analytics Features (using actual days) ===
-    
-    # Most and least ordered items
-    most_ordered = analytics.get_most_ordered_items(days, limit=10)
-    least_sold = analytics.get_least_sold_items(days, limit=10)
-    
-    # Payment method analysis
-    payment_analysis = analytics.get_payment_method_analysis(days)
+    return render(request, "shops/analytics.html", context)
+
+
+@login_required
+@shop_owner_required
+def analytics_panel(request, panel):
+    """Rendered markup and chart series for one analytics dashboard panel"""
+    from .analytics_executor import run_panels
+    from .analytics_panels import PANELS, get_analytics_params, panel_etag
+    from .analytics_service import get_analytics_service
+    from .analytics_snapshots import get_fresh_snapshot, snapshot_service
     
-    # Peak hours analysis
-    peak_hours = analytics.get_peak_hours_analysis(days)
+    if panel not in PANELS:
+        raise Http404("Unknown analytics panel")
     
-    # Get appropriate report based on type
-    if report_type == 'hourly':
-        time_report = analytics.get_hourly_report(24)
-    elif report_type == 'weekly':
-        time_report = analytics.get_weekly_report(4)
-    elif report_type == 'monthly':
-        time_report = analytics.get_monthly_report(12)
-    else:  # daily
-        time_report = analytics.get_daily_report(min(days, 90))
+    shop = get_object_or_404(Shop, owner=request.user)
+    snapshot = None if request.GET else get_fresh_snapshot(shop)
+    if snapshot:
+        analytics = get_analytics_service(shop, now=snapshot.computed_at)
+        params = get_analytics_params(request, now=snapshot.computed_at)
+    else:
+        analytics = get_analytics_service(shop)
+        params = get_analytics_params(request)
+    
+    # Unchanged data and filters: let the browser reuse its copy
+    etag = panel_etag(analytics, panel, params, snapshot)
+    not_modified = get_conditional_response(request, etag=etag)
+    if not_modified is not None:
+        not_modified['ETag'] = etag
+        return not_modified
+    if snapshot:
+        # The stored results are only loaded once the browser's copy is stale
+        analytics = snapshot_service(shop, snapshot)
+    
+    template_name, build_panels, build_charts = PANELS[panel]
+    results, unavailable = run_panels(build_panels(analytics, params))
+    context = {'shop': shop, **params, **results}
+    
+    response = JsonResponse({
+        'panel': panel,
+        'html': render_to_string(template_name, context, request=request),
+        'charts': build_charts(context),
+        'unavailable': unavailable,
+        'computed_at': snapshot.computed_at if snapshot else None,
+    })
+    if not unavailable:
+        # A degraded panel must be fetched again rather than revalidated
+        response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+@login_required
+@shop_owner_required
+def analytics_customers_csv(request):
+    """Every customer's RFM scores and segment as a CSV download"""
+    from orders.exports import csv_safe
+    from .analytics_service import get_analytics_service
+    from .segmentation import CSV_COLUMNS
     
-    # ML-based insights and recommendations
-    ml_insights = analytics.get_ml_insights(days)
+    shop = get_object_or_404(Shop, owner=request.user)
+    customers = get_analytics_service(shop).get_customer_rfm()
     
-    context = {
-        'shop': shop,
-        'period': days,
-        'report_type': report_type,
-        'start_date': start_date,
-        'end_date': end_date,
-        'total_orders': orders_in_period.count(),
-        'period_stats': period_stats,
-        'total_revenue': total_revenue,
-        'avg_order_value': avg_order_value,
-        'all_time_revenue': all_time_revenue,
-        'avg_rating': avg_rating,
-        'total_feedbacks': total_feedbacks,
-        'rating_distribution': rating_distribution,
-        'revenue_growth': revenue_growth,
-        
-        # Advanced analytics
-        'most_ordered': most_ordered,
-        'least_sold': least_sold,
-        'payment_analysis': payment_analysis,
-        'peak_hours': peak_hours,
-        'time_report': time_report,
-        'ml_insights': ml_insights,
+    response = HttpResponse(content_type="text/csv")
+    response["Content-Disposition"] = (
+        f'attachment; filename="customers-{shop.id}-{timezone.localdate():%Y%m%d}.csv"'
+    )
+    writer = csv.DictWriter(response, fieldnames=CSV_COLUMNS)
+    writer.writeheader()
+    for customer in customers:
+        customer = dict(customer, last_order=timezone.localtime(customer["last_order"]).isoformat())
+        writer.writerow({column: csv_safe(value) for column, value in customer.items()})
+    return response
+
+
+@staff_member_required
+def campus_analytics(request):
+    """Campus-wide orders, revenue, shop rankings and busy hours across every shop"""
+    from .campus_analytics import PERIOD_CHOICES, get_campus_report
+    
+    try:
+        period = int(request.GET.get('period', 30))
+    except ValueError:
+        period = 30
+    if period not in PERIOD_CHOICES:
+        period = 30
+    
+    report = get_campus_report(period)
+    chart_data = {
+        'labels': [day['date_label'] for day in report['daily']],
+        'orders': [day['orders'] for day in report['daily']],
+        'revenue': [float(day['revenue']) for day in report['daily']],
     }
-    
-    return render(request, "shops/analytics.html", context)
-
+    return render(request, "shops/campus_analytics.html", {
+        'report': report,
+        'period': period,
+        'period_choices': PERIOD_CHOICES,
+        'chart_data': chart_data,
+    })